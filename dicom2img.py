@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# file: dicom2img.py
+# vim:fileencoding=utf-8:fdm=marker:ft=python
+#
+# Copyright © 2012-2026 R.F. Smith <rsmith@xs4all.nl>.
+# SPDX-License-Identifier: MIT
+# Created: 2012-04-11T19:21:19+02:00
+# Last modified: 2026-10-17T21:55:40+0200
+"""
+Convert DICOM files from an X-ray machine to PNG, JPEG and/or TIFF format.
+
+During the conversion process, blank areas are removed. The blank area removal
+is based on the image size of a Philips flat detector. The image goes from
+2048x2048 pixels to 1574x2048 pixels.
+"""
+
+from datetime import datetime
+from functools import partial
+import argparse
+import concurrent.futures as cf
+import io
+import logging
+import os
+import struct
+import subprocess as sp
+import sys
+
+from PIL import Image
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on ms-windows.
+    resource = None
+
+__version__ = "2026.10.17"
+# Blank area removal for the Philips flat detector; (left, top, width, height).
+crop = (232, 0, 1574, 2048)
+# Uncompressed little-endian transfer syntaxes, and if they have explicit VR.
+littleendian = {"1.2.840.10008.1.2": False, "1.2.840.10008.1.2.1": True}
+# Transfer syntaxes in which the data set cannot be read as little-endian.
+unreadable = ("1.2.840.10008.1.2.2", "1.2.840.10008.1.2.1.99")
+# Pillow format and extension of the output formats.
+outformats = {
+    "png": ("PNG", ".png"),
+    "jpg": ("JPEG", ".jpg"),
+    "tiff": ("TIFF", ".tiff"),
+}
+# Value representations with a 4-byte length.
+longvrs = (b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"UC", b"UN", b"UR", b"UT")
+
+
+def main():
+    """
+    Entry point for dicom2img.
+    """
+    args = setup()
+    if not args.fn:
+        logging.error("no files to process")
+        sys.exit(1)
+    if args.quality != 80:
+        logging.info(f"quality set to {args.quality}")
+    if args.level:
+        logging.info("applying level correction.")
+    logging.info(f"writing {', '.join(args.formats)} files.")
+    convert_partial = partial(
+        convert, formats=args.formats, quality=args.quality, level=args.level
+    )
+    starttime = str(datetime.now())[:-7]
+    logging.info(f"started at {starttime}.")
+    files, costs = [], []
+    for fn in args.fn:
+        # DICOMDIR files and structured reports have no pixel data.
+        header = dicomheader(fn)
+        if header and header[2] is None and header[1] not in unreadable:
+            logging.info(f"{fn} is not an image, skipped.")
+            continue
+        files.append(fn)
+        costs.append(footprint(fn, header))
+    workers = os.cpu_count()
+    with cf.ProcessPoolExecutor(max_workers=workers) as tp:
+        budget = args.memory * 2**20
+        for _, (infn, outfns, rv) in admit(
+            tp, workers, convert_partial, files, costs, budget
+        ):
+            outfn = ", ".join(outfns)
+            logging.info(f"finished conversion of {infn} to {outfn} (returned {rv})")
+    if resource:
+        logging.info(f"peak resident memory {peakrss()} MiB in one process.")
+    endtime = str(datetime.now())[:-7]
+    logging.info(f"completed at {endtime}.")
+
+
+def setup():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--log",
+        default="warning",
+        choices=["debug", "info", "warning", "error"],
+        help="logging level (defaults to 'warning')",
+    )
+    parser.add_argument("-v", "--version", action="version", version=__version__)
+    parser.add_argument(
+        "-l",
+        "--level",
+        action="store_true",
+        default=False,
+        help="Correct color levels (default: no)",
+    )
+    parser.add_argument(
+        "-f",
+        "--formats",
+        default="png",
+        help="comma-separated list of output formats; "
+        "png, jpg and/or tiff (default: png)",
+    )
+    parser.add_argument(
+        "-q",
+        "--quality",
+        type=int,
+        default=80,
+        help="PNG and JPEG quality level (default: 80)",
+    )
+    parser.add_argument(
+        "-m",
+        "--memory",
+        type=int,
+        default=physmem() * 3 // 4,
+        help="memory in MiB for converting images at the same time "
+        "(default 3/4 of physical memory, 0 for no limit)",
+    )
+    parser.add_argument(
+        "fn", nargs="*", metavar="filename", help="DICOM files to process"
+    )
+    args = parser.parse_args(sys.argv[1:])
+    logging.basicConfig(
+        level=getattr(logging, args.log.upper(), None),
+        format="%(levelname)s: %(message)s",
+    )
+    logging.debug(f"command line arguments = {sys.argv}")
+    logging.debug(f"parsed arguments = {args}")
+    args.formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in args.formats if f not in outformats]
+    if unknown or not args.formats:
+        parser.error(f"unknown output format(s): {', '.join(unknown) or 'none'}")
+    # Check for requisites. The convert program is only needed for files that
+    # cannot be converted natively.
+    try:
+        sp.run(["convert"], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        logging.info("found “convert”")
+    except FileNotFoundError:
+        logging.warning("the program “convert” cannot be found")
+    return args
+
+
+def physmem():
+    """Return the amount of physical memory in MiB, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def peakrss():
+    """
+    Return the largest peak resident set size in MiB of this process and its
+    finished child processes.
+    """
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return rss // 1024  # ru_maxrss is in KiB.
+
+
+def admit(pool, workers, func, jobs, costs, budget):
+    """
+    Run jobs in a pool within a memory budget.
+
+    A job is only submitted when its estimated memory use fits in what the
+    running jobs leave of the budget. Smaller jobs further down the list can go
+    ahead of a large job that does not fit yet. A job that is larger than the
+    whole budget is run on its own.
+
+    Arguments:
+        pool: concurrent.futures.Executor to run the jobs in.
+        workers: maximum number of jobs to run at the same time.
+        func: function to call with every job.
+        jobs: list of the arguments for func.
+        costs: list of the estimated memory use of every job, in bytes.
+        budget: memory budget in bytes. If 0, there is no limit.
+
+    Yields:
+        (job, result) tuples as the jobs finish.
+    """
+    pending = list(zip(jobs, costs))
+    running = {}
+    used = peak = 0
+    while pending or running:
+        for item in list(pending):
+            if len(running) >= workers:
+                break
+            job, cost = item
+            if running and budget and used + cost > budget:
+                continue
+            pending.remove(item)
+            running[pool.submit(func, job)] = item
+            used += cost
+        peak = max(peak, used)
+        done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+        for fut in done:
+            job, cost = running.pop(fut)
+            used -= cost
+            yield job, fut.result()
+    logging.info(f"estimated peak memory use {peak // 2**20} MiB.")
+
+
+def footprint(fname, header):
+    """
+    Estimate the memory needed to convert a DICOM file, from the dimensions of
+    the image. A native conversion makes a 16-bit and an 8-bit copy of the
+    pixels. ImageMagick uses 8 bytes per pixel, and needs room for a second
+    copy when cropping.
+
+    Arguments:
+        fname: name of the DICOM file.
+        header: the result of dicomheader for the file.
+
+    Returns:
+        The estimated memory use in bytes.
+    """
+    if header is None or (0x0028, 0x0010) not in header[0]:
+        # Assume uncompressed 16-bit pixel data.
+        try:
+            return 8 * os.path.getsize(fname)
+        except OSError:
+            return 0
+    elements, syntax, pixels = header
+    pixelcount = ushort(elements, (0x0028, 0x0010)) * ushort(elements, (0x0028, 0x0011))
+    if syntax in littleendian and pixels is not None:
+        return 4 * pixelcount
+    return 16 * pixelcount * max(int(decimal(elements, (0x0028, 0x0008), 1)), 1)
+
+
+def dicomheader(fname):
+    """
+    Read the data elements of a DICOM file up to the pixel data.
+
+    Little-endian files with explicit and implicit VR are supported. Sequences
+    and values longer than 1 KiB are skipped.
+
+    Arguments:
+        fname: name of the DICOM file.
+
+    Returns:
+        A 3-tuple of a dictionary mapping (group, element) tuples to the raw
+        values, the transfer syntax UID and an (offset, length) tuple of the
+        pixel data (None if there is none). The length is None if the pixel
+        data is encapsulated (compressed). None if the file is not a DICOM
+        file, cannot be read or ends in the middle of a data element.
+    """
+    elements, syntax, pixels = {}, "", None
+    try:
+        with open(fname, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(128)
+            if f.read(4) != b"DICM":
+                return None
+            explicit = True
+            while f.tell() < size:
+                group, elem, length = elementheader(f, explicit)
+                if group != 0x0002 and syntax in unreadable:
+                    break
+                if (group, elem) == (0x7FE0, 0x0010):  # PixelData
+                    pixels = (f.tell(), None if length == 0xFFFFFFFF else length)
+                    break
+                if length == 0xFFFFFFFF:
+                    skipitems(f, explicit)
+                elif length > 1024:
+                    f.seek(length, 1)
+                else:
+                    elements[(group, elem)] = value = f.read(length)
+                    if len(value) < length:
+                        return None
+                    if (group, elem) == (0x0002, 0x0010):  # TransferSyntaxUID
+                        syntax = text(elements, (group, elem))
+                        explicit = littleendian.get(syntax, True)
+            else:
+                # Only a file that ends after a complete element has no pixel data.
+                if f.tell() > size:
+                    return None
+    except (OSError, struct.error):
+        return None
+    return elements, syntax, pixels
+
+
+def text(elements, tag, default=""):
+    """Return the value of a text element from a DICOM header."""
+    if tag not in elements:
+        return default
+    return elements[tag].rstrip(b"\0 ").decode("ascii", "replace")
+
+
+def ushort(elements, tag, default=0):
+    """Return the value of a US element from a DICOM header."""
+    try:
+        return struct.unpack("<H", elements[tag][:2])[0]
+    except (KeyError, struct.error):
+        return default
+
+
+def decimal(elements, tag, default=0):
+    """Return the (first) value of an IS or DS element from a DICOM header."""
+    try:
+        return float(text(elements, tag).split("\\")[0])
+    except ValueError:
+        return default
+
+
+def elementheader(f, explicit):
+    """
+    Read the header of a little-endian DICOM data element.
+
+    Arguments:
+        f: binary file object, positioned at the start of the element.
+        explicit: the element has an explicit value representation.
+
+    Returns:
+        A (group, element, value length) tuple.
+    """
+    group, elem = struct.unpack("<HH", f.read(4))
+    # Items and delimiters have no VR. The meta group is always explicit.
+    if group == 0xFFFE or (not explicit and group != 0x0002):
+        (length,) = struct.unpack("<L", f.read(4))
+    elif f.read(2) in longvrs:
+        (length,) = struct.unpack("<xxL", f.read(6))
+    else:
+        (length,) = struct.unpack("<H", f.read(2))
+    return group, elem, length
+
+
+def skipitems(f, explicit):
+    """
+    Skip the contents of a sequence or item of undefined length, up to and
+    including its delimiter.
+    """
+    while True:
+        group, elem, length = elementheader(f, explicit)
+        if group == 0xFFFE and elem in (0xE00D, 0xE0DD):
+            return
+        if length == 0xFFFFFFFF:
+            skipitems(f, explicit)
+        else:
+            f.seek(length, 1)
+
+
+def convert(filename, formats, quality, level):
+    """
+    Convert a DICOM file to one or more image files.
+
+    Removing the blank areas from the Philips detector. Uncompressed
+    little-endian files are converted natively; the pixel data is memory-mapped
+    and processed with a lookup table. Other files are handed to convert. Either
+    way the image is processed once, after which all requested formats are
+    encoded concurrently from the same 8-bit buffer.
+
+    Arguments:
+        filename: name of the file to convert.
+        formats: list of output formats; keys of outformats.
+        quality: PNG and JPEG quality to apply
+        level: Boolean to indicate whether level adustment should be done.
+    Returns:
+        Tuple of (input filename, list of output filenames, return value)
+    """
+    outnames = [filename.strip() + outformats[f][1] for f in formats]
+    try:
+        found = readpixels(filename)
+    except (OSError, ValueError):
+        found = None
+    if found is None:
+        logging.debug(f"using convert for {filename}")
+        gray = runconvert(filename, level)
+        if gray is None:
+            return (filename, outnames, 1)
+    else:
+        data, elements, stored = found
+        left, top, width, height = crop
+        image = data[top : top + height, left : left + width]
+        if image.size == 0:
+            image = data
+        image = image & (2**stored - 1)
+        gray = mklut(image, elements, stored, level)[image]
+    with cf.ThreadPoolExecutor(max_workers=len(formats)) as tp:
+        results = tp.map(partial(encode, gray, quality=quality), formats, outnames)
+        rv = int(not all(list(results)))
+    return (filename, outnames, rv)
+
+
+def encode(gray, fmt, outname, quality):
+    """
+    Write an 8-bit gray image to a file.
+
+    Arguments:
+        gray: 2D numpy.ndarray of uint8.
+        fmt: output format; a key of outformats.
+        outname: name of the output file.
+        quality: PNG and JPEG quality to apply
+    Returns:
+        True if the file was written, False otherwise.
+    """
+    # Every encoder gets its own Image, which shares the buffer of gray.
+    img = Image.fromarray(gray)
+    if fmt == "png":
+        options = {"compress_level": min(quality // 10, 9)}
+    elif fmt == "jpg":
+        options = {"quality": quality}
+    else:
+        options = {"compression": "tiff_deflate"}
+    try:
+        img.save(outname, outformats[fmt][0], dpi=(300, 300), **options)
+    except (OSError, ValueError) as e:
+        logging.error(f"cannot write {outname}: {e}")
+        return False
+    return True
+
+
+def readpixels(fname):
+    """
+    Memory-map the pixel data of an uncompressed little-endian DICOM file.
+
+    Arguments:
+        fname: name of the DICOM file.
+
+    Returns:
+        A 3-tuple of a 2D numpy.memmap of the stored values, the dictionary of
+        header elements and the number of bits stored. None if the file cannot
+        be read this way; compressed, multi-frame, color and signed images are
+        left to convert.
+    """
+    header = dicomheader(fname)
+    if header is None:
+        return None
+    elements, syntax, pixels = header
+    if syntax not in littleendian or pixels is None or pixels[1] is None:
+        return None
+    rows = ushort(elements, (0x0028, 0x0010))
+    columns = ushort(elements, (0x0028, 0x0011))
+    allocated = ushort(elements, (0x0028, 0x0100), 16)
+    stored = ushort(elements, (0x0028, 0x0101), allocated)
+    if (
+        ushort(elements, (0x0028, 0x0002), 1) != 1  # SamplesPerPixel
+        or ushort(elements, (0x0028, 0x0103)) != 0  # PixelRepresentation
+        or decimal(elements, (0x0028, 0x0008), 1) != 1  # NumberOfFrames
+        or allocated not in (8, 16)
+        or not 0 < stored <= allocated
+        or rows * columns * allocated // 8 > pixels[1]
+        or rows * columns == 0
+    ):
+        return None
+    dtype = np.uint8 if allocated == 8 else np.dtype("<u2")
+    data = np.memmap(fname, dtype, "r", offset=pixels[0], shape=(rows, columns))
+    return data, elements, stored
+
+
+def mklut(image, elements, stored, level):
+    """
+    Make the lookup table that converts stored pixel values to 8-bit gray.
+
+    The values are windowed with the WindowCenter and WindowWidth from the
+    header if it has them, or else scaled over the range of the stored bits.
+    Then, like ImageMagick's “-auto-gamma”, a gamma correction is applied that
+    maps the mean of the image to 0.5. Optionally the curve of “-level
+    -35%,70%,0.5” is applied last.
+
+    Arguments:
+        image: numpy.ndarray of stored pixel values.
+        elements: dictionary of header elements.
+        stored: number of bits stored per pixel.
+        level: Boolean to indicate whether level adustment should be done.
+
+    Returns:
+        A numpy.ndarray of 2**stored uint8 values.
+    """
+    values = np.arange(2**stored, dtype=np.float64)
+    center = decimal(elements, (0x0028, 0x1050), None)
+    width = decimal(elements, (0x0028, 0x1051), None)
+    if center is not None and width is not None and width >= 1:
+        slope = decimal(elements, (0x0028, 0x1053), 1)
+        values = values * slope + decimal(elements, (0x0028, 0x1052), 0)
+        lut = np.clip((values - center + 0.5) / max(width - 1, 1) + 0.5, 0, 1)
+    else:
+        lut = values / values[-1] if stored > 1 else values
+    if text(elements, (0x0028, 0x0004)) == "MONOCHROME1":
+        lut = 1 - lut
+    counts = np.bincount(image.ravel(), minlength=lut.size)
+    mean = counts @ lut / max(image.size, 1)
+    if 0 < mean < 1:
+        lut = lut ** (np.log(0.5) / np.log(mean))
+    if level:
+        lut = np.clip((lut + 0.35) / 1.05, 0, 1) ** 2
+    return np.rint(lut * 255).astype(np.uint8)
+
+
+def runconvert(filename, level):
+    """
+    Process a DICOM file with ImageMagick's convert.
+
+    Arguments:
+        filename: name of the file to convert.
+        level: Boolean to indicate whether level adustment should be done.
+    Returns:
+        A 2D numpy.ndarray of uint8, or None if convert failed.
+    """
+    left, top, width, height = crop
+    args = [
+        "convert",
+        filename,
+        "-depth",
+        "8",
+        "-crop",
+        f"{width}x{height}+{left}+{top}",
+        "+repage",
+        "-auto-gamma",
+    ]
+    if level:
+        args += ["-level", "-35%,70%,0.5"]
+    args.append("pgm:-")
+    try:
+        cp = sp.run(args, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    except FileNotFoundError:
+        logging.error(f"the program “convert” is needed for {filename}")
+        return None
+    if cp.returncode != 0:
+        return None
+    try:
+        with Image.open(io.BytesIO(cp.stdout)) as img:
+            return np.asarray(img.convert("L"))
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# file: dicomindex.py
+# vim:fileencoding=utf-8:fdm=marker:ft=python
+#
+# Copyright © 2026 R.F. Smith <rsmith@xs4all.nl>.
+# SPDX-License-Identifier: MIT
+# Created: 2026-10-17T18:02:44+0200
+# Last modified: 2026-10-17T22:01:12+0200
+"""
+Build an index of the DICOM files in directories, and select files from it.
+
+Only the headers of the files are read, up to the pixel data. The index of
+every directory is kept in it, so only new or changed files are read again.
+The names of the selected files are printed, e.g. for use with dicom2img.py.
+"""
+
+import argparse
+import concurrent.futures as cf
+import json
+import logging
+import os
+import struct
+import sys
+
+__version__ = "2026.10.17"
+indexname = ".dicomindex.json"
+# Uncompressed little-endian transfer syntaxes, and if they have explicit VR.
+littleendian = {"1.2.840.10008.1.2": False, "1.2.840.10008.1.2.1": True}
+# Transfer syntaxes in which the data set cannot be read as little-endian.
+unreadable = ("1.2.840.10008.1.2.2", "1.2.840.10008.1.2.1.99")
+# Value representations with a 4-byte length.
+longvrs = (b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"UC", b"UN", b"UR", b"UT")
+# Indexed text and number fields, with their tags.
+textfields = {
+    "modality": (0x0008, 0x0060),
+    "patient": (0x0010, 0x0020),
+    "study": (0x0020, 0x000D),
+    "series": (0x0020, 0x000E),
+    "manufacturer": (0x0008, 0x0070),
+    "model": (0x0008, 0x1090),
+    "detector": (0x0018, 0x700A),
+}
+numberfields = {
+    "rows": (0x0028, 0x0010),
+    "columns": (0x0028, 0x0011),
+    "bits": (0x0028, 0x0101),
+}
+fields = (
+    ["sopclass", "syntax", "image", "frames"] + list(textfields) + list(numberfields)
+)
+
+
+def main():
+    """
+    Entry point for dicomindex.
+    """
+    args = setup()
+    selections = [s.split("=", 1) for s in args.select]
+    for path in args.path:
+        index = update(path)
+        for name in sorted(index):
+            tags = index[name]["tags"]
+            if tags is None or (args.images and not tags["image"]):
+                continue
+            if all(str(tags.get(k)) == v for k, v in selections):
+                line = os.path.join(path, name)
+                if args.long:
+                    line += "\t" + "\t".join(str(v) for v in tags.values())
+                print(line)
+
+
+def setup():
+    """Process the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-i",
+        "--images",
+        action="store_true",
+        help="only select files that contain an image",
+    )
+    parser.add_argument(
+        "-s",
+        "--select",
+        action="append",
+        default=[],
+        metavar="FIELD=VALUE",
+        help="only select files where a field has this value; can be repeated. "
+        f"Fields are: {', '.join(fields)}",
+    )
+    parser.add_argument(
+        "-l",
+        "--long",
+        action="store_true",
+        help="print all the fields after the file name, separated by tabs",
+    )
+    parser.add_argument(
+        "--log",
+        default="warning",
+        choices=["debug", "info", "warning", "error"],
+        help="logging level (defaults to 'warning')",
+    )
+    parser.add_argument("-v", "--version", action="version", version=__version__)
+    parser.add_argument("path", nargs="*", help="directory to index")
+    args = parser.parse_args(sys.argv[1:])
+    logging.basicConfig(
+        level=getattr(logging, args.log.upper(), None),
+        format="%(levelname)s: %(message)s",
+    )
+    logging.debug(f"Command line arguments = {sys.argv}")
+    logging.debug(f"Parsed arguments = {args}")
+    if not args.path:
+        parser.print_help()
+        sys.exit(0)
+    for s in args.select:
+        if s.split("=", 1)[0] not in fields or "=" not in s:
+            parser.error(f"invalid selection '{s}'")
+    for path in args.path:
+        if not os.path.isdir(path):
+            parser.error(f"'{path}' is not a directory")
+    return args
+
+
+def update(path):
+    """
+    Bring the index of a directory up to date, and save it.
+
+    All files in the directory and its subdirectories are indexed. The headers
+    of new and changed files are read in a pool of processes.
+
+    Arguments:
+        path: directory to index.
+
+    Returns:
+        A dictionary mapping file names relative to path to dictionaries with
+        an "id" (size and modification time) and the "tags" of the file.
+        The tags are None for files that are not DICOM files.
+    """
+    index = loadindex(path)
+    found = {}
+    for root, _, files in os.walk(path):
+        for fn in files:
+            name = os.path.relpath(os.path.join(root, fn), path)
+            if name == indexname:
+                continue
+            try:
+                found[name] = fileid(os.path.join(path, name))
+            except OSError as e:
+                # Broken symbolic links, or files removed during the walk.
+                logging.warning(
+                    f"cannot read '{os.path.join(path, name)}' ({e.strerror}), skipped."
+                )
+    index = {n: e for n, e in index.items() if found.get(n) == e["id"]}
+    todo = [n for n in found if n not in index]
+    logging.info(f"{path}: {len(index)} files indexed, {len(todo)} new or changed.")
+    with cf.ProcessPoolExecutor(max_workers=os.cpu_count()) as pp:
+        names = [os.path.join(path, n) for n in todo]
+        for name, tags in zip(todo, pp.map(readtags, names, chunksize=64)):
+            index[name] = {"id": found[name], "tags": tags}
+    saveindex(path, index)
+    return index
+
+
+def fileid(name):
+    """Return the size and modification time of a file, to detect changes."""
+    st = os.stat(name)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def loadindex(path):
+    """
+    Read the index of a directory. Returns an empty dictionary if there is no
+    usable index.
+    """
+    try:
+        with open(os.path.join(path, indexname)) as inf:
+            index = json.load(inf)
+    except (OSError, ValueError):
+        return {}
+    if index.get("fields") != fields:
+        return {}
+    return index.get("files", {})
+
+
+def saveindex(path, index):
+    """Atomically write the index of a directory."""
+    name = os.path.join(path, indexname)
+    with open(name + ".tmp", "w") as outf:
+        json.dump({"fields": fields, "files": index}, outf)
+    os.replace(name + ".tmp", name)
+
+
+def readtags(fname):
+    """
+    Read the indexed fields from the header of a DICOM file.
+
+    Arguments:
+        fname: name of the file.
+
+    Returns:
+        A dictionary of the fields in the order of fields, or None if the file
+        is not a DICOM file.
+    """
+    header = dicomheader(fname)
+    if header is None:
+        return None
+    elements, syntax, pixels = header
+    # DICOMDIR files only have a media storage SOP class.
+    sopclass = text(elements, (0x0008, 0x0016)) or text(elements, (0x0002, 0x0002))
+    tags = {
+        "sopclass": sopclass,
+        "syntax": syntax,
+        "image": pixels is not None or syntax in unreadable,
+        "frames": int(decimal(elements, (0x0028, 0x0008), 1)),
+    }
+    tags.update((k, text(elements, tag)) for k, tag in textfields.items())
+    tags.update((k, ushort(elements, tag)) for k, tag in numberfields.items())
+    return tags
+
+
+def dicomheader(fname):
+    """
+    Read the data elements of a DICOM file up to the pixel data.
+
+    Little-endian files with explicit and implicit VR are supported. Sequences
+    and values longer than 1 KiB are skipped.
+
+    Arguments:
+        fname: name of the DICOM file.
+
+    Returns:
+        A 3-tuple of a dictionary mapping (group, element) tuples to the raw
+        values, the transfer syntax UID and an (offset, length) tuple of the
+        pixel data (None if there is none). The length is None if the pixel
+        data is encapsulated (compressed). None if the file is not a DICOM
+        file, cannot be read or ends in the middle of a data element.
+    """
+    elements, syntax, pixels = {}, "", None
+    try:
+        with open(fname, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(128)
+            if f.read(4) != b"DICM":
+                return None
+            explicit = True
+            while f.tell() < size:
+                group, elem, length = elementheader(f, explicit)
+                if group != 0x0002 and syntax in unreadable:
+                    break
+                if (group, elem) == (0x7FE0, 0x0010):  # PixelData
+                    pixels = (f.tell(), None if length == 0xFFFFFFFF else length)
+                    break
+                if length == 0xFFFFFFFF:
+                    skipitems(f, explicit)
+                elif length > 1024:
+                    f.seek(length, 1)
+                else:
+                    elements[(group, elem)] = value = f.read(length)
+                    if len(value) < length:
+                        return None
+                    if (group, elem) == (0x0002, 0x0010):  # TransferSyntaxUID
+                        syntax = text(elements, (group, elem))
+                        explicit = littleendian.get(syntax, True)
+            else:
+                # Only a file that ends after a complete element has no pixel data.
+                if f.tell() > size:
+                    return None
+    except (OSError, struct.error):
+        return None
+    return elements, syntax, pixels
+
+
+def text(elements, tag, default=""):
+    """Return the value of a text element from a DICOM header."""
+    if tag not in elements:
+        return default
+    return elements[tag].rstrip(b"\0 ").decode("ascii", "replace")
+
+
+def ushort(elements, tag, default=0):
+    """Return the value of a US element from a DICOM header."""
+    try:
+        return struct.unpack("<H", elements[tag][:2])[0]
+    except (KeyError, struct.error):
+        return default
+
+
+def decimal(elements, tag, default=0):
+    """Return the (first) value of an IS or DS element from a DICOM header."""
+    try:
+        return float(text(elements, tag).split("\\")[0])
+    except ValueError:
+        return default
+
+
+def elementheader(f, explicit):
+    """
+    Read the header of a little-endian DICOM data element.
+
+    Arguments:
+        f: binary file object, positioned at the start of the element.
+        explicit: the element has an explicit value representation.
+
+    Returns:
+        A (group, element, value length) tuple.
+    """
+    group, elem = struct.unpack("<HH", f.read(4))
+    # Items and delimiters have no VR. The meta group is always explicit.
+    if group == 0xFFFE or (not explicit and group != 0x0002):
+        (length,) = struct.unpack("<L", f.read(4))
+    elif f.read(2) in longvrs:
+        (length,) = struct.unpack("<xxL", f.read(6))
+    else:
+        (length,) = struct.unpack("<H", f.read(2))
+    return group, elem, length
+
+
+def skipitems(f, explicit):
+    """
+    Skip the contents of a sequence or item of undefined length, up to and
+    including its delimiter.
+    """
+    while True:
+        group, elem, length = elementheader(f, explicit)
+        if group == 0xFFFE and elem in (0xE00D, 0xE0DD):
+            return
+        if length == 0xFFFFFFFF:
+            skipitems(f, explicit)
+        else:
+            f.seek(length, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,46 +5,83 @@
 # Copyright © 2016-2018 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2016-02-11T19:02:34+01:00
-# Last modified: 2021-02-28T16:56:32+0100
+# Last modified: 2026-10-17T21:31:47+0200
 """
 Convert an mpeg stream from a DVD to a webm file, using constrained rate VP9
 encoding for video and libvorbis for audio.
 
 It uses the first video stream and the first audio stream, unless otherwise
-indicated.
+indicated. Optionally the track is ripped from the DVD while it is encoded.
 """
 
 from collections import Counter
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial
 import argparse
+import atexit
+import concurrent.futures as cf
+import hashlib
+import json
 import logging
 import math
 import os
+import platform
+import queue
 import re
+import shutil
+import socket
+import socketserver
+import statistics
 import subprocess as sp
 import sys
+import tempfile
+import threading
 
-__version__ = "2020.03.31"
+__version__ = "2026.10.17"
+usecache = True
+loudtarget = "I=-23:LRA=7:TP=-2"
 
 
 def main():
     """Entry point for dvd2webm.py."""
     args = setup()
+    if args.serve:
+        serve(args.serve)
+        return
     logging.info(f"processing '{args.fn}'.")
     starttime = datetime.now()
     startstr = str(starttime)[:-7]
     logging.info(f"started at {startstr}.")
     logging.info(f"using audio stream {args.audio}.")
+    spool, span = None, None
+    if args.rip is not None:
+        ripargs = ["tccat", "-i", args.device, "-T", f"{args.rip},-1", "-P"]
+        if args.dummy:
+            logging.info("rip: " + " ".join(ripargs) + " > " + args.fn)
+        else:
+            logging.info(f"ripping track {args.rip} to '{args.fn}'.")
+            spool = Spool(args.fn, ripargs)
+            need = (
+                args.detect_after * 2**20
+                if args.detect and not args.crop
+                else 2**24
+            )
+            spool.wait(need)
+            if not spool.done:
+                span = duration(args.fn)
     tc = 1
     if not args.crop and args.detect:
         logging.info("looking for cropping.")
-        args.crop = findcrop(args.fn)
+        args.crop = findcrop(args.fn, span=span)
+        if not args.crop:
+            logging.error("no cropping found.")
+            sys.exit(1)
         width, height, _, _ = args.crop.split(":")
         if width in ["720", "704"] and height == "576":
             logging.info("standard format, no cropping necessary.")
             args.crop = None
             tc = tile_cols(width)
-    else:
+    elif args.crop:
         width, _, _, _ = args.crop.split(":")
         tc = tile_cols(width)
     if args.crop:
@@ -57,6 +94,16 @@ def main():
         except ValueError:
             srtfile = args.subtitle
             logging.info("using subtitle file " + srtfile)
+    if args.crop:
+        width, height = args.crop.split(":")[:2]
+    elif args.dummy and args.rip is not None:
+        width, height = 720, 576
+    else:
+        info = videoinfo(args.fn)
+        width, height = info["width"], info["height"]
+    profile = loadprofile().get(resclass(int(width), int(height)), {})
+    if profile:
+        logging.info(f"using VP9 profile {profile}")
     a1 = mkargs(
         args.fn,
         1,
@@ -66,6 +113,8 @@ def main():
         subf=srtfile,
         subt=subtrack,
         atrack=args.audio,
+        profile=profile,
+        loudnorm=args.loudnorm,
     )
     a2 = mkargs(
         args.fn,
@@ -76,9 +125,49 @@ def main():
         subf=srtfile,
         subt=subtrack,
         atrack=args.audio,
+        profile=profile,
+        loudnorm=args.loudnorm,
     )
-    if not args.dummy:
-        origbytes, newbytes = encode(a1, a2)
+    length = None
+    if spool is None and not args.workers and os.path.exists(args.fn):
+        length = spantime(a2)
+    if length:
+        expected = forecast(loadhistory(), int(width), int(height), length, [a1, a2])
+        if expected:
+            for npass, (lo, avg, hi) in enumerate(expected, start=1):
+                lo, avg, hi = (str(t).split(".")[0] for t in (lo, avg, hi))
+                logging.info(f"pass {npass} is expected to take {avg} ({lo}–{hi})")
+            lo, avg, hi = (
+                str(starttime + sum(ts, timedelta()))[:-10] for ts in zip(*expected)
+            )
+            logging.info(f"encoding is expected to take until {avg} on average")
+            logging.info(f"but it could be anywhere between {lo} and {hi}")
+    if args.workers:
+        if spool:
+            spool.wait()
+        records = []
+        atexit.register(writesummary, args.summary, records)
+        settings = {"crop": args.crop, "tc": tc, "width": width, "height": height}
+        rv = distribute(
+            args.fn,
+            args.workers,
+            args.segments or 3 * len(args.workers),
+            settings,
+            start=args.start,
+            atrack=args.audio,
+            subt=subtrack,
+            loudnorm=args.loudnorm,
+            dummy=args.dummy,
+            records=records,
+        )
+        if rv is None:
+            return
+        origbytes, newbytes = rv
+    elif not args.dummy:
+        records = []
+        atexit.register(writesummary, args.summary, records)
+        origbytes, newbytes = encode(a1, a2, records, args.progress, spool)
+        learn(records, width, height)
     else:
         logging.basicConfig(level="INFO")
         logging.info("first pass: " + " ".join(a1))
@@ -90,7 +179,7 @@ def main():
     runtime = stoptime - starttime
     runstr = str(runtime)[:-7]
     logging.info(f"total running time {runstr}.")
-    encspeed = origbytes / (runtime.seconds * 1000)
+    encspeed = origbytes / (max(runtime.seconds, 1) * 1000)
     logging.info(f"average input encoding speed {encspeed:.2f} kB/s.")
 
 
@@ -126,7 +215,72 @@ def setup():
     )
     ahelp = "number of the audio track to use (default: 0; first audio track)"
     parser.add_argument("-a", "--audio", type=int, default=0, help=ahelp)
-    parser.add_argument("fn", metavar="filename", help="MPEG file to process")
+    parser.add_argument(
+        "-L",
+        "--loudnorm",
+        action="store_true",
+        help="normalize the loudness of the audio to EBU R128, "
+        "measured during the first pass",
+    )
+    parser.add_argument(
+        "-p",
+        "--progress",
+        type=int,
+        default=10,
+        help="seconds between progress reports (default 10, 0 disables them)",
+    )
+    parser.add_argument(
+        "--summary",
+        default="dvd2webm-passes.jsonl",
+        help="file to append the JSON lines summary of each pass to "
+        "(default 'dvd2webm-passes.jsonl', '' disables it)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="do not use the cached ffprobe, ffmpeg and cropping information",
+    )
+    parser.add_argument(
+        "-r",
+        "--rip",
+        type=int,
+        help="rip this track from the DVD into the file, while encoding it",
+    )
+    parser.add_argument(
+        "--device", default="/dev/cd1", help="DVD device to rip from (default /dev/cd1)"
+    )
+    parser.add_argument(
+        "--detect-after",
+        type=int,
+        default=512,
+        help="MiB to rip before detecting the cropping (default 512)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=lambda s: [w for w in s.split(",") if w],
+        help="comma separated HOST:PORT addresses of workers to encode segments on",
+    )
+    parser.add_argument(
+        "-n",
+        "--segments",
+        type=int,
+        default=0,
+        help="number of segments to split the title into for the workers "
+        "(default 3 per worker)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="[HOST:]PORT",
+        help="run as a worker that encodes segments for coordinators",
+    )
+    parser.add_argument(
+        "fn",
+        metavar="filename",
+        nargs="?",
+        help="MPEG file to process (default trackNN.mpg when ripping)",
+    )
     args = parser.parse_args(sys.argv[1:])
     logging.basicConfig(
         level=getattr(logging, args.log.upper(), None),
@@ -134,6 +288,18 @@ def setup():
     )
     logging.debug(f"command line arguments = {sys.argv}")
     logging.debug(f"parsed arguments = {args}")
+    global usecache
+    usecache = args.cache
+    if args.rip is not None:
+        if args.fn is None:
+            args.fn = f"track{args.rip:02d}.mpg"
+        if shutil.which("tccat") is None:
+            logging.error("the program “tccat” cannot be found")
+            sys.exit(1)
+    elif args.fn is None and not args.serve:
+        parser.error("a filename is required unless a track is ripped")
+    if args.workers and args.subtitle and not args.subtitle.isdigit():
+        parser.error("SRT subtitles cannot be used with workers")
     if not check_ffmpeg():
         sys.exit(1)
     return args
@@ -143,46 +309,182 @@ def tile_cols(width):
     return math.floor(math.log2(math.ceil(float(width) / 64.0)))
 
 
+def profilepath():
+    """Return the path of the file with the VP9 settings per resolution class."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".vp9-profile.json"
+
+
+def loadprofile(path=None):
+    """Read the VP9 profile written by vp9-bench.py; returns an empty dictionary if
+    there is none."""
+    try:
+        with open(path or profilepath()) as pf:
+            return json.load(pf)
+    except (OSError, ValueError):
+        return {}
+
+
+def resclass(width, height):
+    """Return the name of the resolution class of a video."""
+    for name, w, h in (("sd", 1024, 576), ("720p", 1280, 720), ("1080p", 1920, 1088)):
+        if width <= w and height <= h:
+            return name
+    return "uhd"
+
+
 def check_ffmpeg():
     """Check the minumum version requirement of ffmpeg, and that it is built with
-    the needed drivers enabled."""
-    args = ["ffmpeg"]
-    proc = sp.run(args, text=True, stdout=sp.DEVNULL, stderr=sp.PIPE)
-    verre = r"ffmpeg version (\d+)\.(\d+)(\.(\d+))? Copyright"
-    major, minor, patch, *rest = re.findall(verre, proc.stderr)[0]
-    if int(major) < 3 and int(minor) < 3:
-        logging.error(f"ffmpeg 3.3 is required; found {major}.{minor}.{patch}")
+    the needed encoders enabled."""
+    caps = ffmpegcaps()
+    if caps is None:
+        logging.error("the “ffmpeg” program cannot be found")
+        return False
+    if caps["version"] and tuple(caps["version"]) < (3, 3):
+        major, minor = caps["version"]
+        logging.error(f"ffmpeg 3.3 is required; found {major}.{minor}")
         return False
-    if not re.search(r"enable-libvpx", proc.stderr):
+    if "libvpx-vp9" not in caps["encoders"]:
         logging.error("ffmpeg is not built with VP9 video support.")
         return False
-    if not re.search(r"enable-libvorbis", proc.stderr):
+    if "libvorbis" not in caps["encoders"]:
         logging.error("ffmpeg is not built with Vorbis audio support.")
         return False
     return True
 
 
-def findcrop(path, start="00:10:00", duration="00:00:01"):
+def ffmpegcaps():
+    """
+    Determine the version and the encoders of the ffmpeg program.
+
+    The result is cached, keyed by the path and modification time of the program.
+
+    Returns:
+        A dictionary with the keys “version” (a [major, minor] list or None for
+        builds without a version number) and “encoders” (a list of encoder names),
+        or None if ffmpeg cannot be found.
+    """
+    binary = shutil.which("ffmpeg")
+    if binary is None:
+        return None
+    fid = os.stat(binary).st_mtime_ns
+    cache = loadjson(probecachepath()) if usecache else {}
+    entry = cache.get("ffmpeg", {}).get(binary)
+    if entry and entry["id"] == fid:
+        return entry["caps"]
+    args = [binary, "-version"]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    m = re.search(r"ffmpeg version n?(\d+)\.(\d+)", proc.stdout)
+    args = [binary, "-hide_banner", "-encoders"]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    lines = proc.stdout.splitlines()
+    if any(ln.strip().startswith("---") for ln in lines):
+        while not lines.pop(0).strip().startswith("---"):
+            pass
+    caps = {
+        "version": [int(m.group(1)), int(m.group(2))] if m else None,
+        "encoders": [ln.split()[1] for ln in lines if len(ln.split()) > 1],
+    }
+    if usecache:
+        cache.setdefault("ffmpeg", {})[binary] = {"id": fid, "caps": caps}
+        savejson(probecachepath(), cache)
+    return caps
+
+
+def probecachepath():
+    """Return the path of the cache file shared by the ffmpeg based converters."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".ffprobe-cache.json"
+
+
+def probe(path):
+    """
+    Retrieve the stream and format information of a media file with ffprobe.
+
+    The result is cached, keyed by the path, size and modification time of the file.
+    Entries for files that no longer exist are removed from the cache.
+
+    Arguments:
+        path: location of the file.
+
+    Returns:
+        A dictionary with “streams” and “format” keys, or an empty dictionary if
+        ffprobe cannot read the file.
+    """
+    key, fid = fileid(path)
+    cache = loadjson(probecachepath()) if usecache else {}
+    entry = cache.get("probe", {}).get(key)
+    if entry and entry["id"] == fid:
+        return entry["data"]
+    args = ["ffprobe", "-v", "error", "-show_streams", "-show_format"]
+    args += ["-of", "json", path]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    try:
+        data = json.loads(proc.stdout)
+    except ValueError:
+        return {}
+    if usecache:
+        entries = cache.setdefault("probe", {})
+        for k in [k for k in entries if not os.path.exists(k)]:
+            del entries[k]
+        entries[key] = {"id": fid, "data": data}
+        savejson(probecachepath(), cache)
+    return data
+
+
+def findcrop(path, samples=15, length=1, span=None):
     """
     Find the cropping of the video file.
 
+    Short samples spread over the whole video are scanned concurrently. Every
+    sample votes for the cropping it detected most often.
+
     Arguments:
         path: location of the file to query.
-        start: A string that defines where in the movie to start scanning.
-            Defaults to 10 minutes from the start. Format HH:MM:SS.
-        duration: A string defining how much of the movie to scan. Defaults to
-            one second. Format HH:MM:SS.
+        samples: number of samples to take. Defaults to 15.
+        length: length of each sample in seconds. Defaults to one second.
+        span: Optional number of seconds at the start of the video to sample.
+            Used for files that are still being written; these are not cached.
 
     Returns:
         A string containing the cropping to use with ffmpeg.
     """
+    key = fileid(path)
+    cache = loadjson(cachepath("crop")) if usecache and span is None else {}
+    if cache.get(key[0], {}).get("id") == key[1]:
+        logging.info("using cached cropping.")
+        return cache[key[0]]["crop"]
+    try:
+        total = span or duration(path)
+    except ValueError:
+        total = 0.0
+    starts = [total * (j + 1) / (samples + 1) for j in range(samples)]
+    with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
+        votes = list(tp.map(partial(cropsample, path, length=length), starts))
+    crop = votecrop(votes)
+    if crop and usecache and span is None:
+        cache[key[0]] = {"id": key[1], "crop": crop}
+        savejson(cachepath("crop"), cache)
+    return crop
+
+
+def cropsample(path, start, length=1):
+    """
+    Run cropdetect on a short sample of the video file.
+
+    Arguments:
+        path: location of the file to query.
+        start: time in seconds where the sample starts.
+        length: length of the sample in seconds.
+
+    Returns:
+        The cropping that was found most often as a W:H:X:Y string, or None.
+    """
     args = [
         "ffmpeg",
         "-hide_banner",
         "-ss",
-        start,  # Start at 10 minutes in.
+        f"{start:.3f}",  # Fast input seeking to the start of the sample.
         "-t",
-        duration,  # Parse for one second.
+        str(length),  # Length of the sample.
         "-i",
         path,  # Path to the input file.
         "-vf",
@@ -195,24 +497,102 @@ def findcrop(path, start="00:10:00", duration="00:00:01"):
     ]
     proc = sp.run(args, universal_newlines=True, stdout=sp.DEVNULL, stderr=sp.PIPE)
     rv = Counter(re.findall(r"crop=(\d+:\d+:\d+:\d+)", proc.stderr))
+    if not rv:
+        return None
     return rv.most_common(1)[0][0]
 
 
-def reporttime(p, start, end):
+def votecrop(votes):
+    """
+    Select the cropping that most samples agree on.
+
+    Ties are resolved in favor of the largest area, so dark scenes cannot
+    crop away part of the picture.
+
+    Arguments:
+        votes: list of W:H:X:Y strings, or None for samples without result.
+
+    Returns:
+        The selected W:H:X:Y string, or None if there were no votes.
+    """
+    counts = Counter(v for v in votes if v)
+    if not counts:
+        return None
+
+    def area(crop):
+        w, h, _, _ = crop.split(":")
+        return int(w) * int(h)
+
+    return max(counts, key=lambda c: (counts[c], area(c)))
+
+
+def fileid(path):
     """
-    Report the amount of time passed between start and end.
+    Identify the contents of a file without reading it.
+
+    Arguments:
+        path: location of the file.
+
+    Returns:
+        A 2-tuple of the absolute path and a list of the size and the
+        modification time in nanoseconds.
+    """
+    st = os.stat(path)
+    return os.path.abspath(path), [st.st_size, st.st_mtime_ns]
+
+
+def cachepath(kind):
+    """Return the path of the cache file for the given kind of data."""
+    return os.environ.get("HOME", os.curdir) + os.sep + f".dvd2webm-{kind}.json"
+
+
+def loadjson(path):
+    """Read a dictionary from a JSON file. Returns an empty dictionary on failure."""
+    try:
+        with open(path) as jf:
+            return json.load(jf)
+    except (OSError, ValueError):
+        return {}
+
+
+def savejson(path, data):
+    """
+    Atomically write a dictionary to a JSON file.
+
+    The temporary file has a unique name, so other processes or threads can
+    update the same file at the same time; the last one wins.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False
+    ) as jf:
+        json.dump(data, jf, indent=2)
+    os.replace(jf.name, path)
+
+
+def reporttime(p, secs):
+    """
+    Report the amount of time a pass took.
 
     Arguments:
         p: number of the pass.
-        start: datetime.datetime instance.
-        end: datetime.datetime instance.
+        secs: duration of the pass in seconds.
     """
-    dt = str(end - start)[:-7]
+    dt = str(timedelta(seconds=round(secs)))
     logging.info(f"pass {p} took {dt}.")
 
 
 def mkargs(
-    fn, npass, tile_columns, crop=None, start=None, subf=None, subt=None, atrack=0
+    fn,
+    npass,
+    tile_columns,
+    crop=None,
+    start=None,
+    subf=None,
+    subt=None,
+    atrack=0,
+    profile=None,
+    loudnorm=False,
+    audio=True,
 ):
     """Create argument list for constrained quality VP9/vorbis encoding.
 
@@ -227,6 +607,13 @@ def mkargs(
         subf: Optional string containing the name of the SRT file to use.
         subt: Optional string containing the index of the dvdsub stream to use.
         atrack: Optional number of the audio track to use. Defaults to 0.
+        profile: Optional dictionary with the speed (of the second pass),
+            tile-columns, threads and row-mt settings to use, as written by
+            vp9-bench.py.
+        loudnorm: Boolean to indicate that the loudness of the (first) audio
+            track should be measured in the first pass and normalized in the
+            second. Defaults to False.
+        audio: Boolean to indicate if the audio should be encoded. Defaults to True.
 
     Returns:
         A list of strings suitable for calling a subprocess.
@@ -237,12 +624,14 @@ def mkargs(
         raise ValueError("cropping must be in the format W:H:X:Y")
     if start and not re.search(r"\d{2}:\d{2}:\d{2}", start):
         raise ValueError("starting time must be in the format HH:MM:SS")
-    numthreads = str(os.cpu_count())
+    profile = profile or {}
+    numthreads = str(profile.get("threads", os.cpu_count()))
+    tile_columns = profile.get("tile-columns", tile_columns)
     basename = fn.rsplit(".", 1)[0]
     args = [
         "ffmpeg",
         "-loglevel",
-        "quiet",
+        "info" if npass == 1 and loudnorm else "quiet",
         "-probesize",
         "1G",
         "-analyzeduration",
@@ -250,8 +639,13 @@ def mkargs(
     ]
     if start:
         args += ["-ss", start]
-    args += ["-i", fn, "-passlogfile", basename]
-    speed = "2"
+    args += ["-i", fn]
+    if npass == 1 and loudnorm and audio:
+        # Measure the loudness in a second output of the same process.
+        af = f"loudnorm={loudtarget}:print_format=json"
+        args += ["-map", f"0:a:{atrack}", "-af", af, "-f", "null", "-"]
+    args += ["-passlogfile", basename]
+    speed = str(profile.get("speed", 2))
     if npass == 1:
         logging.info(f"using {numthreads} threads")
         logging.info(f"using {tile_columns} tile columns")
@@ -260,7 +654,7 @@ def mkargs(
         "-c:v",
         "libvpx-vp9",
         "-row-mt",
-        "1",
+        str(profile.get("row-mt", 1)),
         "-threads",
         numthreads,
         "-pass",
@@ -279,13 +673,23 @@ def mkargs(
     if npass == 2:
         args += ["-auto-alt-ref", "1", "-lag-in-frames", "25"]
     args += ["-sn"]
-    if npass == 1:
+    if npass == 1 or not audio:
         args += ["-an"]
     elif npass == 2:
         args += ["-c:a", "libvorbis", "-q:a", "3"]
+        if loudnorm:
+            args += ["-af", f"loudnorm={loudtarget}", "-ar", "48000"]
     args += ["-f", "webm"]
-    if not subt:  # SRT file
-        args += ["-map", "0:v", "-map", f"0:a:{atrack}"]
+    if npass == 1:
+        # Subtitles and audio do not matter for the first pass. Leaving them
+        # out makes its statistics reusable; see firstpass().
+        args += ["-map", "0:v"]
+        if crop:
+            args += ["-vf", f"crop={crop}"]
+    elif not subt:  # SRT file
+        args += ["-map", "0:v"]
+        if audio:
+            args += ["-map", f"0:a:{atrack}"]
         vf = []
         if subf:
             vf = [f"subtitles={subf}"]
@@ -296,8 +700,11 @@ def mkargs(
     else:
         fc = f"[0:v][0:s:{subt}]overlay"
         if crop:
-            fc += f",crop={crop}[v]"
-        args += ["-filter_complex", fc, "-map", "[v]", "-map", f"0:a:{atrack}"]
+            fc += f",crop={crop}"
+        fc += "[v]"
+        args += ["-filter_complex", fc, "-map", "[v]"]
+        if audio:
+            args += ["-map", f"0:a:{atrack}"]
     if npass == 1:
         outname = "/dev/null"
     else:
@@ -306,38 +713,45 @@ def mkargs(
     return args
 
 
-def encode(args1, args2):
+def encode(args1, args2, records=None, interval=10, spool=None):
     """
     Run the encoding subprocesses.
 
     Arguments:
         args1: Commands to run the first encoding step as a subprocess.
         args2: Commands to run the second encoding step as a subprocess.
+        records: Optional list to which the summaries of the passes are appended.
+        interval: Number of seconds between progress reports. 0 disables them.
+        spool: Optional Spool that is still filling the input file. The first
+            pass then reads the input through a pipe while it is being written.
 
     Return values:
         A 2-tuple of the original movie size in bytes and the encoded movie size in bytes.
     """
     oidx = args2.index("-i") + 1
-    origsize = os.path.getsize(args2[oidx])
     logging.info("running pass 1...")
     logging.debug("pass 1: {}".format(" ".join(args1)))
-    start = datetime.utcnow()
-    proc = sp.run(args1, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    end = datetime.utcnow()
-    if proc.returncode:
-        logging.error(f"pass 1 returned {proc.returncode}.")
-        return origsize, 0
+    if spool:
+        rv, rec = pipedpass(args1, spool, interval, records)
     else:
-        reporttime(1, start, end)
+        rv, rec = firstpass(args1, spantime(args2), interval, records)
+    origsize = os.path.getsize(args2[oidx])
+    total = spantime(args2)
+    if rv:
+        logging.error(f"pass 1 returned {rv}.")
+        return origsize, 0
+    elif rec:
+        reporttime(1, rec["seconds"])
     logging.info("running pass 2...")
+    args2 = linearloudnorm(args2)
     logging.debug("pass 2: {}".format(" ".join(args2)))
-    start = datetime.utcnow()
-    proc = sp.run(args2, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    end = datetime.utcnow()
-    if proc.returncode:
-        logging.error(f"pass 2 returned {proc.returncode}.")
+    rv, rec = runpass(args2, 2, total, interval)
+    if records is not None:
+        records.append(rec)
+    if rv:
+        logging.error(f"pass 2 returned {rv}.")
     else:
-        reporttime(2, start, end)
+        reporttime(2, rec["seconds"])
     newsize = os.path.getsize(args2[-1])
     percentage = int(100 * newsize / origsize)
     ifn, ofn = args2[oidx], args2[-1]
@@ -345,5 +759,1092 @@ def encode(args1, args2):
     return origsize, newsize  # both in bytes.
 
 
+def firstpass(args, total=None, interval=10, records=None):
+    """
+    Run the first pass, or reuse the statistics of an identical earlier first pass.
+
+    The statistics are stored in ~/.vp9-passlogs, under a key made from the
+    arguments of the first pass and a fingerprint of the input file.
+
+    Arguments:
+        args: Commands to run the first encoding step as a subprocess.
+        total: Optional number of seconds of input that will be encoded.
+        interval: Number of seconds between progress reports. 0 disables them.
+        records: Optional list to which the summary of the pass is appended.
+
+    Returns:
+        A 2-tuple of the return code of ffmpeg and a dictionary summarizing the
+        pass, or (0, None) if stored statistics were used.
+    """
+    base = argvalue(args, "-passlogfile")
+    logname = base + "-0.log"
+    loudname = loudnessname(args)
+    stored = None
+    if usecache:
+        stored = os.path.join(passlogdir(), passkey(args) + ".log")
+        if os.path.exists(stored):
+            shutil.copyfile(stored, logname)
+            if loudname and os.path.exists(stored + ".loudnorm"):
+                shutil.copyfile(stored + ".loudnorm", loudname)
+            logging.info("reusing the statistics of an earlier first pass.")
+            return 0, None
+    errlog = base + "-ffmpeg.log" if loudname else None
+    rv, rec = runpass(args, 1, total, interval, errlog=errlog)
+    if records is not None:
+        records.append(rec)
+    if loudname:
+        saveloudness(errlog, loudname)
+    if rv == 0 and stored:
+        storepasslog(logname, stored, loudname)
+    return rv, rec
+
+
+def storepasslog(logname, stored, loudname=None):
+    """Atomically copy the statistics and the loudness measurement of a first pass
+    into the store."""
+    if not os.path.exists(logname):
+        return
+    os.makedirs(passlogdir(), exist_ok=True)
+    for src, dest in ((loudname, stored + ".loudnorm"), (logname, stored)):
+        if src and os.path.exists(src):
+            shutil.copyfile(src, dest + ".tmp")
+            os.replace(dest + ".tmp", dest)
+
+
+def pipedpass(args, spool, interval=10, records=None):
+    """
+    Run the first pass on an input file that is still being written.
+
+    The contents of the file are fed to ffmpeg through a pipe as they arrive.
+    Since ffmpeg cannot seek in a pipe, the probing is limited to what is needed
+    for the video stream.
+
+    Arguments:
+        args: Commands to run the first encoding step as a subprocess.
+        spool: Spool that fills the input file.
+        interval: Number of seconds between progress reports. 0 disables them.
+        records: Optional list to which the summary of the pass is appended.
+
+    Returns:
+        A 2-tuple of the return code of ffmpeg and a dictionary summarizing the pass.
+    """
+    piped = list(args)
+    piped[piped.index("-i") + 1] = "pipe:0"
+    piped[piped.index("-probesize") + 1] = "32M"
+    piped[piped.index("-analyzeduration") + 1] = "30M"
+    loudname = loudnessname(args)
+    errlog = argvalue(args, "-passlogfile") + "-ffmpeg.log" if loudname else None
+    rv, rec = runpass(piped, 1, None, interval, spool.chunks(), errlog)
+    rec["file"] = spool.name
+    if loudname:
+        saveloudness(errlog, loudname)
+    if records is not None:
+        records.append(rec)
+    spool.wait()
+    if spool.returncode:
+        logging.error(f"ripping returned {spool.returncode}.")
+        return spool.returncode, rec
+    if rv == 0 and usecache:
+        logname = argvalue(args, "-passlogfile") + "-0.log"
+        stored = os.path.join(passlogdir(), passkey(args) + ".log")
+        storepasslog(logname, stored, loudname)
+    return rv, rec
+
+
+class Spool:
+    """
+    File that is filled with the output of a program in the background, and
+    that can be read from the start while it is being written.
+
+    One thread reads the output of the program, another writes it to the file.
+    They are connected by a queue of at most maxchunks chunks, so a slow disk
+    does not stall the program until the queue is full.
+    """
+
+    def __init__(self, name, args, chunksize=2**20, maxchunks=64):
+        """
+        Start the program and the threads that spool its output.
+
+        Arguments:
+            name: path of the file to write.
+            args: program to run as a list of strings.
+            chunksize: size of the chunks to read and write. Defaults to 1 MiB.
+            maxchunks: size of the queue between reading and writing.
+        """
+        self.name = name
+        self.chunksize = chunksize
+        self.size = 0
+        self.done = False
+        self.returncode = None
+        self.cond = threading.Condition()
+        self.queue = queue.Queue(maxsize=maxchunks)
+        self.outf = open(name, "wb")
+        self.proc = sp.Popen(args, stdout=sp.PIPE, stderr=sp.DEVNULL)
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def _read(self):
+        """Move the output of the program into the queue."""
+        while True:
+            data = self.proc.stdout.read(self.chunksize)
+            self.queue.put(data)
+            if not data:
+                break
+        self.returncode = self.proc.wait()
+
+    def _write(self):
+        """Move the contents of the queue into the file."""
+        with self.outf:
+            while True:
+                data = self.queue.get()
+                self.outf.write(data)
+                self.outf.flush()
+                with self.cond:
+                    self.size += len(data)
+                    self.done = not data
+                    self.cond.notify_all()
+                if not data:
+                    break
+
+    def wait(self, size=None):
+        """
+        Wait until at least size bytes have been written, or until the program
+        has finished and all its output has been written.
+
+        Returns:
+            The number of bytes written.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.done or (size is not None and self.size >= size)
+            )
+            return self.size
+
+    def chunks(self):
+        """Yield the contents of the file from the start, following it as it grows."""
+        with open(self.name, "rb") as inf:
+            pos = 0
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.done or self.size > pos)
+                    avail = self.size - pos
+                if avail == 0:
+                    return
+                data = inf.read(min(avail, self.chunksize))
+                pos += len(data)
+                yield data
+
+
+def passlogdir():
+    """Return the path of the directory where first pass statistics are stored."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".vp9-passlogs"
+
+
+def passkey(args):
+    """
+    Create a key for the statistics produced by a first pass.
+
+    Arguments:
+        args: Commands to run the first encoding step as a subprocess.
+
+    Returns:
+        A hexadecimal string.
+    """
+    fn = argvalue(args, "-i")
+    rest = list(args)
+    for opt in ("-i", "-passlogfile"):
+        rest[rest.index(opt) + 1] = ""
+    data = json.dumps([fingerprint(fn), rest])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def fingerprint(path, blocksize=2**20):
+    """
+    Calculate a fingerprint of the contents of a file.
+
+    To keep this fast for multi-gigabyte files, only the size and three blocks
+    at the beginning, middle and end of the file are used.
+
+    Arguments:
+        path: location of the file.
+        blocksize: size of the blocks to read. Defaults to 1 MiB.
+
+    Returns:
+        A hexadecimal string.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, size // 2, max(size - blocksize, 0)):
+            f.seek(offset)
+            h.update(f.read(blocksize))
+    return h.hexdigest()
+
+
+def spantime(args):
+    """
+    Determine how many seconds of the input an ffmpeg command will encode.
+
+    Arguments:
+        args: ffmpeg command as a list of strings.
+
+    Returns:
+        The length in seconds, or None if it cannot be determined.
+    """
+    if "-t" in args:
+        return ts2sec(args[args.index("-t") + 1])
+    try:
+        total = duration(args[args.index("-i") + 1])
+    except ValueError:
+        return None
+    if "-ss" in args:
+        total -= ts2sec(args[args.index("-ss") + 1])
+    return total
+
+
+def runpass(args, npass, total=None, interval=10, feed=None, errlog=None):
+    """
+    Run an ffmpeg encoding pass, reading its progress information from a pipe.
+
+    Arguments:
+        args: ffmpeg command as a list of strings.
+        npass: Number of the pass.
+        total: Optional number of seconds of input that will be encoded.
+            Used to calculate the estimated time of arrival.
+        interval: Number of seconds between progress reports. 0 disables them.
+        feed: Optional iterable of bytes that is written to the standard input
+            of ffmpeg in a separate thread.
+        errlog: Optional name of a file to write the messages of ffmpeg to.
+
+    Returns:
+        A 2-tuple of the return code of ffmpeg and a dictionary summarizing the pass.
+    """
+    args = args[:1] + ["-progress", "pipe:1", "-nostats"] + args[1:]
+    begin = datetime.now()
+    lastreport = begin
+    prog = {}
+    stdin = sp.PIPE if feed is not None else None
+    stderr = open(errlog, "w") if errlog else sp.DEVNULL
+    with sp.Popen(args, text=True, stdin=stdin, stdout=sp.PIPE, stderr=stderr) as proc:
+        if feed is not None:
+            feeder = threading.Thread(target=pump, args=(feed, proc.stdin.buffer))
+            feeder.start()
+        for ln in proc.stdout:
+            key, _, value = ln.strip().partition("=")
+            prog[key] = value.strip()
+            if key != "progress" or prog[key] == "end":
+                continue
+            now = datetime.now()
+            if interval and (now - lastreport).total_seconds() >= interval:
+                lastreport = now
+                logging.info(f"pass {npass}: " + progress(prog, now - begin, total))
+        if feed is not None:
+            feeder.join()
+    if errlog:
+        stderr.close()
+    seconds = (datetime.now() - begin).total_seconds()
+    frames = int(prog.get("frame", 0) or 0)
+    record = {
+        "file": args[args.index("-i") + 1],
+        "output": args[-1],
+        "pass": npass,
+        "length": round(total, 3) if total else None,
+        "codec": argvalue(args, "-c:v"),
+        "preset": argvalue(args, "-speed"),
+        "threads": argvalue(args, "-threads"),
+        "started": str(begin)[:-7],
+        "seconds": round(seconds, 2),
+        "frames": frames,
+        "fps": round(frames / seconds, 2) if seconds else 0.0,
+        "bitrate": prog.get("bitrate", "N/A"),
+        "speed": prog.get("speed", "N/A"),
+        "size": int(prog.get("total_size", 0) or 0),
+        "returncode": proc.returncode,
+    }
+    return proc.returncode, record
+
+
+def pump(chunks, stream):
+    """Write chunks of data to a stream and close it. Stops when the reader is gone."""
+    try:
+        for data in chunks:
+            stream.write(data)
+    except (BrokenPipeError, ValueError):
+        pass
+    try:
+        stream.close()
+    except BrokenPipeError:
+        pass
+
+
+def argvalue(args, option):
+    """Return the value following option in an argument list, or None."""
+    try:
+        return args[args.index(option) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+def loudnessname(args):
+    """
+    Return the name of the file with the loudness measured by a first pass, or
+    None if the pass does not measure it.
+    """
+    if not any(a.startswith("loudnorm=") for a in args):
+        return None
+    return argvalue(args, "-passlogfile") + "-loudnorm.json"
+
+
+def saveloudness(errlog, name):
+    """
+    Extract the loudness measurement that the loudnorm filter printed at the end
+    of the messages of ffmpeg, and save it.
+
+    Arguments:
+        errlog: file containing the messages of ffmpeg. It is removed afterwards.
+        name: file to save the measurement to in JSON format.
+    """
+    try:
+        with open(errlog) as ef:
+            text = ef.read()
+        os.remove(errlog)
+        measured = json.loads(text[text.rindex("{") : text.rindex("}") + 1])
+    except (OSError, ValueError) as e:
+        logging.warning(f"could not read the loudness measurement: {e}")
+        return
+    with open(name, "w") as lf:
+        json.dump(measured, lf)
+    logging.info(
+        f"measured loudness {measured['input_i']} LUFS, "
+        f"true peak {measured['input_tp']} dBTP."
+    )
+
+
+def linearloudnorm(args):
+    """
+    Configure the loudnorm filter of a second pass for linear normalization, with
+    the values measured in the first pass.
+
+    Arguments:
+        args: Commands to run the second encoding step as a subprocess.
+
+    Returns:
+        The modified commands. Without a measurement, the loudnorm filter
+        stays in its dynamic mode.
+    """
+    try:
+        idx = next(n for n, a in enumerate(args) if a.startswith("loudnorm="))
+    except StopIteration:
+        return args
+    try:
+        with open(argvalue(args, "-passlogfile") + "-loudnorm.json") as lf:
+            m = json.load(lf)
+    except (OSError, ValueError):
+        logging.warning("no loudness measurement; normalizing dynamically.")
+        return args
+    args = list(args)
+    args[idx] += (
+        f":measured_I={m['input_i']}:measured_LRA={m['input_lra']}"
+        f":measured_TP={m['input_tp']}:measured_thresh={m['input_thresh']}"
+        f":offset={m['target_offset']}:linear=true"
+    )
+    return args
+
+
+def progress(prog, elapsed, total=None):
+    """
+    Format the progress of an encoding pass.
+
+    Arguments:
+        prog: dictionary of the key/value pairs from ffmpeg's -progress output.
+        elapsed: datetime.timedelta of the time since the pass started.
+        total: Optional number of seconds of input that will be encoded.
+
+    Returns:
+        A string describing the progress.
+    """
+    try:
+        done = int(prog.get("out_time_us", prog.get("out_time_ms", "0"))) / 1e6
+    except ValueError:
+        done = 0.0
+    rv = f"frame {prog.get('frame', '?')}, {prog.get('fps', '?')} fps, "
+    rv += f"{prog.get('bitrate', '?')}, speed {prog.get('speed', '?')}"
+    if total and done > 0:
+        pct = min(100 * done / total, 100)
+        remaining = (total - done) * elapsed.total_seconds() / done
+        rv += f", {pct:.1f}% done, ETA {sec2ts(max(remaining, 0))[:-4]}"
+    return rv
+
+
+def writesummary(path, records):
+    """
+    Append the summaries of the encoding passes to a file in JSON lines format.
+
+    Arguments:
+        path: Name of the file to write.
+        records: List of dictionaries to write.
+    """
+    if not path or not records:
+        return
+    with open(path, "a") as sf:
+        for rec in records:
+            sf.write(json.dumps(rec) + "\n")
+    logging.info(f"wrote summary of {len(records)} passes to '{path}'.")
+
+
+def duration(fn):
+    """Return the duration of a media file in seconds."""
+    return float(probe(fn).get("format", {}).get("duration", ""))
+
+
+def ts2sec(ts):
+    """Convert a HH:MM:SS[.fff] time stamp to seconds."""
+    h, m, s = ts.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def sec2ts(secs):
+    """Convert seconds to a HH:MM:SS.fff time stamp."""
+    m, s = divmod(secs, 60)
+    h, m = divmod(int(m), 60)
+    return f"{h:02d}:{m:02d}:{s:06.3f}"
+
+
+def videoinfo(name):
+    """
+    Retrieve the properties of the first video stream of a file.
+
+    Arguments:
+        name: file path.
+
+    Returns:
+        A dictionary of the stream properties reported by ffprobe.
+    """
+    for stream in probe(name).get("streams", []):
+        if stream.get("codec_type") == "video":
+            return stream
+    return {}
+
+
+def historypath():
+    """Return the path of the encoding history file."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".encode-history.jsonl"
+
+
+def loadhistory(path=None):
+    """
+    Read the encoding history.
+
+    Arguments:
+        path: Optional path of the history file.
+
+    Returns:
+        A list of dictionaries, one for every recorded pass.
+    """
+    path = path or historypath()
+    rv = []
+    try:
+        with open(path) as hf:
+            for ln in hf:
+                try:
+                    rv.append(json.loads(ln))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+def learn(records, width, height, path=None):
+    """
+    Add the successful passes from the summary records to the encoding history.
+
+    Arguments:
+        records: List of pass summaries as produced by runpass.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        path: Optional path of the history file.
+    """
+    host = platform.node()
+    with open(path or historypath(), "a") as hf:
+        for rec in records:
+            if rec["returncode"] or not rec["length"]:
+                continue
+            sample = {
+                "host": host,
+                "width": int(width),
+                "height": int(height),
+                "length": rec["length"],
+                "codec": rec["codec"],
+                "pass": rec["pass"],
+                "preset": rec["preset"],
+                "threads": rec["threads"],
+                "seconds": rec["seconds"],
+            }
+            hf.write(json.dumps(sample) + "\n")
+
+
+def predict(history, width, height, length, codec, npass, preset, threads):
+    """
+    Predict the wall clock time of an encoding pass from the history.
+
+    The model assumes that the running time is proportional to the number of
+    pixels encoded, with a log-normally distributed proportionality factor.
+    It is fitted to the most specific group of matching samples that contains
+    at least two samples; first matching the host, codec, pass, preset and
+    number of threads, then dropping the number of threads and the host.
+
+    Arguments:
+        history: List of samples as returned by loadhistory.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        length: Length of the encoded video in seconds.
+        codec: Name of the video codec.
+        npass: Number of the pass.
+        preset: Speed preset as a string.
+        threads: Number of threads as a string.
+
+    Returns:
+        A 3-tuple of datetime.timedelta objects for the lower bound, the estimate
+        and the upper bound of an approximately 95% prediction interval, or None
+        when there is not enough history.
+    """
+    work = width * height * length / 1e6
+    if work <= 0:
+        return None
+    host = platform.node()
+    groups = [
+        lambda s: s["host"] == host and s["threads"] == str(threads),
+        lambda s: s["host"] == host,
+        lambda s: True,
+    ]
+    for match in groups:
+        logs = [
+            math.log(s["seconds"] / (s["width"] * s["height"] * s["length"] / 1e6))
+            for s in history
+            if s["codec"] == codec
+            and s["pass"] == npass
+            and s["preset"] == str(preset)
+            and s["seconds"] > 0
+            and match(s)
+        ]
+        if len(logs) >= 2:
+            break
+    else:
+        return None
+    mu, sd = statistics.mean(logs), statistics.stdev(logs)
+    spread = 1.96 * sd * math.sqrt(1 + 1 / len(logs))
+    return tuple(
+        timedelta(seconds=work * math.exp(mu + f)) for f in (-spread, 0, spread)
+    )
+
+
+def forecast(history, width, height, length, passargs):
+    """
+    Predict the duration of all passes of an encoding.
+
+    Arguments:
+        history: List of samples as returned by loadhistory.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        length: Length of the encoded video in seconds.
+        passargs: List of the ffmpeg commands for the passes.
+
+    Returns:
+        A list of 3-tuples of datetime.timedelta objects, one for each pass, or
+        None when there is not enough history for one of the passes.
+    """
+    rv = []
+    for npass, args in enumerate(passargs, start=1):
+        p = predict(
+            history,
+            width,
+            height,
+            length,
+            argvalue(args, "-c:v"),
+            npass,
+            argvalue(args, "-speed"),
+            argvalue(args, "-threads"),
+        )
+        if p is None:
+            return None
+        rv.append(p)
+    return rv
+
+
+def keyframes(fn):
+    """
+    Find the keyframes in the first video stream of a file.
+
+    Only the packet headers are read; no frames are decoded.
+
+    Arguments:
+        fn: file path.
+
+    Returns:
+        A list of the times of the keyframes in seconds.
+    """
+    args = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries"]
+    args += ["packet=pts_time,flags", "-of", "csv=p=0", fn]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    rv = []
+    for ln in proc.stdout.splitlines():
+        try:
+            pts, flags = ln.split(",")[:2]
+            if flags.startswith("K"):
+                rv.append(float(pts))
+        except ValueError:
+            continue
+    return sorted(rv)
+
+
+def segments(keys, begin, end, n):
+    """
+    Divide the time span between begin and end into at most n segments,
+    all of which except the first start at a keyframe.
+
+    Arguments:
+        keys: sorted list of keyframe times in seconds.
+        begin: start of the span in seconds.
+        end: end of the span in seconds.
+        n: requested number of segments.
+
+    Returns:
+        A list of (start, length) tuples in seconds.
+    """
+    keys = [k for k in keys if begin < k < end]
+    bounds = [begin]
+    for j in range(1, n):
+        if not keys:
+            break
+        target = begin + j * (end - begin) / n
+        k = min(keys, key=lambda x: abs(x - target))
+        if k > bounds[-1]:
+            bounds.append(k)
+    bounds.append(end)
+    return [(a, b - a) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def parseaddr(addr, host="localhost"):
+    """Split a [HOST:]PORT string into a (host, port) tuple."""
+    name, _, port = addr.rpartition(":")
+    return name or host, int(port)
+
+
+def sendmsg(sock, header, path=None):
+    """
+    Send a message consisting of a JSON header line and the contents of a file.
+
+    Arguments:
+        sock: connected socket.
+        header: dictionary to send. The size of the file is added to it.
+        path: Optional name of the file to send.
+    """
+    size = os.path.getsize(path) if path else 0
+    sock.sendall((json.dumps(dict(header, size=size)) + "\n").encode())
+    if path:
+        with open(path, "rb") as f:
+            sock.sendfile(f)
+
+
+def recvmsg(rfile, path=None):
+    """
+    Receive a message sent by sendmsg.
+
+    Arguments:
+        rfile: binary file object reading from the socket.
+        path: Optional name of the file to store the data in. Without it, the
+            data is discarded.
+
+    Returns:
+        The header dictionary, or None if the connection was closed.
+    """
+    line = rfile.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    remaining = int(header.get("size", 0))
+    with open(path or os.devnull, "wb") as f:
+        while remaining > 0:
+            data = rfile.read(min(remaining, 2**20))
+            if not data:
+                raise ConnectionError("connection closed during transfer")
+            f.write(data)
+            remaining -= len(data)
+    return header
+
+
+def serve(addr):
+    """
+    Run as a worker, encoding the segments that coordinators send.
+
+    Arguments:
+        addr: [HOST:]PORT string of the address to listen on. Without a host,
+            all interfaces are used.
+    """
+    host, port = parseaddr(addr, "")
+    with WorkerServer((host, port), Worker) as server:
+        logging.info(f"waiting for coordinators on port {port}.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("stopped.")
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """TCP server that handles every coordinator in its own thread."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Worker(socketserver.StreamRequestHandler):
+    """Encode the segments that a coordinator sends over a connection."""
+
+    def handle(self):
+        peer = "{}:{}".format(*self.client_address[:2])
+        logging.info(f"coordinator {peer} connected.")
+        while True:
+            workdir = tempfile.mkdtemp(prefix="dvd2webm-worker-")
+            try:
+                segname = os.path.join(workdir, "segment.mkv")
+                job = recvmsg(self.rfile, segname)
+                if job is None:
+                    break
+                logging.info(f"encoding segment {job.get('segment')} for {peer}.")
+                rv, records, outname = encodesegment(segname, job)
+                reply = {"segment": job.get("segment"), "returncode": rv}
+                reply["records"] = records
+                sendmsg(self.request, reply, outname if rv == 0 else None)
+            except (OSError, ValueError) as e:
+                logging.error(f"connection with {peer} failed: {e}")
+                break
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        logging.info(f"coordinator {peer} disconnected.")
+
+
+def encodesegment(path, job):
+    """
+    Encode a segment sent by a coordinator, using the local VP9 profile.
+
+    Arguments:
+        path: name of the file containing the segment.
+        job: dictionary with the crop, tc (tile columns), subt (index of the
+            subtitle track or None), width, height and length (in seconds)
+            settings.
+
+    Returns:
+        A 3-tuple of the return code of the last pass that was run, a list
+        of summaries of the passes and the name of the encoded segment.
+    """
+    try:
+        crop = job.get("crop")
+        if crop and not re.fullmatch(r"\d+:\d+:\d+:\d+", crop):
+            raise ValueError(f"invalid cropping {crop!r}")
+        tc = int(job["tc"])
+        width, height = int(job["width"]), int(job["height"])
+        total = float(job["length"])
+        subt = None if job.get("subt") is None else str(int(job["subt"]))
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"invalid job: {e}")
+        return -1, [], None
+    profile = loadprofile().get(resclass(width, height), {})
+    ka = dict(crop=crop, subt=subt, audio=False, profile=profile)
+    args1 = mkargs(path, 1, tc, **ka)
+    args2 = mkargs(path, 2, tc, **ka)
+    # The coordinator knows the length; probing the segment would fill the
+    # shared probe cache with temporary files.
+    records = []
+    rv, _ = firstpass(args1, total, 0, records)
+    if rv == 0:
+        rv, rec = runpass(args2, 2, total, 0)
+        records.append(rec)
+    if rv == 0:
+        learn(records, width, height)
+    return rv, records, args2[-1]
+
+
+def cutsegment(fn, start, length, subt, outname):
+    """
+    Cut a segment of the video (and subtitle) stream of a file.
+
+    DVD video uses open GOPs, so the first frames of a segment that is copied
+    refer to frames of the previous segment. The video is therefore re-encoded
+    losslessly with FFV1, which only has intra frames.
+
+    Arguments:
+        fn: file path.
+        start: start of the segment in seconds.
+        length: length of the segment in seconds.
+        subt: Optional string containing the index of the dvdsub stream to copy.
+        outname: name of the Matroska file to write.
+
+    Returns:
+        The return code of ffmpeg.
+    """
+    args = ["ffmpeg", "-loglevel", "quiet", "-ss", sec2ts(start), "-i", fn]
+    args += ["-t", sec2ts(length), "-map", "0:v:0"]
+    if subt is not None:
+        args += ["-map", f"0:s:{subt}"]
+    args += ["-c:v", "ffv1", "-level", "3", "-g", "1", "-c:s", "copy"]
+    args += ["-f", "matroska", "-y", outname + ".tmp"]
+    rv = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL).returncode
+    if rv == 0:
+        os.replace(outname + ".tmp", outname)
+    return rv
+
+
+class Coordinator:
+    """
+    Send keyframe-aligned segments of a title to workers over TCP, and collect
+    the encoded segments.
+
+    Every worker address gets its own connection and thread. Giving an address
+    more than once makes that worker encode several segments at the same time.
+    A segment that fails is sent again, to any worker, up to maxtries times.
+    A worker whose connection fails, or that fails two segments in a row, is
+    not used anymore.
+    """
+
+    def __init__(self, fn, chunks, settings, workdir, subt=None, maxtries=3):
+        """
+        Arguments:
+            fn: file path.
+            chunks: list of (start, length) tuples of the segments in seconds.
+            settings: dictionary of encoding settings for the workers; see
+                encodesegment.
+            workdir: directory for the segments.
+            subt: Optional string containing the index of the dvdsub stream.
+            maxtries: number of times a segment may be sent.
+        """
+        self.fn = fn
+        self.chunks = chunks
+        self.settings = dict(settings, subt=None if subt is None else 0)
+        self.workdir = workdir
+        self.subt = subt
+        self.maxtries = maxtries
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()
+        self.records = []
+        self.stats = []
+
+    def segname(self, idx):
+        """Return the name of the encoded segment idx."""
+        return os.path.join(self.workdir, f"seg{idx:04d}.webm")
+
+    def run(self, workers):
+        """
+        Encode all segments on the given workers.
+
+        Arguments:
+            workers: list of HOST:PORT strings.
+
+        Returns:
+            True if all segments were encoded, False otherwise.
+        """
+        for idx in range(len(self.chunks)):
+            self.jobs.put((idx, 0))
+        threads = []
+        for addr in workers:
+            stat = {"worker": addr, "segments": 0, "failures": 0, "seconds": 0.0}
+            stat.update(length=0.0, sent=0, received=0)
+            self.stats.append(stat)
+            t = threading.Thread(target=self._feed, args=(addr, stat), daemon=True)
+            t.start()
+            threads.append(t)
+        finished, ok = set(), True
+        while len(finished) < len(self.chunks):
+            try:
+                idx, success = self.done.get(timeout=1)
+            except queue.Empty:
+                if not any(t.is_alive() for t in threads):
+                    logging.error("there are no workers left.")
+                    ok = False
+                    break
+                continue
+            if not success:
+                ok = False
+                break
+            finished.add(idx)
+            logging.info(f"{len(finished)} of {len(self.chunks)} segments done.")
+        for _ in threads:
+            self.jobs.put(None)
+        if ok:
+            for t in threads:
+                t.join()
+        return ok
+
+    def report(self):
+        """Log the throughput of every worker."""
+        merged = {}
+        for stat in self.stats:
+            m = merged.setdefault(stat["worker"], dict.fromkeys(stat, 0))
+            for key, value in stat.items():
+                if key != "worker":
+                    m[key] += value
+        for addr, m in merged.items():
+            speed = m["length"] / m["seconds"] if m["seconds"] else 0.0
+            mib = (m["sent"] + m["received"]) / 2**20
+            logging.info(
+                f"worker {addr}: {m['segments']} segments, {m['failures']} failures, "
+                f"{speed:.2f}× real time, {mib:.1f} MiB transferred."
+            )
+
+    def _retry(self, idx, tries):
+        """Queue a failed segment again, unless it has been tried too often."""
+        if tries + 1 < self.maxtries:
+            self.jobs.put((idx, tries + 1))
+        else:
+            logging.error(f"segment {idx} failed {self.maxtries} times.")
+            self.done.put((idx, False))
+
+    def _feed(self, addr, stat):
+        """Send segments to a worker until there are none left."""
+        try:
+            sock = socket.create_connection(parseaddr(addr))
+        except (OSError, ValueError) as e:
+            logging.error(f"cannot connect to worker {addr}: {e}")
+            return
+        strikes = 0
+        with sock, sock.makefile("rb") as rfile:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                idx, tries = job
+                start, length = self.chunks[idx]
+                srcname = os.path.join(self.workdir, f"seg{idx:04d}.mkv")
+                if not os.path.exists(srcname):
+                    rv = cutsegment(self.fn, start, length, self.subt, srcname)
+                    if rv:
+                        logging.error(f"cutting segment {idx} returned {rv}.")
+                        self.done.put((idx, False))
+                        continue
+                begin = datetime.now()
+                try:
+                    msg = dict(self.settings, segment=idx, length=length)
+                    sendmsg(sock, msg, srcname)
+                    reply = recvmsg(rfile, self.segname(idx))
+                    if reply is None:
+                        raise ConnectionError("connection closed")
+                except (OSError, ValueError) as e:
+                    logging.error(f"worker {addr} failed: {e}")
+                    stat["failures"] += 1
+                    self._retry(idx, tries)
+                    return
+                stat["seconds"] += (datetime.now() - begin).total_seconds()
+                stat["sent"] += os.path.getsize(srcname)
+                if reply.get("returncode"):
+                    rv = reply.get("returncode")
+                    logging.warning(f"segment {idx} returned {rv} on {addr}.")
+                    stat["failures"] += 1
+                    self._retry(idx, tries)
+                    strikes += 1
+                    if strikes > 1:
+                        logging.error(f"not using worker {addr} anymore.")
+                        return
+                    continue
+                strikes = 0
+                stat["received"] += os.path.getsize(self.segname(idx))
+                stat["segments"] += 1
+                stat["length"] += length
+                for rec in reply.get("records", []):
+                    rec["worker"] = addr
+                    self.records.append(rec)
+                os.remove(srcname)
+                self.done.put((idx, True))
+
+
+def distribute(
+    fn,
+    workers,
+    n,
+    settings,
+    start=None,
+    atrack=0,
+    subt=None,
+    loudnorm=False,
+    dummy=False,
+    records=None,
+):
+    """
+    Encode a title as n keyframe-aligned segments on workers.
+
+    The audio is encoded locally in the meantime. Afterwards the segments and
+    the audio are concatenated into the output file without re-encoding.
+
+    Arguments:
+        fn: file path.
+        workers: list of HOST:PORT strings of the workers.
+        n: requested number of segments.
+        settings: dictionary of encoding settings; see encodesegment.
+        start: Optional string containing the start time for the conversion.
+        atrack: Optional number of the audio track to use. Defaults to 0.
+        subt: Optional string containing the index of the dvdsub stream to use.
+        loudnorm: Boolean to indicate that the loudness of the audio should be
+            normalized. Since the audio is encoded in a single pass here, the
+            loudnorm filter is used in its dynamic mode.
+        dummy: Boolean to indicate that the commands should only be printed.
+        records: Optional list to which the summaries of the passes are appended.
+
+    Returns:
+        A 2-tuple of the original movie size in bytes and the encoded movie
+        size in bytes, or None for a dummy run.
+    """
+    begin = ts2sec(start) if start else 0.0
+    chunks = segments(keyframes(fn), begin, duration(fn), n)
+    logging.info(f"encoding {len(chunks)} segments on {len(workers)} workers.")
+    workdir = tempfile.mkdtemp(prefix="dvd2webm-", dir=os.path.dirname(fn) or ".")
+    coordinator = Coordinator(fn, chunks, settings, workdir, subt)
+    audioname = os.path.join(workdir, "audio.webm")
+    aargs = ["ffmpeg", "-loglevel", "quiet"]
+    if start:
+        aargs += ["-ss", start]
+    aargs += ["-i", fn, "-vn", "-sn", "-map", f"0:a:{atrack}", "-c:a", "libvorbis"]
+    if loudnorm:
+        aargs += ["-af", f"loudnorm={loudtarget}", "-ar", "48000"]
+    aargs += ["-q:a", "3", "-f", "webm", "-y", audioname]
+    listname = os.path.join(workdir, "segments.txt")
+    outname = fn.rsplit(".", 1)[0] + ".webm"
+    cargs = ["ffmpeg", "-loglevel", "quiet", "-f", "concat", "-safe", "0"]
+    cargs += ["-i", listname, "-i", audioname, "-map", "0:v", "-map", "1:a"]
+    cargs += ["-c", "copy", "-f", "webm", "-y", outname]
+    if dummy:
+        for idx, (cstart, clen) in enumerate(chunks):
+            logging.info(f"segment {idx}: {sec2ts(cstart)} + {sec2ts(clen)}")
+        logging.info("audio: " + " ".join(aargs))
+        logging.info("concatenation: " + " ".join(cargs))
+        shutil.rmtree(workdir)
+        return None
+    origsize = os.path.getsize(fn)
+    try:
+        audio = sp.Popen(aargs, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        ok = coordinator.run(workers)
+        if records is not None:
+            records += coordinator.records
+        coordinator.report()
+        if not ok:
+            audio.kill()
+        if audio.wait():
+            logging.error(f"audio encoding returned {audio.returncode}.")
+            ok = False
+        if not ok:
+            return origsize, 0
+        with open(listname, "w") as lf:
+            for idx in range(len(chunks)):
+                lf.write(f"file '{os.path.abspath(coordinator.segname(idx))}'\n")
+        proc = sp.run(cargs, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        if proc.returncode:
+            logging.error(f"concatenation returned {proc.returncode}.")
+            return origsize, 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    newsize = os.path.getsize(outname)
+    percentage = int(100 * newsize / origsize)
+    logging.info(f"the size of '{outname}' is {percentage}% of the size of '{fn}'.")
+    return origsize, newsize
+
+
 if __name__ == "__main__":
     main()
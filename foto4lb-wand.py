@@ -5,7 +5,7 @@
 # Copyright © 2011-2021 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2011-11-07T21:40:58+01:00
-# Last modified: 2021-09-18T17:56:18+0200
+# Last modified: 2026-10-17T15:31:09+0200
 """Shrink fotos to a size suitable for use in my logbook."""
 
 from datetime import datetime
@@ -15,12 +15,14 @@ import argparse
 import concurrent.futures as cf
 import logging
 import os
+import resource
+import struct
 import sys
 
 from wand.exceptions import MissingDelegateError
 from wand.image import Image
 
-__version__ = "2021.09.18"
+__version__ = "2026.10.17"
 outdir = "foto4lb"
 extensions = (".jpg", ".jpeg", ".raw")
 
@@ -59,10 +61,14 @@ def main():
         1: "file '{}' is not an image, skipped.",
         2: "error running convert on '{}'.",
     }
-    with cf.ProcessPoolExecutor(max_workers=os.cpu_count()) as tp:
-        agen = ((p, fn, args.width) for p, flist in pairs for fn in flist)
-        for fn, rv in tp.map(processfile, agen):
+    jobs = [(p, fn, args.width) for p, flist in pairs for fn in flist]
+    costs = [footprint(p + os.sep + fn) for p, fn, _ in jobs]
+    workers = os.cpu_count()
+    with cf.ProcessPoolExecutor(max_workers=workers) as tp:
+        budget = args.memory * 2**20
+        for _, (fn, rv) in admit(tp, workers, processfile, jobs, costs, budget):
             logging.info(infodict[rv].format(fn))
+    logging.info(f"peak resident memory {peakrss()} MiB in one process.")
 
 
 def setup():
@@ -75,6 +81,14 @@ def setup():
         type=int,
         help="width of the images in pixels (default 886)",
     )
+    parser.add_argument(
+        "-m",
+        "--memory",
+        type=int,
+        default=physmem() * 3 // 4,
+        help="memory in MiB for decoding images at the same time "
+        "(default 3/4 of physical memory, 0 for no limit)",
+    )
     parser.add_argument(
         "--log",
         default="warning",
@@ -96,6 +110,173 @@ def setup():
     return args
 
 
+def physmem():
+    """Return the amount of physical memory in MiB, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def peakrss():
+    """
+    Return the largest peak resident set size in MiB of this process and its
+    finished child processes.
+    """
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return rss // 1024  # ru_maxrss is in KiB.
+
+
+def admit(pool, workers, func, jobs, costs, budget):
+    """
+    Run jobs in a pool within a memory budget.
+
+    A job is only submitted when its estimated memory use fits in what the
+    running jobs leave of the budget. Smaller jobs further down the list can go
+    ahead of a large job that does not fit yet. A job that is larger than the
+    whole budget is run on its own.
+
+    Arguments:
+        pool: concurrent.futures.Executor to run the jobs in.
+        workers: maximum number of jobs to run at the same time.
+        func: function to call with every job.
+        jobs: list of the arguments for func.
+        costs: list of the estimated memory use of every job, in bytes.
+        budget: memory budget in bytes. If 0, there is no limit.
+
+    Yields:
+        (job, result) tuples as the jobs finish.
+    """
+    pending = list(zip(jobs, costs))
+    running = {}
+    used = peak = 0
+    while pending or running:
+        for item in list(pending):
+            if len(running) >= workers:
+                break
+            job, cost = item
+            if running and budget and used + cost > budget:
+                continue
+            pending.remove(item)
+            running[pool.submit(func, job)] = item
+            used += cost
+        peak = max(peak, used)
+        done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+        for fut in done:
+            job, cost = running.pop(fut)
+            used -= cost
+            yield job, fut.result()
+    logging.info(f"estimated peak memory use {peak // 2**20} MiB.")
+
+
+def footprint(fname):
+    """
+    Estimate the memory that ImageMagick needs to process an image, from its
+    dimensions. It uses 8 bytes per pixel, and needs room for a second copy
+    when resizing.
+
+    Arguments:
+        fname: name of the image file.
+
+    Returns:
+        The estimated memory use in bytes.
+    """
+    size = imagesize(fname)
+    if size is None:
+        # Compressed photos are typically one tenth of their RGB size.
+        return 10 * os.path.getsize(fname)
+    w, h = size
+    return 16 * w * h
+
+
+def imagesize(fname):
+    """
+    Read the dimensions of an image from its headers.
+
+    For JPEG files they are read from the start of frame segment. For TIFF-based
+    files (like most RAW formats) the largest image in IFD0 and its SubIFDs is
+    used.
+
+    Arguments:
+        fname: name of the JPEG or TIFF file.
+
+    Returns:
+        A (width, height) tuple, or None if the size cannot be read.
+    """
+    try:
+        with open(fname, "rb") as f:
+            start = f.read(8)
+            if start[:2] == b"\xff\xd8":
+                f.seek(2)
+                while True:
+                    marker, size = struct.unpack(">HH", f.read(4))
+                    if marker & 0xFFF0 == 0xFFC0 and marker not in (0xFFC4, 0xFFC8):
+                        h, w = struct.unpack(">xHH", f.read(5))
+                        return w, h
+                    if marker in (0xFFDA, 0xFFD9) or size < 2:
+                        return None
+                    f.seek(size - 2, 1)
+            order = {b"II": "<", b"MM": ">"}[start[:2]]
+            (offset,) = struct.unpack(order + "L", start[4:])
+            ifd0 = readifd(f, 0, offset, order)
+            ifds = [ifd0]
+            if 0x014A in ifd0:  # SubIFDs
+                typ, count, pos = ifd0[0x014A]
+                if count == 1:
+                    offsets = [pos]
+                else:
+                    f.seek(pos)
+                    offsets = struct.unpack(order + "L" * count, f.read(4 * count))
+                ifds += [readifd(f, 0, o, order) for o in offsets[:16]]
+            sizes = [
+                (ifdvalue(ifd, 0x0100, order), ifdvalue(ifd, 0x0101, order))
+                for ifd in ifds
+            ]
+            w, h = max(sizes, key=lambda s: s[0] * s[1])
+            if w * h:
+                return w, h
+    except (OSError, KeyError, struct.error, ValueError):
+        pass
+    return None
+
+
+def ifdvalue(ifd, tag, order="<"):
+    """
+    Return the value of a tag with a single SHORT or LONG value, or 0 if the tag
+    is not in the IFD.
+    """
+    typ, count, value = ifd.get(tag, (4, 1, 0))
+    if typ == 3:  # SHORT; stored in the first two bytes of the field.
+        return value >> 16 if order == ">" else value & 0xFFFF
+    return value
+
+
+def readifd(f, base, offset, order):
+    """
+    Read the entries of a TIFF image file directory.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+        offset: offset of the IFD relative to the TIFF header.
+        order: “<” for little-endian or “>” for big-endian data.
+
+    Returns:
+        A dictionary mapping tags to (type, count, value or offset) tuples.
+    """
+    f.seek(base + offset)
+    (n,) = struct.unpack(order + "H", f.read(2))
+    data = f.read(12 * n)
+    rv = {}
+    for j in range(0, len(data) - 11, 12):
+        tag, typ, count, value = struct.unpack(order + "HHLL", data[j : j + 12])
+        rv[tag] = (typ, count, value)
+    return rv
+
+
 def processfile(packed):
     """
     Read an image file and write a smaller version.
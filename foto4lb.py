@@ -5,26 +5,41 @@
 # Copyright © 2011-2019 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2011-11-07T21:40:58+01:00
-# Last modified: 2020-04-01T00:04:01+0200
+# Last modified: 2026-10-17T15:20:41+0200
 """Shrink fotos to a size suitable for use in my logbook."""
 
 from datetime import datetime
+from functools import partial
 import argparse
 import concurrent.futures as cf
+import io
+import json
 import logging
 import os
+import resource
+import struct
 import subprocess as sp
 import sys
 
 # For performance measurments
 # import time
 
-from PIL import Image
-from PIL.ExifTags import TAGS
+from PIL import Image, ImageFilter, UnidentifiedImageError
 
-__version__ = "2020.04.01"
+__version__ = "2026.10.17"
 outdir = "foto4lb"
-extensions = (".jpg", ".jpeg", ".raw")
+manifestname = ".foto4lb-manifest.json"
+rawextensions = (".raw", ".rw2", ".nef", ".cr2", ".arw", ".dng", ".orf", ".pef")
+extensions = (".jpg", ".jpeg") + rawextensions
+transposes = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
 
 
 def main():
@@ -32,19 +47,36 @@ def main():
     Entry point for foto4lb.
     """
     args = setup()
+    settings = {"width": args.width, "convert": args.convert}
+    settings["demosaic"] = args.demosaic
     pairs = []
+    manifests = {}
     count = 0
     for path in args.path:
-        if os.path.exists(path + os.sep + outdir):
-            logging.warning(
-                f'"{outdir}" already exists in "{path}", skipping this path.'
-            )
-            continue
+        odir = path + os.sep + outdir
         files = [
             f.name
             for f in os.scandir(path)
             if f.is_file() and f.name.lower().endswith(extensions)
         ]
+        if os.path.exists(odir):
+            if not args.incremental:
+                logging.warning(
+                    f'"{outdir}" already exists in "{path}", skipping this path.'
+                )
+                continue
+            manifest = loadmanifest(odir, settings)
+            for name in [n for n in manifest if n not in files]:
+                logging.info(f"source of '{name}' is gone, removing its output.")
+                try:
+                    os.remove(odir + os.sep + outname(name))
+                except FileNotFoundError:
+                    pass
+                del manifest[name]
+            files = [f for f in files if manifest.get(f) != fileid(path, f)]
+        else:
+            manifest = {}
+        manifests[path] = manifest
         count += len(files)
         pairs.append((path, files))
         logging.debug(f'Path: "{path}"')
@@ -55,18 +87,36 @@ def main():
     logging.info(f"found {count} files.")
     logging.info("creating output directories.")
     for dirname, _ in pairs:
-        os.mkdir(dirname + os.sep + outdir)
+        os.makedirs(dirname + os.sep + outdir, exist_ok=True)
     infodict = {
         0: "file '{}' processed.",
         1: "file '{}' is not an image, skipped.",
-        2: "error running convert on '{}'.",
+        2: "error converting '{}'.",
     }
     # For performance measurements.
     # start = time.monotonic()
-    with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
-        agen = ((p, fn, args.width) for p, flist in pairs for fn in flist)
-        for fn, rv in tp.map(processfile, agen):
-            logging.info(infodict[rv].format(fn))
+    # Pillow does the work in-process, so it needs processes to use all cores.
+    # The convert subprocesses only need threads to wait for them.
+    Pool = cf.ThreadPoolExecutor if args.convert else cf.ProcessPoolExecutor
+    jobs = [
+        (p, fn, args.width, args.convert, args.demosaic)
+        for p, flist in pairs
+        for fn in flist
+    ]
+    costs = [footprint(job) for job in jobs]
+    budget = args.memory * 2**20
+    workers = os.cpu_count()
+    try:
+        with Pool(max_workers=workers) as tp:
+            for job, (fn, rv) in admit(tp, workers, processfile, jobs, costs, budget):
+                logging.info(infodict[rv].format(fn))
+                if rv == 0:
+                    path, name = job[:2]
+                    manifests[path][name] = fileid(path, name)
+    finally:
+        for path, manifest in manifests.items():
+            savemanifest(path + os.sep + outdir, settings, manifest)
+    logging.info(f"peak resident memory {peakrss()} MiB in one process.")
     # For performance measurements.
     # dt = time.monotonic() - start
     # logging.info(f'startup preparations took {dt:.2f} s')
@@ -82,6 +132,33 @@ def setup():
         type=int,
         help="width of the images in pixels (default 886)",
     )
+    parser.add_argument(
+        "-c",
+        "--convert",
+        action="store_true",
+        help="use ImageMagick's convert for all files instead of Pillow",
+    )
+    parser.add_argument(
+        "-d",
+        "--demosaic",
+        action="store_true",
+        help="demosaic RAW files with convert instead of using their embedded preview",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help=f"only process new or changed files in directories that have a "
+        f'"{outdir}" directory already, and remove outputs of deleted files',
+    )
+    parser.add_argument(
+        "-m",
+        "--memory",
+        type=int,
+        default=physmem() * 3 // 4,
+        help="memory in MiB for decoding images at the same time "
+        "(default 3/4 of physical memory, 0 for no limit)",
+    )
     parser.add_argument(
         "--log",
         default="warning",
@@ -100,47 +177,409 @@ def setup():
     if not args.path:
         parser.print_help()
         sys.exit(0)
-    # Check for required programs.
+    # Check for required programs. Without --convert or --demosaic, the convert
+    # program is only needed for files that Pillow cannot read.
     try:
         sp.run(["convert"], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
         logging.debug("found “convert”")
     except FileNotFoundError:
-        logging.error("the program “convert” cannot be found")
-        sys.exit(1)
+        if args.convert or args.demosaic:
+            logging.error("the program “convert” cannot be found")
+            sys.exit(1)
+        logging.warning("the program “convert” cannot be found")
     return args
 
 
+def physmem():
+    """Return the amount of physical memory in MiB, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def peakrss():
+    """
+    Return the largest peak resident set size in MiB of this process and its
+    finished child processes.
+    """
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return rss // 1024  # ru_maxrss is in KiB.
+
+
+def admit(pool, workers, func, jobs, costs, budget):
+    """
+    Run jobs in a pool within a memory budget.
+
+    A job is only submitted when its estimated memory use fits in what the
+    running jobs leave of the budget. Smaller jobs further down the list can go
+    ahead of a large job that does not fit yet. A job that is larger than the
+    whole budget is run on its own.
+
+    Arguments:
+        pool: concurrent.futures.Executor to run the jobs in.
+        workers: maximum number of jobs to run at the same time.
+        func: function to call with every job.
+        jobs: list of the arguments for func.
+        costs: list of the estimated memory use of every job, in bytes.
+        budget: memory budget in bytes. If 0, there is no limit.
+
+    Yields:
+        (job, result) tuples as the jobs finish.
+    """
+    pending = list(zip(jobs, costs))
+    running = {}
+    used = peak = 0
+    while pending or running:
+        for item in list(pending):
+            if len(running) >= workers:
+                break
+            job, cost = item
+            if running and budget and used + cost > budget:
+                continue
+            pending.remove(item)
+            running[pool.submit(func, job)] = item
+            used += cost
+        peak = max(peak, used)
+        done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+        for fut in done:
+            job, cost = running.pop(fut)
+            used -= cost
+            yield job, fut.result()
+    logging.info(f"estimated peak memory use {peak // 2**20} MiB.")
+
+
+def footprint(packed):
+    """
+    Estimate the memory needed to process an image, from its dimensions.
+
+    Pillow keeps RGB images as 4 bytes per pixel, at the reduced scale that
+    shrink() decodes JPEG images at. ImageMagick uses 8 bytes per pixel, and
+    needs room for a second copy when resizing.
+
+    Arguments:
+        packed: A 5-tuple of (path, filename, output width, convert, demosaic)
+
+    Returns:
+        The estimated memory use in bytes.
+    """
+    path, name, newwidth, convert, demosaic = packed
+    fname = os.sep.join([path, name])
+    size = imagesize(fname)
+    if size is None:
+        # Compressed photos are typically one tenth of their RGB size.
+        return 10 * os.path.getsize(fname)
+    w, h = size
+    if convert or (demosaic and name.lower().endswith(rawextensions)):
+        return 16 * w * h
+    scale = 1
+    while scale < 8 and w // (2 * scale) >= newwidth and h // (2 * scale) >= newwidth:
+        scale *= 2
+    return 4 * (w // scale) * (h // scale)
+
+
+def imagesize(fname):
+    """
+    Read the dimensions of an image from its headers.
+
+    For JPEG files they are read from the start of frame segment. For TIFF-based
+    files (like most RAW formats) the largest image in IFD0 and its SubIFDs is
+    used.
+
+    Arguments:
+        fname: name of the JPEG or TIFF file.
+
+    Returns:
+        A (width, height) tuple, or None if the size cannot be read.
+    """
+    try:
+        with open(fname, "rb") as f:
+            start = f.read(8)
+            if start[:2] == b"\xff\xd8":
+                f.seek(2)
+                while True:
+                    marker, size = struct.unpack(">HH", f.read(4))
+                    if marker & 0xFFF0 == 0xFFC0 and marker not in (0xFFC4, 0xFFC8):
+                        h, w = struct.unpack(">xHH", f.read(5))
+                        return w, h
+                    if marker in (0xFFDA, 0xFFD9) or size < 2:
+                        return None
+                    f.seek(size - 2, 1)
+            order = {b"II": "<", b"MM": ">"}[start[:2]]
+            (offset,) = struct.unpack(order + "L", start[4:])
+            ifd0 = readifd(f, 0, offset, order)
+            ifds = [ifd0]
+            if 0x014A in ifd0:  # SubIFDs
+                typ, count, pos = ifd0[0x014A]
+                if count == 1:
+                    offsets = [pos]
+                else:
+                    f.seek(pos)
+                    offsets = struct.unpack(order + "L" * count, f.read(4 * count))
+                ifds += [readifd(f, 0, o, order) for o in offsets[:16]]
+            sizes = [
+                (ifdvalue(ifd, 0x0100, order), ifdvalue(ifd, 0x0101, order))
+                for ifd in ifds
+            ]
+            w, h = max(sizes, key=lambda s: s[0] * s[1])
+            if w * h:
+                return w, h
+    except (OSError, KeyError, struct.error, ValueError):
+        pass
+    return None
+
+
+def fileid(path, name):
+    """Return the size and modification time of a file, to detect changes."""
+    st = os.stat(path + os.sep + name)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def loadmanifest(odir, settings):
+    """
+    Read the manifest of an output directory.
+
+    Arguments:
+        odir: output directory.
+        settings: dictionary of the current output settings.
+
+    Returns:
+        A dictionary mapping the names of the processed source files to their
+        fileid. It is empty if there is no manifest, or if it was made with
+        other settings.
+    """
+    try:
+        with open(odir + os.sep + manifestname) as mf:
+            manifest = json.load(mf)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("settings") != settings:
+        logging.info(f"settings for '{odir}' have changed, processing all files.")
+        return {}
+    return manifest.get("files", {})
+
+
+def savemanifest(odir, settings, files):
+    """
+    Atomically write the manifest of an output directory.
+
+    Arguments:
+        odir: output directory.
+        settings: dictionary of the output settings.
+        files: dictionary mapping the names of the processed source files to
+            their fileid.
+    """
+    name = odir + os.sep + manifestname
+    with open(name + ".tmp", "w") as mf:
+        json.dump({"settings": settings, "files": files}, mf)
+    os.replace(name + ".tmp", name)
+
+
+def outname(name):
+    """Return the name of the output file for a source file."""
+    name = name.lower()
+    if name.endswith(rawextensions):
+        name = os.path.splitext(name)[0] + ".jpg"
+    return name
+
+
 def processfile(packed):
     """
     Read an image file and write a smaller version.
 
+    Files that Pillow can read are shrunk in-process, unless convert is True.
+    For RAW files the largest embedded JPEG preview is shrunk, unless demosaic
+    is True. Other files, and RAW files without a usable preview, are handed
+    to ImageMagick's convert.
+
     Arguments:
-        packed: A 3-tuple of (path, filename, output width)
+        packed: A 5-tuple of (path, filename, output width, convert, demosaic)
 
     Returns:
         A 2-tuple (input file name, status).
         Status 0 indicates a succesful conversion,
         status 1 means that the input file was not a recognized image format,
-        status 2 means a subprocess error.
+        status 2 means a conversion error.
     """
     # For performance measurements.
     # start = time.monotonic()
-    path, name, newwidth = packed
+    path, name, newwidth, convert, demosaic = packed
     fname = os.sep.join([path, name])
-    oname = os.sep.join([path, outdir, name.lower()])
-    try:
-        img = Image.open(fname)
-        ld = {}
-        for tag, value in img._getexif().items():
-            decoded = TAGS.get(tag, tag)
-            ld[decoded] = value
-        want = set(["DateTime", "DateTimeOriginal", "CreateDate", "DateTimeDigitized"])
-        available = sorted(list(want.intersection(set(ld.keys()))))
-        fields = ld[available[0]].replace(" ", ":").split(":")
-        dt = datetime(*map(int, fields))
-    except Exception:
-        logging.warning("exception raised when reading the file time.")
+    oname = os.sep.join([path, outdir, outname(name)])
+    img, orientation = None, 1
+    if name.lower().endswith(rawextensions):
+        if not (convert or demosaic):
+            data, orientation = rawpreview(fname)
+            if data:
+                img = Image.open(io.BytesIO(data))
+        convert = img is None
+    elif not convert:
+        try:
+            img = Image.open(fname)
+        except UnidentifiedImageError:
+            convert = True
+        except OSError:
+            return (fname, 1)
+    dt = exifdate(fname)
+    if dt is None:
+        logging.warning(f"cannot read the date of '{fname}'.")
         dt = datetime.today()
+    if convert:
+        rv = runconvert(fname, oname, newwidth)
+    else:
+        with img:
+            rv = shrink(img, oname, newwidth, orientation)
+    if rv != 0:
+        return (fname, rv)
+    modtime = dt.timestamp()
+    os.utime(oname, (modtime, modtime))
+    # For performance measurements.
+    # dt = time.monotonic() - start
+    # logging.info(f'processfile took {dt:.2f} s')
+    return (fname, 0)
+
+
+def shrink(img, oname, newwidth, orientation=1):
+    """
+    Shrink an image with Pillow and write it as a JPEG file.
+
+    For JPEG files, the image is decoded at the smallest scale (1/2, 1/4 or
+    1/8) that is still at least as large as the output. This removes most of
+    the decoding work. The metadata is not copied.
+
+    Arguments:
+        img: PIL.Image.Image instance, not yet loaded.
+        oname: name of the output file.
+        newwidth: width of the output in pixels.
+        orientation: Optional value of the EXIF Orientation tag. The image is
+            rotated or flipped accordingly. The default 1 leaves it as it is.
+
+    Returns:
+        0 on success, 2 if the image could not be converted.
+    """
+    w, h = img.size
+    turned = orientation in (5, 6, 7, 8)
+    if turned:
+        w, h = h, w
+    newheight = max(round(h * newwidth / w), 1)
+    size = (newheight, newwidth) if turned else (newwidth, newheight)
+    try:
+        img.draft("RGB", size)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        small = img.resize(size, Image.LANCZOS)
+        if orientation in transposes:
+            small = small.transpose(transposes[orientation])
+        small = small.filter(
+            ImageFilter.UnsharpMask(radius=0.5, percent=70, threshold=0)
+        )
+        small.save(oname, "JPEG", quality=80, dpi=(300, 300))
+    except (OSError, ValueError) as e:
+        logging.error(f"cannot shrink '{oname}': {e}")
+        return 2
+    return 0
+
+
+def rawpreview(fname):
+    """
+    Find the largest embedded JPEG preview in a TIFF-based RAW file.
+
+    All IFDs in the chain that starts at IFD0 are searched, as well as their
+    SubIFDs. Previews can be stored as JPEGInterchangeFormat, as a single
+    JPEG-compressed strip or (in Panasonic files) as JpgFromRaw. Lossless JPEG
+    data (the raw image in some formats) is skipped.
+
+    Arguments:
+        fname: name of the RAW file.
+
+    Returns:
+        A 2-tuple of the JPEG data (or None if there is no usable preview) and
+        the value of the Orientation tag.
+    """
+    candidates, orientation = [], 1
+    try:
+        with open(fname, "rb") as f:
+            header = f.read(8)
+            order = {b"II": "<", b"MM": ">"}[header[:2]]
+            (first,) = struct.unpack(order + "L", header[4:])
+            todo, seen = [first], set()
+            while todo:
+                offset = todo.pop()
+                if offset == 0 or offset in seen or len(seen) > 64:
+                    continue
+                seen.add(offset)
+                ifd = readifd(f, 0, offset, order)
+                (nxt,) = struct.unpack(order + "L", f.read(4))
+                todo.append(nxt)
+                value = partial(ifdvalue, ifd, order=order)
+                if offset == first and 0x0112 in ifd:
+                    orientation = value(0x0112)
+                if 0x0201 in ifd and 0x0202 in ifd:  # JPEGInterchangeFormat
+                    candidates.append((value(0x0202), value(0x0201)))
+                if value(0x0103) in (6, 7) and ifd.get(0x0111, (0, 0))[1] == 1:
+                    candidates.append((value(0x0117), value(0x0111)))
+                if 0x002E in ifd:  # JpgFromRaw
+                    candidates.append((ifd[0x002E][1], ifd[0x002E][2]))
+                if 0x014A in ifd:  # SubIFDs
+                    typ, count, pos = ifd[0x014A]
+                    if count == 1:
+                        todo.append(pos)
+                    elif count < 16:
+                        f.seek(pos)
+                        todo += struct.unpack(order + "L" * count, f.read(4 * count))
+            for length, offset in sorted(candidates, reverse=True):
+                f.seek(offset)
+                data = f.read(length)
+                if isbaseline(data):
+                    return data, orientation
+    except (OSError, KeyError, struct.error, ValueError):
+        pass
+    return None, orientation
+
+
+def ifdvalue(ifd, tag, order="<"):
+    """
+    Return the value of a tag with a single SHORT or LONG value, or 0 if the tag
+    is not in the IFD.
+    """
+    typ, count, value = ifd.get(tag, (4, 1, 0))
+    if typ == 3:  # SHORT; stored in the first two bytes of the field.
+        return value >> 16 if order == ">" else value & 0xFFFF
+    return value
+
+
+def isbaseline(data):
+    """Check if data is a JPEG image that Pillow can decode."""
+    if not data.startswith(b"\xff\xd8"):
+        return False
+    pos = 2
+    while pos + 4 <= len(data):
+        marker, size = struct.unpack(">HH", data[pos : pos + 4])
+        if marker in (0xFFC0, 0xFFC1, 0xFFC2):
+            return True
+        if marker & 0xFFF0 == 0xFFC0 and marker not in (0xFFC4, 0xFFC8, 0xFFCC):
+            return False  # Lossless or arithmetic coding.
+        if marker == 0xFFDA or size < 2:
+            return False
+        pos += 2 + size
+    return False
+
+
+def runconvert(fname, oname, newwidth):
+    """
+    Shrink an image with ImageMagick's convert.
+
+    Arguments:
+        fname: name of the input file.
+        oname: name of the output file.
+        newwidth: width of the output in pixels.
+
+    Returns:
+        0 on success, 2 if convert failed.
+    """
     args = [
         "convert",
         fname,
@@ -157,15 +596,112 @@ def processfile(packed):
         "80",
         oname,
     ]
-    rp = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    try:
+        rp = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    except FileNotFoundError:
+        return 2
     if rp.returncode != 0:
-        return (name, 2)
-    modtime = dt.timestamp()
-    os.utime(oname, (modtime, modtime))
-    # For performance measurements.
-    # dt = time.monotonic() - start
-    # logging.info(f'processfile took {dt:.2f} s')
-    return (fname, 0)
+        return 2
+    return 0
+
+
+def exifdate(path):
+    """
+    Read the date and time at which a photo was taken from its EXIF data.
+
+    Only the headers are read, never the image data. JPEG files are read up to
+    their APP1 segment; TIFF-based files (like most RAW formats) only in the
+    IFDs that are needed.
+
+    Arguments:
+        path: name of the JPEG or TIFF file.
+
+    Returns:
+        A datetime.datetime for the DateTimeOriginal, CreateDate or DateTime
+        tag, in that order of preference. None if none of these can be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            start = f.read(4)
+            if start[:2] in (b"II", b"MM"):
+                return tiffdate(f, 0)
+            if start[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker, size = struct.unpack(">HH", f.read(4))
+                if size < 2:
+                    return None
+                if marker == 0xFFE1:
+                    data = f.read(size - 2)
+                    if data.startswith(b"Exif\0\0"):
+                        return tiffdate(io.BytesIO(data), 6)
+                elif marker in (0xFFDA, 0xFFD9):  # Start of scan or end of image.
+                    return None
+                else:
+                    f.seek(size - 2, 1)
+    except (OSError, KeyError, struct.error, ValueError):
+        return None
+
+
+def tiffdate(f, base):
+    """
+    Read the date from the IFDs of TIFF data in a file.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+
+    Returns:
+        A datetime.datetime, or None.
+    """
+    f.seek(base)
+    header = f.read(8)
+    order = {b"II": "<", b"MM": ">"}[header[:2]]
+    (offset,) = struct.unpack(order + "L", header[4:])
+    ifd0 = readifd(f, base, offset, order)
+    tags = {}
+    if 0x8769 in ifd0:  # Exif IFD
+        exififd = readifd(f, base, ifd0[0x8769][2], order)
+        tags.update((k, exififd[k]) for k in (0x9003, 0x9004) if k in exififd)
+    if 0x0132 in ifd0:
+        tags[0x0132] = ifd0[0x0132]
+    for tag in (0x9003, 0x9004, 0x0132):  # DateTimeOriginal, CreateDate, DateTime
+        if tag not in tags:
+            continue
+        typ, count, value = tags[tag]
+        if typ != 2 or count < 19:
+            continue
+        f.seek(base + value)
+        text = f.read(19).decode("ascii", "replace")
+        try:
+            return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def readifd(f, base, offset, order):
+    """
+    Read the entries of a TIFF image file directory.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+        offset: offset of the IFD relative to the TIFF header.
+        order: “<” for little-endian or “>” for big-endian data.
+
+    Returns:
+        A dictionary mapping tags to (type, count, value or offset) tuples.
+    """
+    f.seek(base + offset)
+    (n,) = struct.unpack(order + "H", f.read(2))
+    data = f.read(12 * n)
+    rv = {}
+    for j in range(0, len(data) - 11, 12):
+        tag, typ, count, value = struct.unpack(order + "HHLL", data[j : j + 12])
+        rv[tag] = (typ, count, value)
+    return rv
 
 
 if __name__ == "__main__":
@@ -5,19 +5,24 @@
 # Copyright © 2011-2018 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2011-11-06T20:28:07+01:00
-# Last modified: 2020-04-01T20:06:20+0200
+# Last modified: 2026-10-17T14:31:40+0200
 """Script to add my copyright notice to photos."""
 
+from datetime import datetime
 from os import utime
-from time import mktime
 import argparse
 import concurrent.futures as cf
+import io
 import logging
 import os.path
+import struct
 import subprocess as sp
 import sys
+import threading
 
-__version__ = "2020.04.01"
+__version__ = "2026.10.17"
+local = threading.local()
+tools = []
 
 
 def main():
@@ -25,11 +30,20 @@ def main():
     Entry point for markphotos.
     """
     args = setup()
-    with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
-        for fn, rv in tp.map(processfile, args.files):
-            logging.info(f'file "{fn}" processed.')
-            if rv != 0:
-                logging.error(f'error processing "{fn}": {rv}')
+    # Divide the files over the workers, but in batches of at most args.batch
+    # files so the workers stay busy until the end.
+    size = max(1, min(args.batch, -(-len(args.files) // os.cpu_count())))
+    batches = [args.files[j : j + size] for j in range(0, len(args.files), size)]
+    try:
+        with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
+            for results in tp.map(processbatch, batches):
+                for fn, rv in results:
+                    logging.info(f'file "{fn}" processed.')
+                    if rv != 0:
+                        logging.error(f'error processing "{fn}": {rv}')
+    finally:
+        for tool in tools:
+            tool.close()
 
 
 def setup():
@@ -42,6 +56,13 @@ def setup():
         help="logging level (defaults to 'warning')",
     )
     parser.add_argument("-v", "--version", action="version", version=__version__)
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=int,
+        default=32,
+        help="maximum number of files per batch of exiftool commands (default 32)",
+    )
     parser.add_argument(
         "files", metavar="file", nargs="+", help="one or more files to process"
     )
@@ -62,48 +83,219 @@ def setup():
     return args
 
 
-def processfile(name):
+def processbatch(names):
     """
-    Add copyright notice to a file using exiftool.
+    Add a copyright notice to a batch of files, using the exiftool process of
+    the current thread.
 
     Arguments:
-        name: path of the file to change
+        names: list of paths of the files to change.
 
     Returns:
-        A 2-tuple of the file path and the return value of exiftool.
+        A list of 2-tuples of the file path and 0 for success, or a string
+        describing the error.
+    """
+    rv, dated, commands = [], [], []
+    for name in names:
+        dt = exifdate(name)
+        if dt is None:
+            rv.append((name, "no creation date found"))
+            continue
+        dated.append((name, dt))
+        commands.append(markargs(name, dt.year))
+    try:
+        outputs = exiftool().execute(commands)
+    except OSError as e:
+        return rv + [(name, f"exiftool failed: {e}") for name, _ in dated]
+    for (name, dt), output in zip(dated, outputs):
+        if "1 image files updated" not in output:
+            rv.append((name, output.strip() or "not updated"))
+            continue
+        modtime = int(dt.timestamp())
+        utime(name, (modtime, modtime))
+        rv.append((name, 0))
+    return rv
+
+
+def markargs(name, year):
+    """
+    Create the exiftool arguments that add the copyright notice to a file.
+
+    Arguments:
+        name: path of the file to change.
+        year: year of the copyright.
+
+    Returns:
+        A list of arguments.
     """
-    args = ["exiftool", "-CreateDate", name]
-    cp = sp.run(args, stdout=sp.PIPE, stderr=sp.DEVNULL, text=True)
-    fields = cp.stdout.split(":")
-    year = int(fields[1])
     cr = "R.F. Smith <rsmith@xs4all.nl> http://rsmith.home.xs4all.nl/"
     cmt = f"Copyright © {year} {cr}"
-    args = [
-        "exiftool",
-        f'-Copyright="Copyright (C) {year} {cr}"',
-        f'-Comment="{cmt}"',
+    return [
+        f"-Copyright=Copyright (C) {year} {cr}",
+        f"-Comment={cmt}",
         "-overwrite_original",
-        "-q",
         name,
     ]
-    cp = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    modtime = int(
-        mktime(
-            (
-                year,
-                int(fields[2]),
-                int(fields[3][:2]),
-                int(fields[3][3:]),
-                int(fields[4]),
-                int(fields[5]),
-                0,
-                0,
-                -1,
-            )
+
+
+def exiftool():
+    """Return the exiftool process of the current thread, starting it if needed."""
+    if not hasattr(local, "tool"):
+        local.tool = ExifTool()
+        tools.append(local.tool)
+    return local.tool
+
+
+class ExifTool:
+    """
+    Long-running exiftool process that reads its commands from a pipe.
+
+    Starting exiftool (a Perl program) takes much longer than changing the
+    tags of a photo. So a single process is used for many files.
+    """
+
+    def __init__(self):
+        args = ["exiftool", "-stay_open", "True", "-@", "-"]
+        self.proc = sp.Popen(
+            args,
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            stderr=sp.DEVNULL,
+            encoding="utf-8",
         )
-    )
-    utime(name, (modtime, modtime))
-    return name, cp.returncode
+
+    def execute(self, commands):
+        """
+        Send a batch of commands, and read their output.
+
+        Arguments:
+            commands: list of lists of arguments.
+
+        Returns:
+            A list containing the output of every command.
+        """
+        for num, args in enumerate(commands):
+            self.proc.stdin.write("\n".join(args) + f"\n-execute{num}\n")
+        self.proc.stdin.flush()
+        outputs = []
+        for num in range(len(commands)):
+            lines = []
+            for ln in self.proc.stdout:
+                if ln.strip() == f"{{ready{num}}}":
+                    break
+                lines.append(ln)
+            else:
+                raise OSError("exiftool stopped unexpectedly")
+            outputs.append("".join(lines))
+        return outputs
+
+    def close(self):
+        """Stop the exiftool process."""
+        try:
+            self.proc.stdin.write("-stay_open\nFalse\n")
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.wait()
+
+
+def exifdate(path):
+    """
+    Read the date and time at which a photo was taken from its EXIF data.
+
+    Only the headers are read, never the image data. JPEG files are read up to
+    their APP1 segment; TIFF-based files (like most RAW formats) only in the
+    IFDs that are needed.
+
+    Arguments:
+        path: name of the JPEG or TIFF file.
+
+    Returns:
+        A datetime.datetime for the DateTimeOriginal, CreateDate or DateTime
+        tag, in that order of preference. None if none of these can be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            start = f.read(4)
+            if start[:2] in (b"II", b"MM"):
+                return tiffdate(f, 0)
+            if start[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker, size = struct.unpack(">HH", f.read(4))
+                if size < 2:
+                    return None
+                if marker == 0xFFE1:
+                    data = f.read(size - 2)
+                    if data.startswith(b"Exif\0\0"):
+                        return tiffdate(io.BytesIO(data), 6)
+                elif marker in (0xFFDA, 0xFFD9):  # Start of scan or end of image.
+                    return None
+                else:
+                    f.seek(size - 2, 1)
+    except (OSError, KeyError, struct.error, ValueError):
+        return None
+
+
+def tiffdate(f, base):
+    """
+    Read the date from the IFDs of TIFF data in a file.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+
+    Returns:
+        A datetime.datetime, or None.
+    """
+    f.seek(base)
+    header = f.read(8)
+    order = {b"II": "<", b"MM": ">"}[header[:2]]
+    (offset,) = struct.unpack(order + "L", header[4:])
+    ifd0 = readifd(f, base, offset, order)
+    tags = {}
+    if 0x8769 in ifd0:  # Exif IFD
+        exififd = readifd(f, base, ifd0[0x8769][2], order)
+        tags.update((k, exififd[k]) for k in (0x9003, 0x9004) if k in exififd)
+    if 0x0132 in ifd0:
+        tags[0x0132] = ifd0[0x0132]
+    for tag in (0x9003, 0x9004, 0x0132):  # DateTimeOriginal, CreateDate, DateTime
+        if tag not in tags:
+            continue
+        typ, count, value = tags[tag]
+        if typ != 2 or count < 19:
+            continue
+        f.seek(base + value)
+        text = f.read(19).decode("ascii", "replace")
+        try:
+            return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def readifd(f, base, offset, order):
+    """
+    Read the entries of a TIFF image file directory.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+        offset: offset of the IFD relative to the TIFF header.
+        order: “<” for little-endian or “>” for big-endian data.
+
+    Returns:
+        A dictionary mapping tags to (type, count, value or offset) tuples.
+    """
+    f.seek(base + offset)
+    (n,) = struct.unpack(order + "H", f.read(2))
+    data = f.read(12 * n)
+    rv = {}
+    for j in range(0, len(data) - 11, 12):
+        tag, typ, count, value = struct.unpack(order + "HHLL", data[j : j + 12])
+        rv[tag] = (typ, count, value)
+    return rv
 
 
 if __name__ == "__main__":
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# file: mkindexpic.py
+# vim:fileencoding=utf-8:fdm=marker:ft=python
+#
+# Copyright © 2015-2026 R.F. Smith <rsmith@xs4all.nl>.
+# SPDX-License-Identifier: MIT
+# Created: 2015-05-08T22:12:45+02:00
+# Last modified: 2026-10-17T21:42:19+0200
+"""Make an index picture (contact sheet) of all pictures given as arguments."""
+
+from datetime import datetime
+import argparse
+import concurrent.futures as cf
+import hashlib
+import io
+import logging
+import os
+import struct
+import sys
+
+from PIL import Image, ImageDraw, ImageFont, PngImagePlugin, UnidentifiedImageError
+
+__version__ = "2026.10.17"
+cachedir = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "mkindexpic"
+)
+transposes = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def main():
+    """
+    Entry point for mkindexpic.
+    """
+    args = setup()
+    os.makedirs(args.cache, exist_ok=True)
+    font = ImageFont.load_default()
+    # The bitmap font that Pillow falls back to has no getmetrics().
+    lineheight = font.getbbox("Ag")[3] + 2
+    cellwidth = args.size + 2 * args.border
+    cellheight = args.size + 2 * args.border + 3 * lineheight
+    columns = min(args.tile, len(args.files))
+    rows = -(-len(args.files) // columns)
+    sheet = Image.new("RGB", (columns * cellwidth, rows * cellheight), "white")
+    draw = ImageDraw.Draw(sheet)
+    jobs = [(fn, args.size, args.cache) for fn in args.files]
+    decoded = skipped = 0
+    with cf.ProcessPoolExecutor(max_workers=os.cpu_count()) as pp:
+        futures = {pp.submit(thumbnail, job): n for n, job in enumerate(jobs)}
+        # Every thumbnail is pasted as soon as it is ready, and then dropped.
+        for fut in cf.as_completed(futures):
+            n = futures.pop(fut)
+            fn = args.files[n]
+            thumb, label, new = fut.result()
+            if thumb is None:
+                logging.warning(f"cannot read '{fn}', skipped.")
+                skipped += 1
+                continue
+            decoded += new
+            x, y = (n % columns) * cellwidth, (n // columns) * cellheight
+            tw, th = thumb.size
+            offset = ((cellwidth - tw) // 2, args.border + (args.size - th) // 2)
+            sheet.paste(thumb, (x + offset[0], y + offset[1]))
+            texttop = y + args.size + 2 * args.border
+            lines = [os.path.basename(fn)] + label
+            for k, line in enumerate(lines):
+                tw = draw.textlength(line, font=font)
+                pos = (x + (cellwidth - tw) / 2, texttop + k * lineheight)
+                draw.text(pos, line, fill="black", font=font)
+            logging.info(f"added '{fn}'.")
+    cached = len(jobs) - decoded - skipped
+    logging.info(f"decoded {decoded} images, {cached} were cached, {skipped} skipped.")
+    sheet.save(args.output, quality=85)
+    logging.info(f"wrote '{args.output}'.")
+
+
+def setup():
+    """Process the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="index.jpg",
+        help="name of the index picture (default index.jpg)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tile",
+        type=int,
+        default=8,
+        help="number of pictures per row (default 8)",
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        type=int,
+        default=120,
+        help="maximum width and height of the thumbnails in pixels (default 120)",
+    )
+    parser.add_argument(
+        "-b",
+        "--border",
+        type=int,
+        default=4,
+        help="space around the thumbnails in pixels (default 4)",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        default=cachedir,
+        help=f"directory for the thumbnail cache (default {cachedir})",
+    )
+    parser.add_argument(
+        "--log",
+        default="warning",
+        choices=["debug", "info", "warning", "error"],
+        help="logging level (defaults to 'warning')",
+    )
+    parser.add_argument("-v", "--version", action="version", version=__version__)
+    parser.add_argument("files", metavar="file", nargs="*", help="pictures to index")
+    args = parser.parse_args(sys.argv[1:])
+    logging.basicConfig(
+        level=getattr(logging, args.log.upper(), None),
+        format="%(levelname)s: %(message)s",
+    )
+    logging.debug(f"Command line arguments = {sys.argv}")
+    logging.debug(f"Parsed arguments = {args}")
+    if not args.files:
+        parser.print_help()
+        sys.exit(0)
+    if args.tile < 1 or args.size < 1 or args.border < 0:
+        parser.error("the tile and size must be positive, the border not negative")
+    return args
+
+
+def cachename(fname, size, cache):
+    """
+    Return the name of the cached thumbnail of a file.
+
+    The name is derived from the identity of the file (device, inode, size and
+    modification time) and the size of the thumbnail. So a changed file or
+    a different thumbnail size gets a new cache entry.
+    """
+    st = os.stat(fname)
+    key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{size}"
+    return os.path.join(cache, hashlib.sha1(key.encode()).hexdigest() + ".png")
+
+
+def thumbnail(packed):
+    """
+    Make a thumbnail of an image, or read it from the cache.
+
+    For JPEG files the image is decoded at the smallest scale that is still
+    larger than the thumbnail. The thumbnail is rotated according to the EXIF
+    orientation. The size of the original and its EXIF date are stored in the
+    cached PNG file as text.
+
+    Arguments:
+        packed: A 3-tuple of (file name, thumbnail size, cache directory)
+
+    Returns:
+        A 3-tuple of the thumbnail (or None if the file could not be read), the
+        label lines with the size and date, and 1 if the image was decoded or
+        0 if it came from the cache.
+    """
+    fname, size, cache = packed
+    try:
+        cname = cachename(fname, size, cache)
+    except OSError:
+        return None, [], 0
+    try:
+        with Image.open(cname) as img:
+            img.load()
+            return img.copy(), [img.text["size"], img.text["date"]], 0
+    except (OSError, KeyError):
+        pass
+    try:
+        with Image.open(fname) as img:
+            w, h = img.size
+            orientation = img.getexif().get(0x0112, 1)
+            img.draft("RGB", (size, size))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((size, size), Image.LANCZOS)
+            if orientation in transposes:
+                img = img.transpose(transposes[orientation])
+                if orientation >= 5:
+                    w, h = h, w
+            thumb = img.copy()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None, [], 0
+    dt = exifdate(fname)
+    label = [f"{w}x{h}", dt.strftime("%Y:%m:%d %H:%M:%S") if dt else ""]
+    info = PngImagePlugin.PngInfo()
+    info.add_text("size", label[0])
+    info.add_text("date", label[1])
+    try:
+        thumb.save(cname + ".tmp", "PNG", pnginfo=info)
+        os.replace(cname + ".tmp", cname)
+    except OSError as e:
+        logging.warning(f"cannot cache the thumbnail of '{fname}': {e}")
+    return thumb, label, 1
+
+
+def exifdate(path):
+    """
+    Read the date and time at which a photo was taken from its EXIF data.
+
+    Only the headers are read, never the image data. JPEG files are read up to
+    their APP1 segment; TIFF-based files (like most RAW formats) only in the
+    IFDs that are needed.
+
+    Arguments:
+        path: name of the JPEG or TIFF file.
+
+    Returns:
+        A datetime.datetime for the DateTimeOriginal, CreateDate or DateTime
+        tag, in that order of preference. None if none of these can be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            start = f.read(4)
+            if start[:2] in (b"II", b"MM"):
+                return tiffdate(f, 0)
+            if start[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker, size = struct.unpack(">HH", f.read(4))
+                if size < 2:
+                    return None
+                if marker == 0xFFE1:
+                    data = f.read(size - 2)
+                    if data.startswith(b"Exif\0\0"):
+                        return tiffdate(io.BytesIO(data), 6)
+                elif marker in (0xFFDA, 0xFFD9):  # Start of scan or end of image.
+                    return None
+                else:
+                    f.seek(size - 2, 1)
+    except (OSError, KeyError, struct.error, ValueError):
+        return None
+
+
+def tiffdate(f, base):
+    """
+    Read the date from the IFDs of TIFF data in a file.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+
+    Returns:
+        A datetime.datetime, or None.
+    """
+    f.seek(base)
+    header = f.read(8)
+    order = {b"II": "<", b"MM": ">"}[header[:2]]
+    (offset,) = struct.unpack(order + "L", header[4:])
+    ifd0 = readifd(f, base, offset, order)
+    tags = {}
+    if 0x8769 in ifd0:  # Exif IFD
+        exififd = readifd(f, base, ifd0[0x8769][2], order)
+        tags.update((k, exififd[k]) for k in (0x9003, 0x9004) if k in exififd)
+    if 0x0132 in ifd0:
+        tags[0x0132] = ifd0[0x0132]
+    for tag in (0x9003, 0x9004, 0x0132):  # DateTimeOriginal, CreateDate, DateTime
+        if tag not in tags:
+            continue
+        typ, count, value = tags[tag]
+        if typ != 2 or count < 19:
+            continue
+        f.seek(base + value)
+        text = f.read(19).decode("ascii", "replace")
+        try:
+            return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def readifd(f, base, offset, order):
+    """
+    Read the entries of a TIFF image file directory.
+
+    Arguments:
+        f: binary file object.
+        base: offset of the TIFF header in f.
+        offset: offset of the IFD relative to the TIFF header.
+        order: “<” for little-endian or “>” for big-endian data.
+
+    Returns:
+        A dictionary mapping tags to (type, count, value or offset) tuples.
+    """
+    f.seek(base + offset)
+    (n,) = struct.unpack(order + "H", f.read(2))
+    data = f.read(12 * n)
+    rv = {}
+    for j in range(0, len(data) - 11, 12):
+        tag, typ, count, value = struct.unpack(order + "HHLL", data[j : j + 12])
+        rv[tag] = (typ, count, value)
+    return rv
+
+
+if __name__ == "__main__":
+    main()
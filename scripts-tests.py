@@ -13,11 +13,19 @@ To run the tests use: py.test -v scripts-tests.py
 """
 
 from collections import Counter
+import struct
 
+import numpy as np
+
+from dicom2img import mklut
+from dvd2webm import votecrop
 from genotp import rndcaps, otp
 from genpw import roundup, genpw
+from markphotos import exifdate
 from nospaces import fixname
 from offsetsrt import str2ms, ms2str
+from vid2mp4 import plan
+from vid2webm import segments
 
 
 def test_rndcaps():
@@ -65,3 +73,70 @@ def test_srt():
         ts = ms2str(p)
         k = str2ms(ts)
         assert p == k
+
+
+def test_segments():
+    keys = [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+    rv = segments(keys, 0, 20, 4)
+    assert rv == [(0, 4), (4, 6), (10, 4), (14, 6)]
+    assert sum(ln for _, ln in rv) == 20
+    assert segments([], 0, 20, 4) == [(0, 20)]
+    assert segments(keys, 5, 20, 1) == [(5, 15)]
+
+
+def test_votecrop():
+    votes = ["720:576:0:0", "704:400:8:88", "704:400:8:88", None, "704:300:8:138"]
+    assert votecrop(votes) == "704:400:8:88"
+    assert votecrop(["704:400:8:88", "720:576:0:0"]) == "720:576:0:0"
+    assert votecrop([None, None]) is None
+
+
+def test_plan():
+    h264 = {"index": 0, "codec_type": "video", "codec_name": "h264"}
+    h264["pix_fmt"] = "yuv420p"
+    aac = {"index": 1, "codec_type": "audio", "codec_name": "aac"}
+    ac3 = {"index": 1, "codec_type": "audio", "codec_name": "ac3"}
+    mpeg2 = {"index": 0, "codec_type": "video", "codec_name": "mpeg2video"}
+    args, action = plan([h264, aac], 29, "medium", 4)
+    assert action == "remux"
+    assert args == ["-map", "0:0", "-c:v", "copy", "-map", "0:1", "-c:a", "copy"]
+    args, action = plan([h264, ac3], 29, "medium", 4)
+    assert action == "audio conversion"
+    assert args[-2:] == ["-c:a", "aac"]
+    args, action = plan([mpeg2, aac], 29, "medium", 4)
+    assert action == "transcode"
+    assert "libx264" in args
+    assert plan([aac], 29, "medium", 4) == (None, "transcode")
+
+
+def test_exifdate(tmp_path):
+    # Big-endian TIFF with an Exif IFD holding DateTimeOriginal.
+    date = b"2018:07:21 10:11:12\0"
+    tiff = b"MM\0*" + struct.pack(">L", 8)
+    tiff += struct.pack(">H", 1) + struct.pack(">HHLL", 0x8769, 4, 1, 26)
+    tiff += struct.pack(">L", 0)
+    tiff += struct.pack(">H", 1) + struct.pack(">HHLL", 0x9003, 2, 20, 44)
+    tiff += struct.pack(">L", 0) + date
+    app1 = b"Exif\0\0" + tiff
+    jfif = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + bytes(9)
+    jpeg = b"\xff\xd8" + jfif + b"\xff\xe1" + struct.pack(">H", len(app1) + 2)
+    jpeg += app1 + b"\xff\xda\x00\x02" + bytes(100)
+    (tmp_path / "a.jpg").write_bytes(jpeg)
+    (tmp_path / "a.tif").write_bytes(tiff)
+    (tmp_path / "b.jpg").write_bytes(b"\xff\xd8\xff\xda\x00\x02" + bytes(100))
+    assert str(exifdate(tmp_path / "a.jpg")) == "2018-07-21 10:11:12"
+    assert str(exifdate(tmp_path / "a.tif")) == "2018-07-21 10:11:12"
+    assert exifdate(tmp_path / "b.jpg") is None
+
+
+def test_mklut():
+    image = np.array([[0, 1024], [1024, 4095]], dtype=np.uint16)
+    lut = mklut(image, {}, 12, False)
+    assert lut.dtype == np.uint8 and lut.size == 4096
+    assert lut[0] == 0 and lut[4095] == 255
+    assert lut[1024] > 64  # A dark image is brightened.
+    window = {(0x0028, 0x1050): b"2048", (0x0028, 0x1051): b"1024"}
+    lut = mklut(image, window, 12, False)
+    assert lut[1024] == 0 and lut[4095] == 255
+    lut = mklut(image, {}, 12, True)
+    assert lut[0] == 28 and lut[4095] == 255
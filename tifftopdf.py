@@ -2,26 +2,57 @@
 # file: tifftopdf.py
 # vim:fileencoding=utf-8:fdm=marker:ft=python
 #
-# Copyright © 2012-2017 R.F. Smith <rsmith@xs4all.nl>.
+# Copyright © 2012-2026 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2012-06-29T21:02:55+02:00
-# Last modified: 2020-04-01T20:56:47+0200
+# Last modified: 2026-10-17T22:23:06+0200
 """
 Convert TIFF files to PDF format.
 
-Using the utilities tiffinfo and tiff2pdf from the libtiff package.
+CCITT G3/G4 and JPEG compressed images are put into the PDF file as they are.
+Other images are converted with the tiff2pdf utility from the libtiff package.
+Alternatively, all pages of all files can be combined into one PDF file.
 """
 
+from collections import deque
 from functools import partial
 import argparse
 import concurrent.futures as cf
+import io
 import logging
 import os
 import re
+import struct
 import subprocess as sp
 import sys
+import zlib
 
-__version__ = "2020.04.01"
+try:
+    from PIL import Image
+except ImportError:  # Only needed to combine images that cannot be passed.
+    Image = None
+
+__version__ = "2026.10.17"
+# Size in bytes and struct format of the TIFF field types. The values of the
+# types without a format are kept as bytes. RATIONAL types are pairs.
+tifftypes = {
+    1: (1, None),
+    2: (1, None),
+    3: (2, "H"),
+    4: (4, "L"),
+    5: (8, "L"),
+    6: (1, None),
+    7: (1, None),
+    8: (2, "h"),
+    9: (4, "l"),
+    10: (8, "l"),
+    11: (4, "f"),
+    12: (8, "d"),
+}
+# Size of an A4 page in PostScript points.
+a4 = (595.28, 841.89)
+# Bytes with the order of their bits reversed, for FillOrder 2.
+reversedbits = bytes(int(f"{j:08b}"[::-1], 2) for j in range(256))
 
 
 def main():
@@ -29,9 +60,13 @@ def main():
     Entry point for tifftopdf.
     """
     args = setup()
-    func = tiffconv
     if args.jpeg:
         logging.info("using JPEG compression.")
+    if args.output:
+        rv = assemble(args.files, args.output, args.jpeg, args.quality)
+        sys.exit(rv)
+    func = tiffconv
+    if args.jpeg:
         func = partial(tiffconv, jpeg=True, quality=args.quality)
     with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
         for fn, rv in tp.map(func, args.files):
@@ -49,7 +84,18 @@ def setup():
         choices=["debug", "info", "warning", "error"],
         help="logging level (defaults to 'warning')",
     )
-    parser.add_argument("-j", "--jpeg", help="use JPEG compresion", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--jpeg",
+        help="use JPEG compresion for images that are re-encoded",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="NAME",
+        help="combine all pages of all files into the PDF file NAME, in order",
+    )
     parser.add_argument(
         "-q",
         "--quality",
@@ -68,74 +114,494 @@ def setup():
     )
     logging.debug(f"command line arguments = {sys.argv}")
     logging.debug(f"parsed arguments = {args}")
-    # Check for requisites
+    # Check for requisites. The tiff2pdf program (or Pillow, when combining
+    # files) is only needed for images that cannot be put into the PDF file as
+    # they are.
+    if args.output:
+        if Image is None:
+            logging.warning("module “PIL” (Pillow) not found")
+        return args
     try:
-        for prog in ("tiffinfo", "tiff2pdf"):
-            sp.run([prog], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-            logging.debug(f"found “{prog}”")
+        sp.run(["tiff2pdf"], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        logging.debug("found “tiff2pdf”")
     except FileNotFoundError:
-        logging.error(f"required program “{prog}” not found")
-        sys.exit(1)
+        logging.warning("program “tiff2pdf” not found")
     return args
 
 
 def tiffconv(fname, jpeg=False, quality=85):
     """
-    Start a tiff2pdf process for given file.
+    Convert a TIFF file to PDF.
+
+    If all the pages of the file are CCITT G3/G4 or JPEG compressed, their
+    strips are copied into the PDF file. Otherwise, or if the file cannot be
+    parsed here (e.g. BigTIFF), tiff2pdf is used.
 
     Arguments:
         name: Name of the tiff file to convert.
+        jpeg: Use JPEG compression in tiff2pdf.
+        quality: JPEG compression quality for tiff2pdf.
+
+    Returns:
+        A 2-tuple (input filename, return value).
+    """
+    outname = re.sub(r"\.tif{1,2}?$", ".pdf", fname, flags=re.IGNORECASE)
+    if outname == fname:
+        outname += ".pdf"
+    try:
+        ifds = readtiff(fname)
+    except (OSError, ValueError, struct.error) as e:
+        logging.info(f'cannot parse "{fname}" ({e}), leaving it to tiff2pdf')
+        return runtiff2pdf(fname, outname, None, jpeg, quality)
+    # Skip reduced-resolution versions of the pages.
+    pages = [ifd for ifd in ifds if not ifd.get(254, (0,))[0] & 1]
+    if not pages or not all(canpass(ifd) for ifd in pages):
+        return runtiff2pdf(fname, outname, (pages + ifds)[0], jpeg, quality)
+    try:
+        with open(fname, "rb") as f:
+            pdf = PDFWriter(outname)
+            try:
+                for ifd in pages:
+                    pdf.addpage(*pageimages(f, ifd))
+            finally:
+                pdf.close()
+    except (OSError, ValueError) as e:
+        logging.error(f'writing "{outname}" failed: {e}')
+        return (fname, 1)
+    logging.info(f'created "{outname}" without re-encoding')
+    return (fname, 0)
+
+
+def runtiff2pdf(fname, outname, ifd, jpeg, quality):
+    """
+    Convert a TIFF file with tiff2pdf.
+
+    Arguments:
+        fname: Name of the tiff file to convert.
+        outname: Name of the PDF file.
+        ifd: Dictionary of the tags of the first page, or None if unknown.
         jpeg: Use JPEG compression.
         quality: JPEG compression quality.
 
     Returns:
         A 2-tuple (input filename, tiff2pdf return value).
     """
+    ifd = ifd or {}
+    xres, yres = resolution(ifd)
+    width, length = ifd.get(256, (0,))[0], ifd.get(257, (0,))[0]
+    program = ["tiff2pdf"]
+    if xres and width and length:
+        args = [
+            "-w",
+            str(width / xres),
+            "-l",
+            str(length / yres),
+            "-x",
+            str(xres),
+            "-y",
+            str(yres),
+            "-o",
+            outname,
+            fname,
+        ]
+    else:
+        args = ["-o", outname, "-z", "-p", "A4", "-F", fname]
+        logging.warning(f"no size or resolution in {fname}. Fitting to A4")
+    if jpeg:
+        args = program + ["-n", "-j", "-q", str(quality)] + args
+    else:
+        args = program + args
+    logging.info(f'calling "{args}"')
     try:
-        args = ["tiffinfo", fname]
-        p = sp.run(args, stdout=sp.PIPE, stderr=sp.DEVNULL)
-        txt = p.stdout.decode().split()
-        if "Width:" not in txt:
-            raise ValueError("no width in TIF")
-        index = txt.index("Width:")
-        width = float(txt[index + 1])
-        length = float(txt[index + 4])
-        try:
-            index = txt.index("Resolution:")
-            xres = float(txt[index + 1][:-1])
-            yres = float(txt[index + 2])
-        except ValueError:
-            xres, yres = None, None
-        outname = re.sub(r"\.tif{1,2}?$", ".pdf", fname, flags=re.IGNORECASE)
-        program = ["tiff2pdf"]
-        if xres:
-            args = [
-                "-w",
-                str(width / xres),
-                "-l",
-                str(length / xres),
-                "-x",
-                str(xres),
-                "-y",
-                str(yres),
-                "-o",
-                outname,
-                fname,
-            ]
-        else:
-            args = ["-o", outname, "-z", "-p", "A4", "-F", fname]
-            logging.warning(f"no resolution in {fname}. Fitting to A4")
-        if jpeg:
-            args = program + ["-n", "-j", "-q", str(quality)] + args
-        else:
-            args = program + args
-        logging.info(f'calling "{args}"')
         rv = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-        logging.info(f'created "{outname}"')
-        return (fname, rv.returncode)
-    except Exception as e:
-        logging.error(f'starting conversion of "{fname}" failed: {e}')
-        return (fname, 0)
+    except FileNotFoundError:
+        logging.error(f'the program “tiff2pdf” is needed for "{fname}"')
+        return (fname, 1)
+    logging.info(f'created "{outname}"')
+    return (fname, rv.returncode)
+
+
+def readtiff(fname):
+    """
+    Read the image file directories of a TIFF file.
+
+    Only the directories are read, not the image data. Values that do not fit
+    in the directory are read from the file.
+
+    Arguments:
+        fname: Name of the tiff file.
+
+    Returns:
+        A list of dictionaries, one per page, mapping tags to tuples of values.
+        The values of BYTE, ASCII and UNDEFINED tags are bytes. The values of
+        RATIONAL tags are floats.
+    """
+    ifds = []
+    with open(fname, "rb") as f:
+        header = f.read(8)
+        order = {b"II": "<", b"MM": ">"}.get(header[:2], "<")
+        magic, offset = struct.unpack(order + "HL", header[2:])
+        if header[:2] not in (b"II", b"MM") or magic != 42:
+            raise ValueError("not a TIFF file")
+        seen = set()
+        while offset and offset not in seen:
+            seen.add(offset)
+            f.seek(offset)
+            (n,) = struct.unpack(order + "H", f.read(2))
+            data = f.read(12 * n + 4)
+            ifd = {}
+            for j in range(0, 12 * n, 12):
+                tag, typ, count = struct.unpack(order + "HHL", data[j : j + 8])
+                if typ not in tifftypes:
+                    continue
+                size, code = tifftypes[typ]
+                if size * count <= 4:
+                    raw = data[j + 8 : j + 8 + size * count]
+                else:
+                    (pos,) = struct.unpack(order + "L", data[j + 8 : j + 12])
+                    f.seek(pos)
+                    raw = f.read(size * count)
+                if code is None:
+                    ifd[tag] = raw
+                elif typ in (5, 10):
+                    v = struct.unpack(f"{order}{2 * count}{code}", raw)
+                    ifd[tag] = tuple(a / b if b else 0 for a, b in zip(v[::2], v[1::2]))
+                else:
+                    ifd[tag] = struct.unpack(f"{order}{count}{code}", raw)
+            ifds.append(ifd)
+            (offset,) = struct.unpack(order + "L", data[12 * n : 12 * n + 4])
+    if not ifds:
+        raise ValueError("no images in TIFF file")
+    return ifds
+
+
+def resolution(ifd):
+    """Return the horizontal and vertical resolution in DPI, or (None, None)."""
+    unit = ifd.get(296, (2,))[0]
+    xres, yres = ifd.get(282, (0,))[0], ifd.get(283, (0,))[0]
+    if unit not in (2, 3) or not xres:
+        return None, None
+    yres = yres or xres
+    if unit == 3:  # Centimeter
+        return xres * 2.54, yres * 2.54
+    return xres, yres
+
+
+def canpass(ifd):
+    """Check if the strips of a TIFF image can be put into a PDF file as they are."""
+    compression = ifd.get(259, (1,))[0]
+    if 273 not in ifd or len(ifd[273]) != len(ifd.get(279, ())):
+        return False  # Tiled, or no strips.
+    if compression in (3, 4):  # CCITT G3/G4
+        return (
+            ifd.get(258, (1,))[0] == 1
+            and ifd.get(277, (1,))[0] == 1
+            and ifd.get(262, (0,))[0] in (0, 1)
+            and not ifd.get(292, (0,))[0] & 2  # Uncompressed mode
+        )
+    if compression == 7:  # JPEG
+        return (
+            ifd.get(258, (8,))[0] == 8
+            and (ifd.get(277, (1,))[0], ifd.get(262, (0,))[0])
+            in ((1, 0), (1, 1), (3, 2), (3, 6), (4, 5))
+            and ifd.get(284, (1,))[0] == 1
+        )
+    return False
+
+
+def pageimages(f, ifd):
+    """
+    Lay out the strips of a TIFF image on a PDF page.
+
+    Images with a resolution get a page of the same size. Images without one
+    are fitted to an A4 page.
+
+    Arguments:
+        f: Binary file object of the TIFF file.
+        ifd: Dictionary of the tags of the image.
+
+    Returns:
+        A 2-tuple of the page size in points and a generator of
+        (entries, data, placement) tuples for PDFWriter.addpage.
+    """
+    width, length = ifd[256][0], ifd[257][0]
+    size, (x0, y0, sx, sy) = pagelayout(width, length, *resolution(ifd))
+    rowsperstrip = min(ifd.get(278, (length,))[0], length)
+
+    def images():
+        for k, (offset, count) in enumerate(zip(ifd[273], ifd[279])):
+            top = k * rowsperstrip
+            rows = min(rowsperstrip, length - top)
+            if rows <= 0:
+                break
+            f.seek(offset)
+            entries, data = stripimage(ifd, rows, f.read(count))
+            y = y0 + (length - top - rows) * sy
+            yield entries, data, (x0, y, width * sx, rows * sy)
+
+    return size, images()
+
+
+def pagelayout(width, length, xres, yres):
+    """
+    Determine the size of a page for an image, and its position on the page.
+
+    Images with a resolution get a page of the same size. Images without one
+    are fitted to an A4 page.
+
+    Arguments:
+        width: Width of the image in pixels.
+        length: Height of the image in pixels.
+        xres: Horizontal resolution in DPI, or None.
+        yres: Vertical resolution in DPI, or None.
+
+    Returns:
+        A 2-tuple of the page size in points and a tuple (x, y, sx, sy) of the
+        position of the lower left corner of the image in points and the size
+        of a pixel in points.
+    """
+    if xres:
+        sx, sy = 72 / xres, 72 / (yres or xres)
+        return (width * sx, length * sy), (0, 0, sx, sy)
+    sx = sy = min(a4[0] / width, a4[1] / length)
+    x0, y0 = (a4[0] - width * sx) / 2, (a4[1] - length * sy) / 2
+    return a4, (x0, y0, sx, sy)
+
+
+def stripimage(ifd, rows, data):
+    """
+    Make a PDF image of a strip of a CCITT or JPEG compressed TIFF image.
+
+    Arguments:
+        ifd: Dictionary of the tags of the image.
+        rows: Number of rows in the strip.
+        data: Compressed data of the strip.
+
+    Returns:
+        A 2-tuple of the image dictionary entries and the image data.
+    """
+    width = ifd[256][0]
+    compression = ifd.get(259, (1,))[0]
+    photometric = ifd.get(262, (0,))[0]
+    entries = b"/Width %d /Height %d " % (width, rows)
+    if compression in (3, 4):
+        if ifd.get(266, (1,))[0] == 2:  # FillOrder; PDF needs the MSB first.
+            data = data.translate(reversedbits)
+        t4options = ifd.get(292, (0,))[0]
+        k = -1 if compression == 4 else t4options & 1
+        parms = b"/K %d /Columns %d /Rows %d" % (k, width, rows)
+        if photometric == 1:  # BlackIsZero
+            parms += b" /BlackIs1 true"
+        if compression == 3 and t4options & 4:
+            parms += b" /EncodedByteAlign true"
+        entries += b"/ColorSpace /DeviceGray /BitsPerComponent 1 "
+        entries += b"/Filter /CCITTFaxDecode /DecodeParms << %s >>" % parms
+        return entries, data
+    tables = ifd.get(347)
+    if tables and tables.endswith(b"\xff\xd9") and data.startswith(b"\xff\xd8"):
+        data = tables[:-2] + data[2:]
+    space = {0: b"DeviceGray", 1: b"DeviceGray", 2: b"DeviceRGB", 6: b"DeviceRGB"}
+    entries += b"/ColorSpace /%s /BitsPerComponent 8 /Filter /DCTDecode" % space.get(
+        photometric, b"DeviceCMYK"
+    )
+    if photometric == 0:  # WhiteIsZero
+        entries += b" /Decode [1 0]"
+    elif photometric == 2:  # RGB data, not YCbCr.
+        entries += b" /DecodeParms << /ColorTransform 0 >>"
+    return entries, data
+
+
+def assemble(files, outname, jpeg, quality):
+    """
+    Combine all pages of image files into one PDF file.
+
+    The pages are prepared in a pool of processes, but written in order as
+    soon as they are ready. At most two pages per worker are prepared ahead of
+    the one being written, so the memory use does not depend on the number of
+    pages.
+
+    Arguments:
+        files: Names of the image files.
+        outname: Name of the PDF file.
+        jpeg: Use JPEG compression for images that are re-encoded.
+        quality: JPEG compression quality.
+
+    Returns:
+        0 if all pages were added, 1 otherwise.
+    """
+    jobs = iter([(fn, n, ifd) for fn in files for n, ifd in pagelist(fn)])
+    workers = os.cpu_count()
+    rv = 0
+    pdf = PDFWriter(outname)
+    try:
+        with cf.ProcessPoolExecutor(max_workers=workers) as pp:
+            pending = deque()
+            while True:
+                while len(pending) < 2 * workers:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    future = pp.submit(preparepage, *job, jpeg, quality)
+                    pending.append((job, future))
+                if not pending:
+                    break
+                (fn, n, _), future = pending.popleft()
+                try:
+                    pdf.addpage(*future.result())
+                    logging.info(f'added image {n + 1} of "{fn}"')
+                except (OSError, ValueError, struct.error) as e:
+                    logging.error(f'cannot add image {n + 1} of "{fn}": {e}')
+                    rv = 1
+    finally:
+        pdf.close()
+    logging.info(f'created "{outname}" with {len(pdf.pages)} pages')
+    return rv
+
+
+def pagelist(fname):
+    """
+    List the pages of an image file.
+
+    Returns:
+        A list of (index, ifd) tuples for every page of a TIFF file, where the
+        index counts all images in the file, as Pillow's seek does, and ifd is
+        the dictionary of tags. For other image files [(0, None)].
+    """
+    try:
+        ifds = readtiff(fname)
+    except (ValueError, struct.error):
+        return [(0, None)]
+    except OSError as e:
+        logging.error(f'cannot read "{fname}": {e}')
+        return []
+    # Skip reduced-resolution versions of the pages, but keep their index.
+    return [(n, ifd) for n, ifd in enumerate(ifds) if not ifd.get(254, (0,))[0] & 1]
+
+
+def preparepage(fname, n, ifd, jpeg, quality):
+    """
+    Prepare a page of an image file for PDFWriter.addpage.
+
+    The strips of CCITT and JPEG compressed TIFF pages and the contents of
+    JPEG files are used as they are. Other images are decoded by Pillow and
+    compressed with zlib, or with JPEG if requested and the image is not
+    bilevel.
+
+    Arguments:
+        fname: Name of the image file.
+        n: Index of the image in the file, counting all images.
+        ifd: Dictionary of the tags of a TIFF page, or None.
+        jpeg: Use JPEG compression for images that are re-encoded.
+        quality: JPEG compression quality.
+
+    Returns:
+        A 2-tuple of the page size and a list of (entries, data, placement)
+        tuples.
+    """
+    if ifd is not None and canpass(ifd):
+        with open(fname, "rb") as f:
+            size, images = pageimages(f, ifd)
+            return size, list(images)
+    if Image is None:
+        raise ValueError("Pillow is needed for this image")
+    with Image.open(fname) as img:
+        img.seek(n)
+        xres, yres = resolution(ifd) if ifd else img.info.get("dpi", (None, None))
+        if img.format == "JPEG" and img.mode in ("L", "RGB"):
+            with open(fname, "rb") as f:
+                data = f.read()
+            space, bits, filt = img.mode, 8, b"DCTDecode"
+        else:
+            if img.mode not in ("1", "L", "RGB"):
+                img = img.convert("L" if img.mode.startswith("I") else "RGB")
+            space, bits = img.mode, 1 if img.mode == "1" else 8
+            if jpeg and bits == 8:
+                buf = io.BytesIO()
+                img.save(buf, "JPEG", quality=quality)
+                data, filt = buf.getvalue(), b"DCTDecode"
+            else:
+                data, filt = zlib.compress(img.tobytes()), b"FlateDecode"
+        width, length = img.size
+    space = b"DeviceRGB" if space == "RGB" else b"DeviceGray"
+    entries = b"/Width %d /Height %d /ColorSpace /%s " % (width, length, space)
+    entries += b"/BitsPerComponent %d /Filter /%s" % (bits, filt)
+    size, (x0, y0, sx, sy) = pagelayout(width, length, xres, yres)
+    return size, [(entries, data, (x0, y0, width * sx, length * sy))]
+
+
+class PDFWriter:
+    """
+    PDF file that is written one page at a time.
+
+    Every object is written to the file as soon as it is complete; only the
+    offsets of the objects and the numbers of the pages are kept. The page
+    tree and the cross-reference table are written by close().
+    """
+
+    def __init__(self, name):
+        self.f = open(name, "wb")
+        # Objects 1 and 2 are the catalog and the page tree.
+        self.offsets = [0, 0, 0]
+        self.pages = []
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add(self, entries, stream=None, num=None):
+        """
+        Write a dictionary object, optionally with a stream.
+
+        Arguments:
+            entries: Contents of the dictionary as bytes.
+            stream: Optional contents of the stream as bytes.
+            num: Optional object number. By default a new number is used.
+
+        Returns:
+            The number of the object.
+        """
+        if num is None:
+            num = len(self.offsets)
+            self.offsets.append(0)
+        self.offsets[num] = self.f.tell()
+        if stream is not None:
+            entries += b" /Length %d" % len(stream)
+        self.f.write(b"%d 0 obj\n<< %s >>\n" % (num, entries))
+        if stream is not None:
+            self.f.write(b"stream\n" + stream + b"\nendstream\n")
+        self.f.write(b"endobj\n")
+        return num
+
+    def addpage(self, size, images):
+        """
+        Add a page with images.
+
+        Arguments:
+            size: (width, height) of the page in points.
+            images: Iterable of (entries, data, placement) tuples. The entries
+                of the image dictionary and the encoded image data are bytes.
+                The placement is the (x, y, width, height) of the image on the
+                page in points.
+        """
+        names, content = [], []
+        for j, (entries, data, (x, y, w, h)) in enumerate(images):
+            num = self.add(b"/Type /XObject /Subtype /Image " + entries, data)
+            names.append(b"/Im%d %d 0 R" % (j, num))
+            content.append(b"q %.4f 0 0 %.4f %.4f %.4f cm /Im%d Do Q" % (w, h, x, y, j))
+        contents = self.add(b"", b"\n".join(content))
+        resources = b"/XObject << %s >>" % b" ".join(names)
+        page = b"/Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] " % size
+        page += b"/Resources << %s >> /Contents %d 0 R" % (resources, contents)
+        self.pages.append(self.add(page))
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table."""
+        kids = b" ".join(b"%d 0 R" % p for p in self.pages)
+        self.add(b"/Type /Pages /Kids [%s] /Count %d" % (kids, len(self.pages)), num=2)
+        self.add(b"/Type /Catalog /Pages 2 0 R", num=1)
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self.offsets))
+        self.f.write(b"".join(b"%010d 00000 n \n" % o for o in self.offsets[1:]))
+        self.f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\n" % len(self.offsets))
+        self.f.write(b"startxref\n%d\n%%%%EOF\n" % xref)
+        self.f.close()
 
 
 if __name__ == "__main__":
@@ -5,18 +5,20 @@
 # Copyright © 2013-2017 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2013-11-16T18:41:21+01:00
-# Last modified: 2022-01-11T21:05:11+0100
+# Last modified: 2026-10-17T11:34:18+0200
 """Convert video files to Theora/Vorbis streams in a Matroska container."""
 
 from functools import partial
 import argparse
 import concurrent.futures as cf
+import json
 import logging
 import os
 import subprocess as sp
 import sys
 
-__version__ = "2022.01.11"
+__version__ = "2026.10.17"
+queuename = ".vid2mkv-queue.json"
 
 
 def main():
@@ -25,16 +27,14 @@ def main():
     """
     args = setup()
     starter = partial(runencoder, vq=args.videoquality, aq=args.audioquality)
-    with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
-        fl = [tp.submit(starter, t) for t in args.files]
-        for fut in cf.as_completed(fl):
-            fn, rv = fut.result()
-            if rv == 0:
-                logging.info(f'finished "{fn}"')
-            elif rv < 0:
-                logging.warning(f'file "{fn}" has unknown extension, ignoring it.')
-            else:
-                logging.error(f'conversion of "{fn}" failed, return code {rv}')
+    settings = {"videoquality": args.videoquality, "audioquality": args.audioquality}
+    for fn, rv in schedule(args.files, starter, args, settings):
+        if rv == 0:
+            logging.info(f'finished "{fn}"')
+        elif rv < 0:
+            logging.warning(f'file "{fn}" has unknown extension, ignoring it.')
+        else:
+            logging.error(f'conversion of "{fn}" failed, return code {rv}')
 
 
 def setup():
@@ -53,6 +53,37 @@ def setup():
         default=3,
         help="audio quality (0-10, default 3)",
     )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=1,
+        help="minimal number of threads per encoder (default 1)",
+    )
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=os.cpu_count(),
+        help=f"number of cores to use for all encoders (default {os.cpu_count()})",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=physmem() * 3 // 4,
+        help="memory in MiB to use for all encoders (default 3/4 of physical memory)",
+    )
+    parser.add_argument(
+        "--jobmem",
+        type=int,
+        default=1024,
+        help="expected memory use of an encoder in MiB (default 1024)",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help=f"resume the interrupted batch recorded in “{queuename}”",
+    )
     parser.add_argument(
         "--log",
         default="warning",
@@ -61,7 +92,7 @@ def setup():
     )
     parser.add_argument("-v", "--version", action="version", version=__version__)
     parser.add_argument(
-        "files", metavar="file", nargs="+", help="one or more files to process"
+        "files", metavar="file", nargs="*", help="one or more files to process"
     )
     args = parser.parse_args(sys.argv[1:])
     logging.basicConfig(
@@ -77,15 +108,109 @@ def setup():
     except FileNotFoundError:
         logging.error("the “ffmpeg” program cannot be found")
         sys.exit(1)
+    if args.resume:
+        try:
+            with open(queuename) as qf:
+                queue = json.load(qf)
+        except (OSError, ValueError) as e:
+            logging.error(f"cannot resume from “{queuename}”: {e}")
+            sys.exit(1)
+        for k, v in queue["settings"].items():
+            setattr(args, k, v)
+        args.files = queue["pending"] + [
+            f for f in args.files if f not in queue["pending"]
+        ]
+        logging.info(f"resuming with {len(args.files)} files")
+    if not args.files:
+        parser.print_help()
+        sys.exit(0)
     return args
 
 
-def runencoder(fname, vq, aq):
+def physmem():
+    """Return the amount of physical memory in MiB, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def savequeue(settings, pending):
+    """
+    Save the unfinished part of the batch, so it can be resumed.
+
+    Arguments:
+        settings: dictionary of the encoder settings of the batch.
+        pending: list of the names of the files that are not finished.
+    """
+    if not pending:
+        try:
+            os.remove(queuename)
+        except FileNotFoundError:
+            pass
+        return
+    tmpname = queuename + ".tmp"
+    with open(tmpname, "w") as qf:
+        json.dump({"settings": settings, "pending": pending}, qf, indent=2)
+    os.replace(tmpname, queuename)
+
+
+def schedule(files, starter, args, settings):
+    """
+    Run encoders within a budget of cores and memory.
+
+    Each encoder gets at least args.threads threads. An encoder is started when
+    enough cores and memory are free; the free cores are divided over the
+    encoders that can be started. So near the end of a batch the last
+    encoders get more threads. The unfinished files are saved after every
+    completed encoder.
+
+    Arguments:
+        files: list of the names of the files to convert.
+        starter: function to run the encoder; called with the file name and
+            the number of threads. Must return a (file name, return code) tuple.
+        args: parsed command-line arguments with the cores, memory, jobmem and
+            threads attributes.
+        settings: dictionary of the encoder settings to save with the queue.
+
+    Yields:
+        (file name, return code) tuples as the encoders finish.
+    """
+    pending = list(files)
+    running = {}
+    freecores, freemem = args.cores, args.memory
+    savequeue(settings, pending)
+    with cf.ThreadPoolExecutor(max_workers=max(args.cores, 1)) as tp:
+        while pending or running:
+            while pending:
+                slots = len(pending)
+                if args.memory > 0 and args.jobmem > 0:
+                    slots = min(slots, freemem // args.jobmem)
+                if running and (slots < 1 or freecores < args.threads):
+                    break
+                threads = max(args.threads, freecores // max(slots, 1))
+                threads = max(1, min(threads, freecores))
+                fn = pending.pop(0)
+                logging.debug(f'starting "{fn}" with {threads} threads')
+                running[tp.submit(starter, fn, threads)] = (fn, threads)
+                freecores -= threads
+                freemem -= args.jobmem
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                fn, threads = running.pop(fut)
+                freecores += threads
+                freemem += args.jobmem
+                savequeue(settings, pending + [f for f, _ in running.values()])
+                yield fut.result()
+
+
+def runencoder(fname, threads, vq, aq):
     """
     Convert a video file to Theora/Vorbis streams in a Matroska container.
 
     Arguments:
         fname: Name of the file to convert.
+        threads: Number of threads for the encoder.
         vq : Video quality. See ffmpeg docs.
         aq: Audio quality. See ffmpeg docs.
 
@@ -120,6 +245,8 @@ def runencoder(fname, vq, aq):
         "libtheora",
         "-q:v",
         str(vq),
+        "-threads",
+        str(threads),
         "-c:a",
         "libvorbis",
         "-q:a",
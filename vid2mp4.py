@@ -5,18 +5,20 @@
 # Copyright © 2013-2017 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2013-11-16T18:41:21+01:00
-# Last modified: 2022-01-11T21:06:35+0100
+# Last modified: 2026-10-17T11:20:52+0200
 """Convert video files to H.264/AAC streams in an MP4 container."""
 
 from functools import partial
 import argparse
 import concurrent.futures as cf
+import json
 import logging
 import os
 import subprocess as sp
 import sys
 
-__version__ = "2022.01.11"
+__version__ = "2026.10.17"
+queuename = ".vid2mp4-queue.json"
 
 
 def main():
@@ -24,17 +26,17 @@ def main():
     Entry point for vid2mp4.
     """
     args = setup()
-    starter = partial(runencoder, crf=args.crf, preset=args.preset)
-    with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
-        fl = [tp.submit(starter, t) for t in args.files]
-        for fut in cf.as_completed(fl):
-            fn, rv = fut.result()
-            if rv == 0:
-                logging.info(f'finished "{fn}"')
-            elif rv < 0:
-                logging.warning(f'file "{fn}" has unknown extension, ignoring it.')
-            else:
-                logging.error(f"conversion of {fn} failed, return code {rv}")
+    starter = partial(
+        runencoder, crf=args.crf, preset=args.preset, transcode=args.transcode
+    )
+    settings = {"crf": args.crf, "preset": args.preset, "transcode": args.transcode}
+    for fn, rv in schedule(args.files, starter, args, settings):
+        if rv == 0:
+            logging.info(f'finished "{fn}"')
+        elif rv < 0:
+            logging.warning(f'file "{fn}" has unknown extension, ignoring it.')
+        else:
+            logging.error(f"conversion of {fn} failed, return code {rv}")
 
 
 def setup():
@@ -58,6 +60,42 @@ def setup():
         ],
         help="preset (default medium) slower is smaller file",
     )
+    parser.add_argument(
+        "--transcode",
+        action="store_true",
+        help="always re-encode, even if the streams could be copied",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=4,
+        help="minimal number of threads per encoder (default 4)",
+    )
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=os.cpu_count(),
+        help=f"number of cores to use for all encoders (default {os.cpu_count()})",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=physmem() * 3 // 4,
+        help="memory in MiB to use for all encoders (default 3/4 of physical memory)",
+    )
+    parser.add_argument(
+        "--jobmem",
+        type=int,
+        default=1024,
+        help="expected memory use of an encoder in MiB (default 1024)",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help=f"resume the interrupted batch recorded in “{queuename}”",
+    )
     parser.add_argument(
         "--log",
         default="warning",
@@ -66,7 +104,7 @@ def setup():
     )
     parser.add_argument("-v", "--version", action="version", version=__version__)
     parser.add_argument(
-        "files", metavar="file", nargs="+", help="one or more files to process"
+        "files", metavar="file", nargs="*", help="one or more files to process"
     )
     args = parser.parse_args(sys.argv[1:])
     logging.basicConfig(
@@ -76,23 +114,122 @@ def setup():
     logging.debug(f"command line arguments = {sys.argv}")
     logging.debug(f"parsed arguments = {args}")
     # Check for required programs.
-    try:
-        sp.run(["ffmpeg"], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-        logging.debug("found “ffmpeg”")
-    except FileNotFoundError:
-        logging.error("the “ffmpeg” program cannot be found")
-        sys.exit(1)
+    for prog in ("ffmpeg", "ffprobe"):
+        try:
+            sp.run([prog], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+            logging.debug(f"found “{prog}”")
+        except FileNotFoundError:
+            logging.error(f"the “{prog}” program cannot be found")
+            sys.exit(1)
+    if args.resume:
+        try:
+            with open(queuename) as qf:
+                queue = json.load(qf)
+        except (OSError, ValueError) as e:
+            logging.error(f"cannot resume from “{queuename}”: {e}")
+            sys.exit(1)
+        for k, v in queue["settings"].items():
+            setattr(args, k, v)
+        args.files = queue["pending"] + [
+            f for f in args.files if f not in queue["pending"]
+        ]
+        logging.info(f"resuming with {len(args.files)} files")
+    if not args.files:
+        parser.print_help()
+        sys.exit(0)
     return args
 
 
-def runencoder(fname, crf, preset):
+def physmem():
+    """Return the amount of physical memory in MiB, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def savequeue(settings, pending):
+    """
+    Save the unfinished part of the batch, so it can be resumed.
+
+    Arguments:
+        settings: dictionary of the encoder settings of the batch.
+        pending: list of the names of the files that are not finished.
+    """
+    if not pending:
+        try:
+            os.remove(queuename)
+        except FileNotFoundError:
+            pass
+        return
+    tmpname = queuename + ".tmp"
+    with open(tmpname, "w") as qf:
+        json.dump({"settings": settings, "pending": pending}, qf, indent=2)
+    os.replace(tmpname, queuename)
+
+
+def schedule(files, starter, args, settings):
+    """
+    Run encoders within a budget of cores and memory.
+
+    Each encoder gets at least args.threads threads. An encoder is started when
+    enough cores and memory are free; the free cores are divided over the
+    encoders that can be started. So near the end of a batch the last
+    encoders get more threads. The unfinished files are saved after every
+    completed encoder.
+
+    Arguments:
+        files: list of the names of the files to convert.
+        starter: function to run the encoder; called with the file name and
+            the number of threads. Must return a (file name, return code) tuple.
+        args: parsed command-line arguments with the cores, memory, jobmem and
+            threads attributes.
+        settings: dictionary of the encoder settings to save with the queue.
+
+    Yields:
+        (file name, return code) tuples as the encoders finish.
+    """
+    pending = list(files)
+    running = {}
+    freecores, freemem = args.cores, args.memory
+    savequeue(settings, pending)
+    with cf.ThreadPoolExecutor(max_workers=max(args.cores, 1)) as tp:
+        while pending or running:
+            while pending:
+                slots = len(pending)
+                if args.memory > 0 and args.jobmem > 0:
+                    slots = min(slots, freemem // args.jobmem)
+                if running and (slots < 1 or freecores < args.threads):
+                    break
+                threads = max(args.threads, freecores // max(slots, 1))
+                threads = max(1, min(threads, freecores))
+                fn = pending.pop(0)
+                logging.debug(f'starting "{fn}" with {threads} threads')
+                running[tp.submit(starter, fn, threads)] = (fn, threads)
+                freecores -= threads
+                freemem -= args.jobmem
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                fn, threads = running.pop(fut)
+                freecores += threads
+                freemem += args.jobmem
+                savequeue(settings, pending + [f for f, _ in running.values()])
+                yield fut.result()
+
+
+def runencoder(fname, threads, crf, preset, transcode=False):
     """
     Convert a video file to H.264/AAC streams in an MP4 container.
 
+    Streams that already have the right codec are copied instead of
+    re-encoded, unless transcode is True.
+
     Arguments:
         fname: Name of the file to convert.
+        threads: Number of threads for the encoder.
         crf: Constant rate factor. See ffmpeg docs.
         preset: Encoding preset. See ffmpeg docs.
+        transcode: Re-encode all streams. Defaults to False.
 
     Returns:
         (fname, return value)
@@ -117,29 +254,112 @@ def runencoder(fname, crf, preset):
         ofn = basename + "_mod.mp4"
     else:
         ofn = basename + ".mp4"
-    args = [
-        "ffmpeg",
-        "-i",
-        fname,
-        "-c:v",
-        "libx264",
-        "-crf",
-        str(crf),
-        "-preset",
-        preset,
-        "-flags",
-        "+mv4+aic",
-        "-c:a",
-        "aac",
-        "-sn",
-        "-y",
-        ofn,
-    ]
+    streams = [] if transcode else probe(fname)
+    if streams:
+        codecargs, action = plan(streams, crf, preset, threads)
+    else:
+        codecargs, action = None, "transcode"
+    if codecargs is None:
+        codecargs = [
+            "-c:v",
+            "libx264",
+            "-crf",
+            str(crf),
+            "-preset",
+            preset,
+            "-flags",
+            "+mv4+aic",
+            "-threads",
+            str(threads),
+            "-c:a",
+            "aac",
+        ]
+    args = ["ffmpeg", "-i", fname] + codecargs + ["-sn", "-y", ofn]
     logging.debug(" ".join(args))
-    logging.info(f'starting conversion of "{fname}".')
+    logging.info(f'starting {action} of "{fname}".')
     cp = sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
     return fname, cp.returncode
 
 
+def probe(fname):
+    """
+    Retrieve the streams of a video file with ffprobe.
+
+    Arguments:
+        fname: Name of the file to probe.
+
+    Returns:
+        A list of dictionaries describing the streams, or an empty list if
+        the file could not be probed.
+    """
+    args = ["ffprobe", "-v", "error", "-show_streams", "-of", "json", fname]
+    cp = sp.run(args, stdout=sp.PIPE, stderr=sp.DEVNULL, text=True)
+    if cp.returncode != 0:
+        return []
+    try:
+        return json.loads(cp.stdout).get("streams", [])
+    except ValueError:
+        return []
+
+
+def plan(streams, crf, preset, threads):
+    """
+    Decide for the first video and audio stream if they can be copied.
+
+    H.264 video with 4:2:0 chroma subsampling and 8 bits per sample plays
+    everywhere, so it is copied. AAC audio is copied as well. Other streams
+    are re-encoded. Cover art is not counted as video.
+
+    Arguments:
+        streams: List of stream dictionaries as returned by probe.
+        crf: Constant rate factor for the video encoder.
+        preset: Preset for the video encoder.
+        threads: Number of threads for the video encoder.
+
+    Returns:
+        A 2-tuple of the codec arguments for ffmpeg and a description of the
+        action; “remux”, “audio conversion” or “transcode”. The arguments
+        are None if the streams cannot be used.
+    """
+    video = [
+        s
+        for s in streams
+        if s.get("codec_type") == "video"
+        and not s.get("disposition", {}).get("attached_pic")
+    ]
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+    if not video:
+        return None, "transcode"
+    v = video[0]
+    args = ["-map", f"0:{v['index']}"]
+    copyvideo = v.get("codec_name") == "h264" and v.get("pix_fmt") == "yuv420p"
+    if copyvideo:
+        args += ["-c:v", "copy"]
+    else:
+        args += [
+            "-c:v",
+            "libx264",
+            "-crf",
+            str(crf),
+            "-preset",
+            preset,
+            "-flags",
+            "+mv4+aic",
+            "-threads",
+            str(threads),
+        ]
+    copyaudio = True
+    if audio:
+        a = audio[0]
+        args += ["-map", f"0:{a['index']}"]
+        copyaudio = a.get("codec_name") == "aac"
+        args += ["-c:a", "copy" if copyaudio else "aac"]
+    if not copyvideo:
+        return args, "transcode"
+    if copyaudio:
+        return args, "remux"
+    return args, "audio conversion"
+
+
 if __name__ == "__main__":
     main()
@@ -5,7 +5,7 @@
 # Copyright © 2018 R.F. Smith <rsmith@xs4all.nl>.
 # SPDX-License-Identifier: MIT
 # Created: 2018-12-16T22:45:15+0100
-# Last modified: 2022-01-11T20:43:05+0100
+# Last modified: 2026-10-17T21:05:33+0200
 """
 Convert videos to webm files, using 2-pass constrained rate VP9
 encoding for video and libvorbis for audio.
@@ -13,14 +13,24 @@ encoding for video and libvorbis for audio.
 
 from datetime import datetime, timedelta
 import argparse
+import atexit
+import concurrent.futures as cf
+import hashlib
+import json
 import logging
 import math
 import os
+import platform
 import re
+import shutil
+import statistics
 import subprocess as sp
 import sys
+import tempfile
 
-__version__ = "2019.07.27"
+__version__ = "2026.10.17"
+usecache = True
+loudtarget = "I=-23:LRA=7:TP=-2"
 
 
 def main(argv):
@@ -43,6 +53,49 @@ def main(argv):
     parser.add_argument(
         "-d", "--dummy", action="store_true", help="print commands but do not run them"
     )
+    parser.add_argument(
+        "-n",
+        "--segments",
+        type=int,
+        default=1,
+        help="split the video at keyframes into N segments encoded in parallel "
+        "(default 1; no splitting)",
+    )
+    parser.add_argument(
+        "-P",
+        "--pipeline",
+        type=int,
+        default=0,
+        metavar="DEPTH",
+        help="run the first pass of up to DEPTH following files during the "
+        "second pass of a file (default 0; one file at a time)",
+    )
+    parser.add_argument(
+        "-L",
+        "--loudnorm",
+        action="store_true",
+        help="normalize the loudness of the audio to EBU R128, "
+        "measured during the first pass",
+    )
+    parser.add_argument(
+        "-p",
+        "--progress",
+        type=int,
+        default=10,
+        help="seconds between progress reports (default 10, 0 disables them)",
+    )
+    parser.add_argument(
+        "--summary",
+        default="vid2webm-passes.jsonl",
+        help="file to append the JSON lines summary of each pass to "
+        "(default 'vid2webm-passes.jsonl', '' disables it)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="do not use the cached ffprobe and ffmpeg information",
+    )
     parser.add_argument(
         "files", metavar="files", nargs="+", help="one or more files to process"
     )
@@ -53,68 +106,245 @@ def main(argv):
     )
     logging.debug(f"command line arguments = {argv}")
     logging.debug(f"parsed arguments = {args}")
+    global usecache
+    usecache = args.cache
     if not check_ffmpeg():
         return 1
+    records = []
+    atexit.register(writesummary, args.summary, records)
+    history = loadhistory()
+    jobs = []
     for fn in args.files:
         logging.info(f"processing '{fn}'.")
-        t1, t2, t3 = expectedtime(fn)
         starttime = datetime.now()
         startstr = str(starttime)[:-7]
-        tc = get_tc(fn)
+        info = videoinfo(fn)
+        width, height = int(info["width"]), int(info["height"])
+        tc = tile_cols(width)
         logging.info(f"started at {startstr}.")
+        length = spantime(["-i", fn] + (["-ss", args.start] if args.start else []))
+        threads = None
+        if args.segments > 1:
+            threads = max(1, os.cpu_count() // min(args.segments, os.cpu_count()))
+            length = length / args.segments if length else length
+        profile = loadprofile().get(resclass(width, height), {})
+        if profile:
+            logging.info(f"using VP9 profile {profile}")
+        ka = dict(start=args.start, threads=threads, profile=profile)
+        a1 = mkargs(fn, 1, tc, loudnorm=args.loudnorm, **ka)
+        a2 = mkargs(fn, 2, tc, loudnorm=args.loudnorm, **ka)
+        expected = None
+        if length:
+            expected = forecast(history, width, height, length, [a1, a2])
+        if expected:
+            for npass, (lo, avg, hi) in enumerate(expected, start=1):
+                lo, avg, hi = (str(t).split(".")[0] for t in (lo, avg, hi))
+                logging.info(f"pass {npass} is expected to take {avg} ({lo}–{hi})")
+            t1, t2, t3 = (sum(ts, timedelta()) for ts in zip(*expected))
+        else:
+            logging.info("not enough history; estimating from the file size")
+            t1, t2, t3 = expectedtime(fn)
         t1 = str(starttime + t1)[:-10]
         t2 = str(starttime + t2)[:-10]
         t3 = str(starttime + t3)[:-10]
         logging.info(f"encoding is expected to take until {t2} on average")
         logging.info(f"but it could be anywhere between {t1} and {t3}")
-        a1 = mkargs(
-            fn,
-            1,
-            tc,
-            start=args.start,
-        )
-        a2 = mkargs(
-            fn,
-            2,
-            tc,
-            start=args.start,
-        )
+        if args.pipeline > 0 and args.segments == 1 and not args.dummy:
+            jobs.append((a1, a2, width, height))
+            continue
+        nrec = len(records)
+        if args.segments > 1:
+            rv = encode_segments(
+                fn,
+                tc,
+                args.segments,
+                args.start,
+                args.dummy,
+                records,
+                profile,
+                args.loudnorm,
+            )
+            if rv is None:
+                continue
+            origbytes, newbytes = rv
+            learn(records[nrec:], width, height)
+            report(starttime, origbytes)
+            continue
         if not args.dummy:
-            origbytes, newbytes = encode(a1, a2)
+            origbytes, newbytes = encode(a1, a2, records, args.progress)
+            learn(records[nrec:], width, height)
         else:
             logging.basicConfig(level="INFO")
             logging.info("first pass: " + " ".join(a1))
             logging.info("second pass: " + " ".join(a2))
             continue
-        stoptime = datetime.now()
-        stopstr = str(stoptime)[:-7]
-        logging.info(f"ended at {stopstr}.")
-        runtime = stoptime - starttime
-        runstr = str(runtime)[:-7]
-        logging.info(f"total running time {runstr}.")
-        encspeed = origbytes / (runtime.seconds * 1000)
-        logging.info(f"average input encoding speed {encspeed:.2f} kB/s.")
+        report(starttime, origbytes)
+    if jobs:
+        starttime = datetime.now()
+        origbytes = 0
+        for (_, _, width, height), (size, _, recs) in zip(
+            jobs, encode_pipelined(jobs, args.pipeline, args.progress)
+        ):
+            origbytes += size
+            records += recs
+            learn(recs, width, height)
+        report(starttime, origbytes)
+
+
+def report(starttime, origbytes):
+    """
+    Report the end time, running time and encoding speed of a conversion.
+
+    Arguments:
+        starttime: datetime.datetime instance of the start of the conversion.
+        origbytes: size of the input file in bytes.
+    """
+    stoptime = datetime.now()
+    stopstr = str(stoptime)[:-7]
+    logging.info(f"ended at {stopstr}.")
+    runtime = stoptime - starttime
+    runstr = str(runtime)[:-7]
+    logging.info(f"total running time {runstr}.")
+    encspeed = origbytes / (max(runtime.seconds, 1) * 1000)
+    logging.info(f"average input encoding speed {encspeed:.2f} kB/s.")
 
 
 def check_ffmpeg():
     """Check the minumum version requirement of ffmpeg, and that it is built with
-    the needed drivers enabled."""
-    args = ["ffmpeg", "-version"]
-    proc = sp.run(args, text=True, stdout=sp.DEVNULL, stderr=sp.PIPE)
-    verre = r"ffmpeg version (\d+)\.(\d+)(\.(\d+))? Copyright"
-    major, minor, patch, *rest = re.findall(verre, proc.stderr)[0]
-    if int(major) < 3 and int(minor) < 3:
-        logging.error(f"ffmpeg 3.3 is required; found {major}.{minor}.{patch}")
+    the needed encoders enabled."""
+    caps = ffmpegcaps()
+    if caps is None:
+        logging.error("the “ffmpeg” program cannot be found")
         return False
-    if not re.search(r"enable-libvpx", proc.stderr):
+    if caps["version"] and tuple(caps["version"]) < (3, 3):
+        major, minor = caps["version"]
+        logging.error(f"ffmpeg 3.3 is required; found {major}.{minor}")
+        return False
+    if "libvpx-vp9" not in caps["encoders"]:
         logging.error("ffmpeg is not built with VP9 video support.")
         return False
-    if not re.search(r"enable-libvorbis", proc.stderr):
+    if "libvorbis" not in caps["encoders"]:
         logging.error("ffmpeg is not built with Vorbis audio support.")
         return False
     return True
 
 
+def ffmpegcaps():
+    """
+    Determine the version and the encoders of the ffmpeg program.
+
+    The result is cached, keyed by the path and modification time of the program.
+
+    Returns:
+        A dictionary with the keys “version” (a [major, minor] list or None for
+        builds without a version number) and “encoders” (a list of encoder names),
+        or None if ffmpeg cannot be found.
+    """
+    binary = shutil.which("ffmpeg")
+    if binary is None:
+        return None
+    fid = os.stat(binary).st_mtime_ns
+    cache = loadjson(probecachepath()) if usecache else {}
+    entry = cache.get("ffmpeg", {}).get(binary)
+    if entry and entry["id"] == fid:
+        return entry["caps"]
+    args = [binary, "-version"]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    m = re.search(r"ffmpeg version n?(\d+)\.(\d+)", proc.stdout)
+    args = [binary, "-hide_banner", "-encoders"]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    lines = proc.stdout.splitlines()
+    if any(ln.strip().startswith("---") for ln in lines):
+        while not lines.pop(0).strip().startswith("---"):
+            pass
+    caps = {
+        "version": [int(m.group(1)), int(m.group(2))] if m else None,
+        "encoders": [ln.split()[1] for ln in lines if len(ln.split()) > 1],
+    }
+    if usecache:
+        cache.setdefault("ffmpeg", {})[binary] = {"id": fid, "caps": caps}
+        savejson(probecachepath(), cache)
+    return caps
+
+
+def probecachepath():
+    """Return the path of the cache file shared by the ffmpeg based converters."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".ffprobe-cache.json"
+
+
+def probe(path):
+    """
+    Retrieve the stream and format information of a media file with ffprobe.
+
+    The result is cached, keyed by the path, size and modification time of the file.
+    Entries for files that no longer exist are removed from the cache.
+
+    Arguments:
+        path: location of the file.
+
+    Returns:
+        A dictionary with “streams” and “format” keys, or an empty dictionary if
+        ffprobe cannot read the file.
+    """
+    key, fid = fileid(path)
+    cache = loadjson(probecachepath()) if usecache else {}
+    entry = cache.get("probe", {}).get(key)
+    if entry and entry["id"] == fid:
+        return entry["data"]
+    args = ["ffprobe", "-v", "error", "-show_streams", "-show_format"]
+    args += ["-of", "json", path]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    try:
+        data = json.loads(proc.stdout)
+    except ValueError:
+        return {}
+    if usecache:
+        entries = cache.setdefault("probe", {})
+        for k in [k for k in entries if not os.path.exists(k)]:
+            del entries[k]
+        entries[key] = {"id": fid, "data": data}
+        savejson(probecachepath(), cache)
+    return data
+
+
+def fileid(path):
+    """
+    Identify the contents of a file without reading it.
+
+    Arguments:
+        path: location of the file.
+
+    Returns:
+        A 2-tuple of the absolute path and a list of the size and the
+        modification time in nanoseconds.
+    """
+    st = os.stat(path)
+    return os.path.abspath(path), [st.st_size, st.st_mtime_ns]
+
+
+def loadjson(path):
+    """Read a dictionary from a JSON file. Returns an empty dictionary on failure."""
+    try:
+        with open(path) as jf:
+            return json.load(jf)
+    except (OSError, ValueError):
+        return {}
+
+
+def savejson(path, data):
+    """
+    Atomically write a dictionary to a JSON file.
+
+    The temporary file has a unique name, so other processes or threads can
+    update the same file at the same time; the last one wins.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False
+    ) as jf:
+        json.dump(data, jf, indent=2)
+    os.replace(jf.name, path)
+
+
 def reporttime(p, dt):
     """
     Report the amount of time passed between start and end.
@@ -123,31 +353,91 @@ def reporttime(p, dt):
         p: number of the pass.
         dt: datetime.timedelta instance.
     """
-    s = str(dt)[:-7]
+    s = str(dt).split(".")[0]
     logging.info(f"pass {p} took {s}.")
 
 
+def videoinfo(name):
+    """
+    Retrieve the properties of the first video stream of a file.
+
+    Arguments:
+        name: file path.
+
+    Returns:
+        A dictionary of the stream properties reported by ffprobe.
+    """
+    for stream in probe(name).get("streams", []):
+        if stream.get("codec_type") == "video":
+            return stream
+    return {}
+
+
 def get_tc(name):
     """Determine the amount of tile columns to use."""
-    args = ["ffprobe", "-hide_banner", "-select_streams", "v", "-show_streams", name]
-    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
-    lines = proc.stdout.splitlines()
-    d = {}
-    for ln in lines[1:-1]:
-        key, value = ln.strip().split("=")
-        d[key] = value
-    width = d["width"]
+    return tile_cols(videoinfo(name)["width"])
+
+
+def tile_cols(width):
+    """Calculate the amount of tile columns to use for a given width."""
     return math.floor(math.log2(math.ceil(float(width) / 64.0)))
 
 
-def mkargs(fn, npass, tile_columns, start=None):
+def profilepath():
+    """Return the path of the file with the VP9 settings per resolution class."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".vp9-profile.json"
+
+
+def loadprofile(path=None):
+    """Read the VP9 profile written by vp9-bench.py; returns an empty dictionary if
+    there is none."""
+    try:
+        with open(path or profilepath()) as pf:
+            return json.load(pf)
+    except (OSError, ValueError):
+        return {}
+
+
+def resclass(width, height):
+    """Return the name of the resolution class of a video."""
+    for name, w, h in (("sd", 1024, 576), ("720p", 1280, 720), ("1080p", 1920, 1088)):
+        if width <= w and height <= h:
+            return name
+    return "uhd"
+
+
+def mkargs(
+    fn,
+    npass,
+    tile_columns,
+    start=None,
+    length=None,
+    threads=None,
+    outbase=None,
+    audio=True,
+    profile=None,
+    loudnorm=False,
+):
     """Create argument list for constrained quality VP9/vorbis encoding.
 
     Arguments:
         fn: String containing the path of the input file
         npass: Number of the pass. Must be 1 or 2.
+        tile_columns: number of tile columns.
         start: Optional string containing the start time for the conversion.
             Must be in the format HH:MM:SS, where H, M and S are digits.
+        length: Optional string containing the duration to encode.
+            Must be in the format HH:MM:SS, where H, M and S are digits.
+        threads: Optional number of threads to use. Defaults to the number of cores.
+        outbase: Optional path (without extension) for the pass log and output file.
+            Defaults to the input file name without extension.
+        audio: Boolean to indicate if the audio should be encoded. Defaults to True.
+        profile: Optional dictionary with the speed (of the second pass),
+            tile-columns, threads and row-mt settings to use, as written by
+            vp9-bench.py. An explicit number of threads takes precedence.
+        loudnorm: Boolean to indicate that the loudness of the (first) audio
+            track should be measured in the first pass and normalized in the
+            second. Defaults to False.
 
     Returns:
         A list of strings suitable for calling a subprocess.
@@ -156,12 +446,18 @@ def mkargs(fn, npass, tile_columns, start=None):
         raise ValueError("npass must be 1 or 2")
     if start and not re.search(r"\d{2}:\d{2}:\d{2}", start):
         raise ValueError("starting time must be in the format HH:MM:SS")
-    numthreads = str(os.cpu_count())
-    basename, ext = fn.rsplit(".", 1)
+    if length and not re.search(r"\d{2}:\d{2}:\d{2}", length):
+        raise ValueError("length must be in the format HH:MM:SS")
+    profile = profile or {}
+    numthreads = str(threads or profile.get("threads") or os.cpu_count())
+    tile_columns = profile.get("tile-columns", tile_columns)
+    basename = fn.rsplit(".", 1)[0]
+    if outbase is None:
+        outbase = basename
     args = [
         "ffmpeg",
         "-loglevel",
-        "quiet",
+        "info" if npass == 1 and loudnorm else "quiet",
         "-probesize",
         "1G",
         "-analyzeduration",
@@ -169,8 +465,15 @@ def mkargs(fn, npass, tile_columns, start=None):
     ]
     if start:
         args += ["-ss", start]
-    args += ["-i", fn, "-passlogfile", basename]
-    speed = "2"
+    if length:
+        args += ["-t", length]
+    args += ["-i", fn]
+    if npass == 1 and loudnorm and audio:
+        # Measure the loudness in a second output of the same process.
+        af = f"loudnorm={loudtarget}:print_format=json"
+        args += ["-map", "0:a:0", "-af", af, "-f", "null", "-"]
+    args += ["-passlogfile", outbase]
+    speed = str(profile.get("speed", 2))
     if npass == 1:
         logging.info(f"using {numthreads} threads")
         logging.info(f"using {tile_columns} tile columns")
@@ -179,7 +482,7 @@ def mkargs(fn, npass, tile_columns, start=None):
         "-c:v",
         "libvpx-vp9",
         "-row-mt",
-        "1",
+        str(profile.get("row-mt", 1)),
         "-threads",
         numthreads,
         "-pass",
@@ -198,56 +501,67 @@ def mkargs(fn, npass, tile_columns, start=None):
     if npass == 2:
         args += ["-auto-alt-ref", "1", "-lag-in-frames", "25"]
     args += ["-sn"]
-    if npass == 1:
+    if npass == 1 or not audio:
         args += ["-an"]
     elif npass == 2:
         args += ["-c:a", "libvorbis", "-q:a", "3"]
-    args += ["-f", "webm", "-map", "0:v", "-map", "0:a"]
+        if loudnorm:
+            args += ["-filter:a:0", f"loudnorm={loudtarget}", "-ar:a:0", "48000"]
+    args += ["-f", "webm", "-map", "0:v"]
+    if audio:
+        args += ["-map", "0:a"]
     if npass == 1:
         outname = "/dev/null"
+    elif outbase != basename:
+        outname = outbase + ".webm"
     else:
-        if ext.lower() == "webm":
-            outname = basename + "_mod.webm"
-        else:
-            outname = basename + ".webm"
+        outname = outputname(fn)
     args += ["-y", outname]
     return args
 
 
-def encode(args1, args2):
+def outputname(fn):
+    """Return the name of the webm file that is produced from fn."""
+    basename, ext = fn.rsplit(".", 1)
+    if ext.lower() == "webm":
+        return basename + "_mod.webm"
+    return basename + ".webm"
+
+
+def encode(args1, args2, records=None, interval=10):
     """
     Run the encoding subprocesses.
 
     Arguments:
         args1: Commands to run the first encoding step as a subprocess.
         args2: Commands to run the second encoding step as a subprocess.
+        records: Optional list to which the summaries of the passes are appended.
+        interval: Number of seconds between progress reports. 0 disables them.
 
     Return values:
         A 2-tuple of the original movie size in bytes and the encoded movie size in bytes.
     """
     oidx = args2.index("-i") + 1
     origsize = os.path.getsize(args2[oidx])
+    total = spantime(args2)
     logging.info("running pass 1...")
     logging.debug("pass 1: {}".format(" ".join(args1)))
-    start = datetime.utcnow()
-    proc = sp.run(args1, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    end = datetime.utcnow()
-    if proc.returncode:
-        logging.error(f"pass 1 returned {proc.returncode}.")
+    rv, rec = firstpass(args1, total, interval, records)
+    if rv:
+        logging.error(f"pass 1 returned {rv}.")
         return origsize, 0
-    else:
-        dt = end - start
-        reporttime(1, dt)
+    elif rec:
+        reporttime(1, timedelta(seconds=rec["seconds"]))
     logging.info("running pass 2...")
+    args2 = linearloudnorm(args2)
     logging.debug("pass 2: {}".format(" ".join(args2)))
-    start = datetime.utcnow()
-    proc = sp.run(args2, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    end = datetime.utcnow()
-    if proc.returncode:
-        logging.error(f"pass 2 returned {proc.returncode}.")
+    rv, rec = runpass(args2, 2, total, interval)
+    if records is not None:
+        records.append(rec)
+    if rv:
+        logging.error(f"pass 2 returned {rv}.")
     else:
-        dt = end - start
-        reporttime(2, dt)
+        reporttime(2, timedelta(seconds=rec["seconds"]))
     newsize = os.path.getsize(args2[-1])
     percentage = int(100 * newsize / origsize)
     ifn, ofn = args2[oidx], args2[-1]
@@ -255,9 +569,356 @@ def encode(args1, args2):
     return origsize, newsize  # both in bytes.
 
 
+def encode_pipelined(jobs, depth=1, interval=10):
+    """
+    Encode several files, overlapping the second pass of a file with the first
+    pass of up to depth following files.
+
+    The second passes are run one after another, in order. A second pass
+    starts when the first pass of the same file has finished.
+
+    Arguments:
+        jobs: List of tuples that start with the arguments of the first and
+            second pass of a file.
+        depth: Maximum number of first passes that run during a second pass.
+        interval: Number of seconds between progress reports. 0 disables them.
+
+    Returns:
+        A list of 3-tuples of the original movie size in bytes, the encoded
+        movie size in bytes and a list of summaries of the passes, one for
+        every job.
+    """
+    begin = datetime.now()
+    busy = 0.0
+    results = []
+    with cf.ThreadPoolExecutor(max_workers=depth) as tp:
+        first = []
+        for n, (args1, args2, *_) in enumerate(jobs):
+            while len(first) < min(n + depth + 1, len(jobs)):
+                a1 = jobs[len(first)][0]
+                total = spantime(a1)
+                logging.info(f"starting pass 1 of '{argvalue(a1, '-i')}'.")
+                first.append(tp.submit(firstpass, a1, total, interval))
+            origsize = os.path.getsize(argvalue(args2, "-i"))
+            recs = []
+            rv, rec = first[n].result()
+            if rec:
+                recs.append(rec)
+                busy += rec["seconds"]
+            if rv:
+                logging.error(f"pass 1 of '{argvalue(args1, '-i')}' returned {rv}.")
+                results.append((origsize, 0, recs))
+                continue
+            logging.info(f"starting pass 2 of '{argvalue(args2, '-i')}'.")
+            args2 = linearloudnorm(args2)
+            rv, rec = runpass(args2, 2, spantime(args2), interval)
+            recs.append(rec)
+            busy += rec["seconds"]
+            if rv:
+                logging.error(f"pass 2 of '{argvalue(args2, '-i')}' returned {rv}.")
+                results.append((origsize, 0, recs))
+                continue
+            newsize = os.path.getsize(args2[-1])
+            percentage = int(100 * newsize / origsize)
+            logging.info(f"the size of '{args2[-1]}' is {percentage}% of the original.")
+            results.append((origsize, newsize, recs))
+    wall = (datetime.now() - begin).total_seconds()
+    saved = timedelta(seconds=round(max(busy - wall, 0)))
+    logging.info(
+        f"the passes took {timedelta(seconds=round(busy))} in total, "
+        f"overlapping them saved {saved}."
+    )
+    return results
+
+
+def firstpass(args, total=None, interval=10, records=None):
+    """
+    Run the first pass, or reuse the statistics of an identical earlier first pass.
+
+    The statistics are stored in ~/.vp9-passlogs, under a key made from the
+    arguments of the first pass and a fingerprint of the input file.
+
+    Arguments:
+        args: Commands to run the first encoding step as a subprocess.
+        total: Optional number of seconds of input that will be encoded.
+        interval: Number of seconds between progress reports. 0 disables them.
+        records: Optional list to which the summary of the pass is appended.
+
+    Returns:
+        A 2-tuple of the return code of ffmpeg and a dictionary summarizing the
+        pass, or (0, None) if stored statistics were used.
+    """
+    base = argvalue(args, "-passlogfile")
+    logname = base + "-0.log"
+    loudname = loudnessname(args)
+    stored = None
+    if usecache:
+        stored = os.path.join(passlogdir(), passkey(args) + ".log")
+        if os.path.exists(stored):
+            shutil.copyfile(stored, logname)
+            if loudname and os.path.exists(stored + ".loudnorm"):
+                shutil.copyfile(stored + ".loudnorm", loudname)
+            logging.info("reusing the statistics of an earlier first pass.")
+            return 0, None
+    errlog = base + "-ffmpeg.log" if loudname else None
+    rv, rec = runpass(args, 1, total, interval, errlog)
+    if records is not None:
+        records.append(rec)
+    if loudname:
+        saveloudness(errlog, loudname)
+    if rv == 0 and stored and os.path.exists(logname):
+        os.makedirs(passlogdir(), exist_ok=True)
+        for src, dest in ((loudname, stored + ".loudnorm"), (logname, stored)):
+            if src and os.path.exists(src):
+                shutil.copyfile(src, dest + ".tmp")
+                os.replace(dest + ".tmp", dest)
+    return rv, rec
+
+
+def passlogdir():
+    """Return the path of the directory where first pass statistics are stored."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".vp9-passlogs"
+
+
+def passkey(args):
+    """
+    Create a key for the statistics produced by a first pass.
+
+    Arguments:
+        args: Commands to run the first encoding step as a subprocess.
+
+    Returns:
+        A hexadecimal string.
+    """
+    fn = argvalue(args, "-i")
+    rest = list(args)
+    for opt in ("-i", "-passlogfile"):
+        rest[rest.index(opt) + 1] = ""
+    data = json.dumps([fingerprint(fn), rest])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def fingerprint(path, blocksize=2**20):
+    """
+    Calculate a fingerprint of the contents of a file.
+
+    To keep this fast for multi-gigabyte files, only the size and three blocks
+    at the beginning, middle and end of the file are used.
+
+    Arguments:
+        path: location of the file.
+        blocksize: size of the blocks to read. Defaults to 1 MiB.
+
+    Returns:
+        A hexadecimal string.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, size // 2, max(size - blocksize, 0)):
+            f.seek(offset)
+            h.update(f.read(blocksize))
+    return h.hexdigest()
+
+
+def spantime(args):
+    """
+    Determine how many seconds of the input an ffmpeg command will encode.
+
+    Arguments:
+        args: ffmpeg command as a list of strings.
+
+    Returns:
+        The length in seconds, or None if it cannot be determined.
+    """
+    if "-t" in args:
+        return ts2sec(args[args.index("-t") + 1])
+    try:
+        total = duration(args[args.index("-i") + 1])
+    except ValueError:
+        return None
+    if "-ss" in args:
+        total -= ts2sec(args[args.index("-ss") + 1])
+    return total
+
+
+def runpass(args, npass, total=None, interval=10, errlog=None):
+    """
+    Run an ffmpeg encoding pass, reading its progress information from a pipe.
+
+    Arguments:
+        args: ffmpeg command as a list of strings.
+        npass: Number of the pass.
+        total: Optional number of seconds of input that will be encoded.
+            Used to calculate the estimated time of arrival.
+        interval: Number of seconds between progress reports. 0 disables them.
+        errlog: Optional name of a file to write the messages of ffmpeg to.
+
+    Returns:
+        A 2-tuple of the return code of ffmpeg and a dictionary summarizing the pass.
+    """
+    # Name the input in the progress reports; the output of a first pass is
+    # the null device, and several passes can run at the same time.
+    source = args[args.index("-i") + 1] if "-i" in args else args[-1]
+    args = args[:1] + ["-progress", "pipe:1", "-nostats"] + args[1:]
+    begin = datetime.now()
+    lastreport = begin
+    prog = {}
+    stderr = open(errlog, "w") if errlog else sp.DEVNULL
+    with sp.Popen(args, text=True, stdout=sp.PIPE, stderr=stderr) as proc:
+        for ln in proc.stdout:
+            key, _, value = ln.strip().partition("=")
+            prog[key] = value.strip()
+            if key != "progress" or prog[key] == "end":
+                continue
+            now = datetime.now()
+            if interval and (now - lastreport).total_seconds() >= interval:
+                lastreport = now
+                msg = f"'{source}' pass {npass}: "
+                logging.info(msg + progress(prog, now - begin, total))
+    if errlog:
+        stderr.close()
+    seconds = (datetime.now() - begin).total_seconds()
+    frames = int(prog.get("frame", 0) or 0)
+    record = {
+        "file": args[args.index("-i") + 1],
+        "output": args[-1],
+        "pass": npass,
+        "length": round(total, 3) if total else None,
+        "codec": argvalue(args, "-c:v"),
+        "preset": argvalue(args, "-speed"),
+        "threads": argvalue(args, "-threads"),
+        "started": str(begin)[:-7],
+        "seconds": round(seconds, 2),
+        "frames": frames,
+        "fps": round(frames / seconds, 2) if seconds else 0.0,
+        "bitrate": prog.get("bitrate", "N/A"),
+        "speed": prog.get("speed", "N/A"),
+        "size": int(prog.get("total_size", 0) or 0),
+        "returncode": proc.returncode,
+    }
+    return proc.returncode, record
+
+
+def argvalue(args, option):
+    """Return the value following option in an argument list, or None."""
+    try:
+        return args[args.index(option) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+def loudnessname(args):
+    """
+    Return the name of the file with the loudness measured by a first pass, or
+    None if the pass does not measure it.
+    """
+    if not any(a.startswith("loudnorm=") for a in args):
+        return None
+    return argvalue(args, "-passlogfile") + "-loudnorm.json"
+
+
+def saveloudness(errlog, name):
+    """
+    Extract the loudness measurement that the loudnorm filter printed at the end
+    of the messages of ffmpeg, and save it.
+
+    Arguments:
+        errlog: file containing the messages of ffmpeg. It is removed afterwards.
+        name: file to save the measurement to in JSON format.
+    """
+    try:
+        with open(errlog) as ef:
+            text = ef.read()
+        os.remove(errlog)
+        measured = json.loads(text[text.rindex("{") : text.rindex("}") + 1])
+    except (OSError, ValueError) as e:
+        logging.warning(f"could not read the loudness measurement: {e}")
+        return
+    with open(name, "w") as lf:
+        json.dump(measured, lf)
+    logging.info(
+        f"measured loudness {measured['input_i']} LUFS, "
+        f"true peak {measured['input_tp']} dBTP."
+    )
+
+
+def linearloudnorm(args):
+    """
+    Configure the loudnorm filter of a second pass for linear normalization, with
+    the values measured in the first pass.
+
+    Arguments:
+        args: Commands to run the second encoding step as a subprocess.
+
+    Returns:
+        The modified commands. Without a measurement, the loudnorm filter
+        stays in its dynamic mode.
+    """
+    try:
+        idx = next(n for n, a in enumerate(args) if a.startswith("loudnorm="))
+    except StopIteration:
+        return args
+    try:
+        with open(argvalue(args, "-passlogfile") + "-loudnorm.json") as lf:
+            m = json.load(lf)
+    except (OSError, ValueError):
+        logging.warning("no loudness measurement; normalizing dynamically.")
+        return args
+    args = list(args)
+    args[idx] += (
+        f":measured_I={m['input_i']}:measured_LRA={m['input_lra']}"
+        f":measured_TP={m['input_tp']}:measured_thresh={m['input_thresh']}"
+        f":offset={m['target_offset']}:linear=true"
+    )
+    return args
+
+
+def progress(prog, elapsed, total=None):
+    """
+    Format the progress of an encoding pass.
+
+    Arguments:
+        prog: dictionary of the key/value pairs from ffmpeg's -progress output.
+        elapsed: datetime.timedelta of the time since the pass started.
+        total: Optional number of seconds of input that will be encoded.
+
+    Returns:
+        A string describing the progress.
+    """
+    try:
+        done = int(prog.get("out_time_us", prog.get("out_time_ms", "0"))) / 1e6
+    except ValueError:
+        done = 0.0
+    rv = f"frame {prog.get('frame', '?')}, {prog.get('fps', '?')} fps, "
+    rv += f"{prog.get('bitrate', '?')}, speed {prog.get('speed', '?')}"
+    if total and done > 0:
+        pct = min(100 * done / total, 100)
+        remaining = (total - done) * elapsed.total_seconds() / done
+        rv += f", {pct:.1f}% done, ETA {sec2ts(max(remaining, 0))[:-4]}"
+    return rv
+
+
+def writesummary(path, records):
+    """
+    Append the summaries of the encoding passes to a file in JSON lines format.
+
+    Arguments:
+        path: Name of the file to write.
+        records: List of dictionaries to write.
+    """
+    if not path or not records:
+        return
+    with open(path, "a") as sf:
+        for rec in records:
+            sf.write(json.dumps(rec) + "\n")
+    logging.info(f"wrote summary of {len(records)} passes to '{path}'.")
+
+
 def expectedtime(fn):
-    """Calculate the expected time for conversion.
+    """Calculate the expected time for conversion from the file size.
 
+    This is used when there is not enough encoding history for predict().
     Based on my machine, the average conversion speed is 75 kiB/s. The range is between
     60 kiB/s and 90 kiB/s.
 
@@ -279,5 +940,342 @@ def expectedtime(fn):
     )
 
 
+def historypath():
+    """Return the path of the encoding history file."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".encode-history.jsonl"
+
+
+def loadhistory(path=None):
+    """
+    Read the encoding history.
+
+    Arguments:
+        path: Optional path of the history file.
+
+    Returns:
+        A list of dictionaries, one for every recorded pass.
+    """
+    path = path or historypath()
+    rv = []
+    try:
+        with open(path) as hf:
+            for ln in hf:
+                try:
+                    rv.append(json.loads(ln))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+def learn(records, width, height, path=None):
+    """
+    Add the successful passes from the summary records to the encoding history.
+
+    Arguments:
+        records: List of pass summaries as produced by runpass.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        path: Optional path of the history file.
+    """
+    host = platform.node()
+    with open(path or historypath(), "a") as hf:
+        for rec in records:
+            if rec["returncode"] or not rec["length"]:
+                continue
+            sample = {
+                "host": host,
+                "width": int(width),
+                "height": int(height),
+                "length": rec["length"],
+                "codec": rec["codec"],
+                "pass": rec["pass"],
+                "preset": rec["preset"],
+                "threads": rec["threads"],
+                "seconds": rec["seconds"],
+            }
+            hf.write(json.dumps(sample) + "\n")
+
+
+def predict(history, width, height, length, codec, npass, preset, threads):
+    """
+    Predict the wall clock time of an encoding pass from the history.
+
+    The model assumes that the running time is proportional to the number of
+    pixels encoded, with a log-normally distributed proportionality factor.
+    It is fitted to the most specific group of matching samples that contains
+    at least two samples; first matching the host, codec, pass, preset and
+    number of threads, then dropping the number of threads and the host.
+
+    Arguments:
+        history: List of samples as returned by loadhistory.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        length: Length of the encoded video in seconds.
+        codec: Name of the video codec.
+        npass: Number of the pass.
+        preset: Speed preset as a string.
+        threads: Number of threads as a string.
+
+    Returns:
+        A 3-tuple of datetime.timedelta objects for the lower bound, the estimate
+        and the upper bound of an approximately 95% prediction interval, or None
+        when there is not enough history.
+    """
+    work = width * height * length / 1e6
+    if work <= 0:
+        return None
+    host = platform.node()
+    groups = [
+        lambda s: s["host"] == host and s["threads"] == str(threads),
+        lambda s: s["host"] == host,
+        lambda s: True,
+    ]
+    for match in groups:
+        logs = [
+            math.log(s["seconds"] / (s["width"] * s["height"] * s["length"] / 1e6))
+            for s in history
+            if s["codec"] == codec
+            and s["pass"] == npass
+            and s["preset"] == str(preset)
+            and s["seconds"] > 0
+            and match(s)
+        ]
+        if len(logs) >= 2:
+            break
+    else:
+        return None
+    mu, sd = statistics.mean(logs), statistics.stdev(logs)
+    spread = 1.96 * sd * math.sqrt(1 + 1 / len(logs))
+    return tuple(
+        timedelta(seconds=work * math.exp(mu + f)) for f in (-spread, 0, spread)
+    )
+
+
+def forecast(history, width, height, length, passargs):
+    """
+    Predict the duration of all passes of an encoding.
+
+    Arguments:
+        history: List of samples as returned by loadhistory.
+        width: Width of the encoded video in pixels.
+        height: Height of the encoded video in pixels.
+        length: Length of the encoded video in seconds.
+        passargs: List of the ffmpeg commands for the passes.
+
+    Returns:
+        A list of 3-tuples of datetime.timedelta objects, one for each pass, or
+        None when there is not enough history for one of the passes.
+    """
+    rv = []
+    for npass, args in enumerate(passargs, start=1):
+        p = predict(
+            history,
+            width,
+            height,
+            length,
+            argvalue(args, "-c:v"),
+            npass,
+            argvalue(args, "-speed"),
+            argvalue(args, "-threads"),
+        )
+        if p is None:
+            return None
+        rv.append(p)
+    return rv
+
+
+def ts2sec(ts):
+    """Convert a HH:MM:SS[.fff] time stamp to seconds."""
+    h, m, s = ts.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def sec2ts(secs):
+    """Convert seconds to a HH:MM:SS.fff time stamp."""
+    m, s = divmod(secs, 60)
+    h, m = divmod(int(m), 60)
+    return f"{h:02d}:{m:02d}:{s:06.3f}"
+
+
+def duration(fn):
+    """Return the duration of a media file in seconds."""
+    return float(probe(fn).get("format", {}).get("duration", ""))
+
+
+def keyframes(fn):
+    """
+    Find the keyframes in the first video stream of a file.
+
+    Only the packet headers are read; no frames are decoded.
+
+    Arguments:
+        fn: file path.
+
+    Returns:
+        A list of the times of the keyframes in seconds.
+    """
+    args = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries"]
+    args += ["packet=pts_time,flags", "-of", "csv=p=0", fn]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    rv = []
+    for ln in proc.stdout.splitlines():
+        try:
+            pts, flags = ln.split(",")[:2]
+            if flags.startswith("K"):
+                rv.append(float(pts))
+        except ValueError:
+            continue
+    return sorted(rv)
+
+
+def segments(keys, begin, end, n):
+    """
+    Divide the time span between begin and end into at most n segments,
+    all of which except the first start at a keyframe.
+
+    Arguments:
+        keys: sorted list of keyframe times in seconds.
+        begin: start of the span in seconds.
+        end: end of the span in seconds.
+        n: requested number of segments.
+
+    Returns:
+        A list of (start, length) tuples in seconds.
+    """
+    keys = [k for k in keys if begin < k < end]
+    bounds = [begin]
+    for j in range(1, n):
+        if not keys:
+            break
+        target = begin + j * (end - begin) / n
+        k = min(keys, key=lambda x: abs(x - target))
+        if k > bounds[-1]:
+            bounds.append(k)
+    bounds.append(end)
+    return [(a, b - a) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def encode_chunk(args1, args2, records=None):
+    """
+    Run both passes for a single segment.
+
+    Arguments:
+        args1: Commands to run the first encoding step as a subprocess.
+        args2: Commands to run the second encoding step as a subprocess.
+        records: Optional list to which the summaries of the passes are appended.
+
+    Returns:
+        A 2-tuple of the return code of the last pass that was run and the
+        running time as a datetime.timedelta.
+    """
+    start = datetime.utcnow()
+    total = spantime(args2)
+    rv, _ = firstpass(args1, total, 0, records)
+    if rv == 0:
+        rv, rec = runpass(args2, 2, total, 0)
+        if records is not None:
+            records.append(rec)
+    return rv, datetime.utcnow() - start
+
+
+def encode_segments(
+    fn, tc, n, start=None, dummy=False, records=None, profile=None, loudnorm=False
+):
+    """
+    Encode a file as n keyframe-aligned segments in parallel.
+
+    The video segments are encoded using both passes in a pool of workers.
+    The audio is encoded in a separate process at the same time. Afterwards
+    the segments and the audio are concatenated into the output file without
+    re-encoding.
+
+    Arguments:
+        fn: file path.
+        tc: number of tile columns.
+        n: requested number of segments.
+        start: Optional string containing the start time for the conversion.
+        dummy: Boolean to indicate that the commands should only be printed.
+        records: Optional list to which the summaries of the passes are appended.
+        profile: Optional dictionary of VP9 settings; see mkargs.
+        loudnorm: Boolean to indicate that the loudness of the audio should be
+            normalized. Since the audio is encoded in a single pass here, the
+            loudnorm filter is used in its dynamic mode.
+
+    Returns:
+        A 2-tuple of the original movie size in bytes and the encoded movie
+        size in bytes, or None for a dummy run.
+    """
+    begin = ts2sec(start) if start else 0.0
+    end = duration(fn)
+    chunks = segments(keyframes(fn), begin, end, n)
+    nworkers = min(len(chunks), os.cpu_count())
+    threads = max(1, os.cpu_count() // nworkers)
+    logging.info(f"encoding {len(chunks)} segments with {threads} threads each")
+    workdir = tempfile.mkdtemp(prefix="vid2webm-", dir=os.path.dirname(fn) or ".")
+    jobs = []
+    for idx, (cstart, clen) in enumerate(chunks):
+        base = os.path.join(workdir, f"seg{idx:04d}")
+        ca = dict(start=sec2ts(cstart), length=sec2ts(clen), threads=threads)
+        ca.update(outbase=base, audio=False, profile=profile)
+        jobs.append((mkargs(fn, 1, tc, **ca), mkargs(fn, 2, tc, **ca), base + ".webm"))
+    audioname = os.path.join(workdir, "audio.webm")
+    aargs = ["ffmpeg", "-loglevel", "quiet"]
+    if start:
+        aargs += ["-ss", start]
+    aargs += ["-i", fn, "-vn", "-sn", "-map", "0:a", "-c:a", "libvorbis"]
+    if loudnorm:
+        aargs += ["-filter:a:0", f"loudnorm={loudtarget}", "-ar:a:0", "48000"]
+    aargs += ["-q:a", "3", "-f", "webm", "-y", audioname]
+    listname = os.path.join(workdir, "segments.txt")
+    outname = outputname(fn)
+    cargs = ["ffmpeg", "-loglevel", "quiet", "-f", "concat", "-safe", "0"]
+    cargs += ["-i", listname, "-i", audioname, "-map", "0:v", "-map", "1:a?"]
+    cargs += ["-c", "copy", "-f", "webm", "-y", outname]
+    if dummy:
+        for idx, (a1, a2, _) in enumerate(jobs):
+            logging.info(f"segment {idx} first pass: " + " ".join(a1))
+            logging.info(f"segment {idx} second pass: " + " ".join(a2))
+        logging.info("audio: " + " ".join(aargs))
+        logging.info("concatenation: " + " ".join(cargs))
+        shutil.rmtree(workdir)
+        return None
+    origsize = os.path.getsize(fn)
+    try:
+        audio = sp.Popen(aargs, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        with cf.ThreadPoolExecutor(max_workers=nworkers) as tp:
+            fl = {
+                tp.submit(encode_chunk, a1, a2, records): idx
+                for idx, (a1, a2, _) in enumerate(jobs)
+            }
+            failed = False
+            for fut in cf.as_completed(fl):
+                rv, dt = fut.result()
+                if rv:
+                    logging.error(f"segment {fl[fut]} returned {rv}.")
+                    failed = True
+                else:
+                    logging.info(f"segment {fl[fut]} took {str(dt)[:-7]}.")
+        if audio.wait():
+            logging.error(f"audio encoding returned {audio.returncode}.")
+            failed = True
+        if failed:
+            return origsize, 0
+        with open(listname, "w") as lf:
+            for _, _, segname in jobs:
+                lf.write(f"file '{os.path.abspath(segname)}'\n")
+        proc = sp.run(cargs, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        if proc.returncode:
+            logging.error(f"concatenation returned {proc.returncode}.")
+            return origsize, 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    newsize = os.path.getsize(outname)
+    percentage = int(100 * newsize / origsize)
+    logging.info(f"the size of '{outname}' is {percentage}% of the size of '{fn}'.")
+    return origsize, newsize
+
+
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# file: vp9-bench.py
+# vim:fileencoding=utf-8:fdm=marker:ft=python
+#
+# Copyright © 2026 R.F. Smith <rsmith@xs4all.nl>.
+# SPDX-License-Identifier: MIT
+# Created: 2026-10-17T13:02:11+0200
+# Last modified: 2026-10-17T13:02:11+0200
+"""
+Benchmark VP9 encoder settings on a short clip of a video.
+
+A clip is cut from the video and stored losslessly. It is then encoded with
+every combination of the given speed presets, tile columns, thread counts and
+row based multithreading settings. For each combination the encoding speed of
+the second pass, the bitrate and the SSIM and PSNR compared to the clip are
+reported.
+
+The fastest combination whose SSIM is within the tolerance of the best SSIM is
+saved as the profile for the resolution class of the video. The profile is
+used by vid2webm.py and dvd2webm.py.
+"""
+
+from datetime import datetime
+import argparse
+import concurrent.futures as cf
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+
+__version__ = "2026.10.17"
+
+
+def main():
+    """
+    Entry point for vp9-bench.py.
+    """
+    args = setup()
+    info = videoinfo(args.fn)
+    width, height = int(info["width"]), int(info["height"])
+    cls = resclass(width, height)
+    logging.info(f"video is {width}x{height}; resolution class {cls}")
+    if args.tiles is None:
+        maxtc = tile_cols(width)
+        args.tiles = sorted(set(range(max(maxtc - 2, 0), maxtc + 1)))
+    matrix = [
+        {"speed": s, "tile-columns": t, "threads": n, "row-mt": r}
+        for s, t, n, r in itertools.product(
+            args.speeds, args.tiles, args.threads, args.rowmt
+        )
+    ]
+    logging.info(f"benchmarking {len(matrix)} combinations")
+    workdir = tempfile.mkdtemp(prefix="vp9-bench-", dir=os.curdir)
+    try:
+        clip = os.path.join(workdir, "clip.mkv")
+        start = args.start
+        if start is None:
+            start = max(float(probe(args.fn)["format"]["duration"]) / 2, 0)
+        if not cutclip(args.fn, clip, start, args.length):
+            logging.error("cutting the clip failed")
+            sys.exit(1)
+        results = benchmark(clip, matrix, workdir, args.cores)
+        with cf.ThreadPoolExecutor(max_workers=os.cpu_count()) as tp:
+            quality = tp.map(
+                metrics, [r["output"] for r in results], [clip] * len(results)
+            )
+            for r, (ssim, psnr) in zip(results, quality):
+                r["ssim"], r["psnr"] = ssim, psnr
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results = [r for r in results if r["fps"] and r["ssim"]]
+    if not results:
+        logging.error("no combination was encoded succesfully")
+        sys.exit(1)
+    print("speed tiles threads row-mt     fps  kbit/s   SSIM    PSNR")
+    for r in sorted(results, key=lambda r: -r["fps"]):
+        print(
+            f"{r['speed']:5d} {r['tile-columns']:5d} {r['threads']:7d} "
+            f"{r['row-mt']:6d} {r['fps']:7.2f} {r['kbps']:7.0f} "
+            f"{r['ssim']:.4f} {r['psnr']:7.2f}"
+        )
+    best = choose(results, args.tolerance)
+    settings = {k: best[k] for k in ("speed", "tile-columns", "threads", "row-mt")}
+    logging.info(f"best settings for {cls}: {settings}")
+    if not args.dummy:
+        profile = loadprofile(args.profile)
+        profile[cls] = settings
+        with open(args.profile, "w") as pf:
+            json.dump(profile, pf, indent=2)
+        logging.info(f"saved profile in '{args.profile}'")
+
+
+def setup():
+    """Process command-line arguments and configure the program."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--log",
+        default="info",
+        choices=["debug", "info", "warning", "error"],
+        help="logging level (defaults to 'info')",
+    )
+    parser.add_argument("-v", "--version", action="version", version=__version__)
+    parser.add_argument(
+        "-s",
+        "--start",
+        type=float,
+        default=None,
+        help="second at which the clip starts (default: middle of the video)",
+    )
+    parser.add_argument(
+        "-l",
+        "--length",
+        type=float,
+        default=20,
+        help="length of the clip in seconds (default 20)",
+    )
+    parser.add_argument(
+        "--speeds",
+        type=intlist,
+        default=[1, 2, 3],
+        help="comma separated speed presets for the second pass (default 1,2,3)",
+    )
+    parser.add_argument(
+        "--tiles",
+        type=intlist,
+        default=None,
+        help="comma separated tile column counts (default: based on the width)",
+    )
+    threads = sorted({max(os.cpu_count() // d, 1) for d in (1, 2, 4)})
+    parser.add_argument(
+        "--threads",
+        type=intlist,
+        default=threads,
+        help="comma separated thread counts (default "
+        + ",".join(str(t) for t in threads)
+        + ")",
+    )
+    parser.add_argument(
+        "--rowmt",
+        type=intlist,
+        default=[0, 1],
+        help="comma separated row based multithreading settings (default 0,1)",
+    )
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=os.cpu_count(),
+        help=f"number of cores to use for all encoders (default {os.cpu_count()})",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.002,
+        help="allowed loss of SSIM relative to the best combination (default 0.002)",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        default=profilepath(),
+        help=f"profile file to update (default '{profilepath()}')",
+    )
+    parser.add_argument(
+        "-d", "--dummy", action="store_true", help="do not save the profile"
+    )
+    parser.add_argument("fn", metavar="filename", help="video file to benchmark")
+    args = parser.parse_args(sys.argv[1:])
+    logging.basicConfig(
+        level=getattr(logging, args.log.upper(), None),
+        format="%(levelname)s: %(message)s",
+    )
+    logging.debug(f"command line arguments = {sys.argv}")
+    logging.debug(f"parsed arguments = {args}")
+    for prog in ("ffmpeg", "ffprobe"):
+        if shutil.which(prog) is None:
+            logging.error(f"the program “{prog}” cannot be found")
+            sys.exit(1)
+    return args
+
+
+def intlist(s):
+    """Convert a comma separated string to a list of integers."""
+    return [int(j) for j in s.split(",")]
+
+
+def profilepath():
+    """Return the path of the file with the VP9 settings per resolution class."""
+    return os.environ.get("HOME", os.curdir) + os.sep + ".vp9-profile.json"
+
+
+def loadprofile(path):
+    """Read the profile; returns an empty dictionary if there is none."""
+    try:
+        with open(path) as pf:
+            return json.load(pf)
+    except (OSError, ValueError):
+        return {}
+
+
+def resclass(width, height):
+    """Return the name of the resolution class of a video."""
+    for name, w, h in (("sd", 1024, 576), ("720p", 1280, 720), ("1080p", 1920, 1088)):
+        if width <= w and height <= h:
+            return name
+    return "uhd"
+
+
+def tile_cols(width):
+    """Calculate the maximum useful amount of tile columns for a given width."""
+    return math.floor(math.log2(math.ceil(float(width) / 64.0)))
+
+
+def probe(path):
+    """Retrieve the stream and format information of a media file with ffprobe."""
+    args = ["ffprobe", "-v", "error", "-show_streams", "-show_format"]
+    args += ["-of", "json", path]
+    proc = sp.run(args, text=True, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    return json.loads(proc.stdout)
+
+
+def videoinfo(path):
+    """Retrieve the properties of the first video stream of a file."""
+    for stream in probe(path).get("streams", []):
+        if stream.get("codec_type") == "video":
+            return stream
+    return {}
+
+
+def cutclip(fn, clip, start, length):
+    """
+    Store a clip of the first video stream of a file losslessly.
+
+    Arguments:
+        fn: path of the video.
+        clip: path of the clip to write.
+        start: second at which the clip starts.
+        length: length of the clip in seconds.
+
+    Returns:
+        True if succesful, False otherwise.
+    """
+    args = ["ffmpeg", "-loglevel", "quiet", "-ss", f"{start:.3f}", "-t", str(length)]
+    args += ["-i", fn, "-map", "0:v:0", "-an", "-sn", "-c:v", "ffv1", "-y", clip]
+    logging.info(f"cutting {length} s clip at {start:.1f} s")
+    return sp.run(args, stdout=sp.DEVNULL, stderr=sp.DEVNULL).returncode == 0
+
+
+def mkargs(clip, npass, settings, base):
+    """
+    Create the argument list to encode the clip with the given settings.
+
+    The rate settings are the same as used in vid2webm.py and dvd2webm.py.
+
+    Arguments:
+        clip: path of the clip.
+        npass: number of the pass.
+        settings: dictionary with speed, tile-columns, threads and row-mt.
+        base: path (without extension) for the pass log and output file.
+
+    Returns:
+        A list of strings suitable for calling a subprocess.
+    """
+    speed = 4 if npass == 1 else settings["speed"]
+    args = ["ffmpeg", "-nostats", "-loglevel", "quiet", "-progress", "pipe:1"]
+    args += ["-i", clip, "-passlogfile", base, "-c:v", "libvpx-vp9"]
+    args += ["-row-mt", str(settings["row-mt"]), "-threads", str(settings["threads"])]
+    args += ["-pass", str(npass), "-b:v", "1400k", "-crf", "33", "-g", "250"]
+    args += ["-speed", str(speed), "-tile-columns", str(settings["tile-columns"])]
+    if npass == 2:
+        args += ["-auto-alt-ref", "1", "-lag-in-frames", "25"]
+    args += ["-an", "-f", "webm", "-y"]
+    args.append("/dev/null" if npass == 1 else base + ".webm")
+    return args
+
+
+def encode(clip, settings, base):
+    """
+    Encode the clip in two passes with the given settings.
+
+    Arguments:
+        clip: path of the clip.
+        settings: dictionary with speed, tile-columns, threads and row-mt.
+        base: path (without extension) for the pass log and output file.
+
+    Returns:
+        A copy of settings, extended with the path of the output, the frame rate
+        of the second pass and the bitrate of the output.
+    """
+    rv = dict(settings, output=base + ".webm", fps=0.0, kbps=0.0)
+    proc = sp.run(mkargs(clip, 1, settings, base), stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    if proc.returncode:
+        return rv
+    start = datetime.now()
+    proc = sp.run(
+        mkargs(clip, 2, settings, base), text=True, stdout=sp.PIPE, stderr=sp.DEVNULL
+    )
+    seconds = (datetime.now() - start).total_seconds()
+    if proc.returncode:
+        return rv
+    frames = re.findall(r"^frame=(\d+)", proc.stdout, re.MULTILINE)
+    outtime = re.findall(r"^out_time_us=(\d+)", proc.stdout, re.MULTILINE)
+    if frames and seconds:
+        rv["fps"] = int(frames[-1]) / seconds
+    if outtime and int(outtime[-1]):
+        rv["kbps"] = os.path.getsize(rv["output"]) * 8e3 / int(outtime[-1])
+    logging.info(f"{settings}: {rv['fps']:.2f} fps")
+    return rv
+
+
+def benchmark(clip, matrix, workdir, cores):
+    """
+    Encode the clip with all settings in the matrix.
+
+    Encoders run in parallel as long as their combined number of threads
+    fits within the number of cores, so they do not slow each other down.
+
+    Arguments:
+        clip: path of the clip.
+        matrix: list of settings dictionaries.
+        workdir: directory for the pass logs and outputs.
+        cores: number of cores to use.
+
+    Returns:
+        A list of the results from encode, in the order of the matrix.
+    """
+    pending = list(enumerate(matrix))
+    running = {}
+    results = [None] * len(matrix)
+    free = cores
+    with cf.ThreadPoolExecutor(max_workers=max(cores, 1)) as tp:
+        while pending or running:
+            while pending and (not running or pending[0][1]["threads"] <= free):
+                idx, settings = pending.pop(0)
+                base = os.path.join(workdir, f"enc{idx:03d}")
+                running[tp.submit(encode, clip, settings, base)] = idx
+                free -= settings["threads"]
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                idx = running.pop(fut)
+                free += matrix[idx]["threads"]
+                results[idx] = fut.result()
+    return results
+
+
+def metrics(output, clip):
+    """
+    Compare an encoded clip to the original.
+
+    Arguments:
+        output: path of the encoded clip.
+        clip: path of the original clip.
+
+    Returns:
+        A 2-tuple of the SSIM and the PSNR in dB, or (None, None) on failure.
+    """
+    if not os.path.exists(output):
+        return None, None
+    lavfi = "[0:v]split[a0][a1];[1:v]split[b0][b1];[a0][b0]ssim;[a1][b1]psnr"
+    args = ["ffmpeg", "-hide_banner", "-nostats", "-i", output, "-i", clip]
+    args += ["-lavfi", lavfi, "-f", "null", "-"]
+    proc = sp.run(args, text=True, stdout=sp.DEVNULL, stderr=sp.PIPE)
+    ssim = re.search(r"SSIM .*All:([\d.]+)", proc.stderr)
+    psnr = re.search(r"PSNR .*average:([\d.]+|inf)", proc.stderr)
+    if not ssim or not psnr:
+        return None, None
+    return float(ssim.group(1)), float(psnr.group(1))
+
+
+def choose(results, tolerance):
+    """
+    Choose the fastest result whose SSIM is within tolerance of the best SSIM.
+
+    Arguments:
+        results: list of result dictionaries with “fps” and “ssim” keys.
+        tolerance: allowed loss of SSIM.
+
+    Returns:
+        The chosen result dictionary.
+    """
+    best = max(r["ssim"] for r in results)
+    good = [r for r in results if r["ssim"] >= best - tolerance]
+    return max(good, key=lambda r: r["fps"])
+
+
+if __name__ == "__main__":
+    main()